@@ -115,6 +115,8 @@ for feature, value in ENV_TOKENS.get('MITX_FEATURES', {}).items():
 # load segment.io key, provide a dummy if it does not exist
 SEGMENT_IO_KEY = ENV_TOKENS.get('SEGMENT_IO_KEY', '***REMOVED***')
 
+TRACKING_SEGMENT_DIR = ENV_TOKENS.get("TRACKING_SEGMENT_DIR", TRACKING_SEGMENT_DIR)
+
 LOGGING = get_logger_config(LOG_DIR,
                             logging_env=ENV_TOKENS['LOGGING_ENV'],
                             syslog_addr=(ENV_TOKENS['SYSLOG_SERVER'], 514),
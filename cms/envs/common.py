@@ -194,6 +194,25 @@ LOCALE_PATHS = (REPO_ROOT + '/conf/locale',)  # mitx/conf/locale/
 # Tracking
 TRACK_MAX_EVENT = 10000
 
+# Tracking events are written out in batches by a background thread (see track.writer)
+TRACKING_WRITER = {
+    'BUFFER_SIZE': 10000,       # events held at most; more are dropped
+    'BATCH_SIZE': 500,          # events written at once
+    'FLUSH_INTERVAL': 1.0,      # seconds an event waits at most before it's written
+    'PUT_TIMEOUT': 0,           # seconds a request waits for room in a full buffer
+    'ASYNC': True,
+}
+
+# Directory to write tracking events to as compressed, time-partitioned
+# segment files (see track.segments), or None not to
+TRACKING_SEGMENT_DIR = None
+TRACKING_SEGMENT_PERIOD = '%Y%m%d%H'    # one segment per hour per process
+
+# Static content (c4x assets) bigger than this many bytes isn't put in the
+# cache (memcached's items are limited to 1MB), but streamed from the
+# contentstore every time it's requested
+STATIC_CONTENT_MAX_CACHED_SIZE = 1000 * 1000
+
 # Messages
 MESSAGE_STORAGE = 'django.contrib.messages.storage.session.SessionStorage'
 
@@ -1,6 +1,8 @@
 import logging
+import re
 import time
 
+from django.conf import settings
 from django.http import HttpResponse, Http404, HttpResponseNotModified
 
 from xmodule.contentstore.django import contentstore
@@ -9,6 +11,57 @@ from xmodule.modulestore import InvalidLocationError
 from cache_toolbox.core import get_cached_content, set_cached_content
 from xmodule.exceptions import NotFoundError
 
+# a single byte range, e.g. 'bytes=0-499', 'bytes=500-' or 'bytes=-500'
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class UnsatisfiableRange(Exception):
+    pass
+
+
+def parse_range(header, length):
+    """
+    Return the (first, last) bytes (inclusive) of content of `length` bytes
+    that the Range `header` asks for, or None if the header should be
+    ignored: it's malformed, or asks for several ranges, which aren't
+    supported (so the whole content is sent, as HTTP allows).
+
+    Raises UnsatisfiableRange if the range is entirely past the end of the
+    content.
+    """
+    match = RANGE_RE.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+
+    if not first:
+        # the last `last` bytes
+        suffix_length = int(last)
+        if suffix_length == 0 or length == 0:
+            raise UnsatisfiableRange()
+        return max(length - suffix_length, 0), length - 1
+
+    first = int(first)
+    last = length - 1 if not last else min(int(last), length - 1)
+    if first > last:
+        if first >= length:
+            raise UnsatisfiableRange()
+        # last is before first: the header is invalid
+        return None
+    return first, last
+
+
+def etag_matches(header, etag):
+    """
+    Return whether the If-None-Match or If-Range `header` lists `etag`
+    """
+    if etag is None:
+        return False
+    etags = [tag.strip() for tag in header.split(',')]
+    return '*' in etags or etag in etags
+
 
 class StaticContentServer(object):
     def process_request(self, request):
@@ -20,21 +73,24 @@ class StaticContentServer(object):
                 # return a 'Bad Request' to browser as we have a malformed Location
                 response = HttpResponse()
                 response.status_code = 400
-                return response     
+                return response
 
             # first look in our cache so we don't have to round-trip to the DB
             content = get_cached_content(loc)
             if content is None:
-                # nope, not in cache, let's fetch from DB
+                # nope, not in cache, let's fetch from DB (without reading the data yet)
                 try:
-                    content = contentstore().find(loc)
+                    content = contentstore().find(loc, as_stream=True)
                 except NotFoundError:
                     response = HttpResponse()
                     response.status_code = 404
                     return response
 
-                # since we fetched it from DB, let's cache it going forward
-                set_cached_content(content)
+                # since we fetched it from DB, let's cache it going forward, unless it's
+                # too big for the cache: that is streamed from the DB every time
+                if content.length <= settings.STATIC_CONTENT_MAX_CACHED_SIZE:
+                    content = content.copy_to_in_mem()
+                    set_cached_content(content)
             else:
                 # @todo: we probably want to have 'cache hit' counters so we can
                 # measure the efficacy of our caches
@@ -45,15 +101,49 @@ class StaticContentServer(object):
             # convert over the DB persistent last modified timestamp to a HTTP compatible
             # timestamp, so we can simply compare the strings
             last_modified_at_str = content.last_modified_at.strftime("%a, %d-%b-%Y %H:%M:%S GMT")
+            etag = '"{0}"'.format(content.content_digest) if content.content_digest else None
 
             # see if the client has cached this content, if so then compare the
-            # timestamps, if they are the same then just return a 304 (Not Modified)
-            if 'HTTP_IF_MODIFIED_SINCE' in request.META:
+            # ETags (or if we can't, the timestamps), if they are the same then
+            # just return a 304 (Not Modified)
+            if 'HTTP_IF_NONE_MATCH' in request.META and etag is not None:
+                if etag_matches(request.META['HTTP_IF_NONE_MATCH'], etag):
+                    content.close()
+                    return HttpResponseNotModified()
+            elif 'HTTP_IF_MODIFIED_SINCE' in request.META:
                 if_modified_since = request.META['HTTP_IF_MODIFIED_SINCE']
                 if if_modified_since == last_modified_at_str:
+                    content.close()
                     return HttpResponseNotModified()
 
-            response = HttpResponse(content.data, content_type=content.content_type)
+            # Only send part of the content if asked to, and (with If-Range) only if
+            # the client has the same version of the rest of it
+            byte_range = None
+            if_range = request.META.get('HTTP_IF_RANGE')
+            if 'HTTP_RANGE' in request.META and (
+                    if_range is None or if_range == last_modified_at_str or etag_matches(if_range, etag)):
+                try:
+                    byte_range = parse_range(request.META['HTTP_RANGE'], content.length)
+                except UnsatisfiableRange:
+                    content.close()
+                    response = HttpResponse()
+                    response.status_code = 416
+                    response['Content-Range'] = 'bytes */{0}'.format(content.length)
+                    return response
+
+            if byte_range is None:
+                first, last = 0, content.length - 1
+                response = HttpResponse(content.stream_data(), content_type=content.content_type)
+            else:
+                first, last = byte_range
+                response = HttpResponse(content.stream_data(first, last), content_type=content.content_type)
+                response.status_code = 206
+                response['Content-Range'] = 'bytes {0}-{1}/{2}'.format(first, last, content.length)
+
+            response['Content-Length'] = str(last - first + 1)
+            response['Accept-Ranges'] = 'bytes'
             response['Last-Modified'] = last_modified_at_str
+            if etag is not None:
+                response['ETag'] = etag
 
             return response
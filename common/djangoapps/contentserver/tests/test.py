@@ -0,0 +1,177 @@
+"""
+Tests of serving static content (c4x assets) by StaticContentServer
+"""
+import hashlib
+import resource
+from uuid import uuid4
+
+from django.test import TestCase
+from django.test.utils import override_settings
+
+import xmodule.contentstore.django
+from cache_toolbox.core import get_cached_content, del_cached_content
+from contentserver.middleware import parse_range, UnsatisfiableRange
+from xmodule.contentstore.content import StaticContent
+from xmodule.contentstore.django import contentstore
+
+TEST_DATA_CONTENTSTORE = {
+    'ENGINE': 'xmodule.contentstore.mongo.MongoContentStore',
+    'OPTIONS': {
+        'host': 'localhost',
+        'db': 'test_xcontent_{0}'.format(uuid4().hex),
+    }
+}
+
+MB = 1024 * 1024
+
+
+class ParseRangeTest(TestCase):
+    def test_ranges(self):
+        self.assertEqual(parse_range('bytes=0-499', 1000), (0, 499))
+        self.assertEqual(parse_range('bytes=500-', 1000), (500, 999))
+        self.assertEqual(parse_range('bytes=-300', 1000), (700, 999))
+        self.assertEqual(parse_range('bytes=-3000', 1000), (0, 999))
+        self.assertEqual(parse_range('bytes=900-5000', 1000), (900, 999))
+
+    def test_ignored(self):
+        for header in ('bytes=0-1,5-6', 'bytes=5-2', 'bytes=-', 'items=0-1', 'nonsense'):
+            self.assertIsNone(parse_range(header, 1000), header)
+
+    def test_unsatisfiable(self):
+        for header in ('bytes=1000-', 'bytes=2000-3000', 'bytes=-0'):
+            with self.assertRaises(UnsatisfiableRange):
+                parse_range(header, 1000)
+
+
+@override_settings(CONTENTSTORE=TEST_DATA_CONTENTSTORE, STATIC_CONTENT_MAX_CACHED_SIZE=MB)
+class StaticContentServerTest(TestCase):
+    def setUp(self):
+        xmodule.contentstore.django._CONTENTSTORE = None
+        self.store = contentstore()
+
+        self.small_data = ''.join(chr(n % 256) for n in xrange(10000))
+        self.small = self.save('small.pdf', [self.small_data])
+        # 2MB, in chunks that don't line up with the GridFS ones
+        self.big_chunks = [chr(n) * 100000 for n in xrange(21)]
+        self.big = self.save('big.pdf', self.big_chunks)
+
+    def tearDown(self):
+        for location in (self.small, self.big):
+            del_cached_content(location)
+        self.store.fs_files.database.connection.drop_database(TEST_DATA_CONTENTSTORE['OPTIONS']['db'])
+        xmodule.contentstore.django._CONTENTSTORE = None
+
+    def save(self, name, chunks):
+        """
+        Store an asset with the data in chunks, without holding all of it in
+        memory, and return its location
+        """
+        location = StaticContent.compute_location('edX', 'toy', name)
+        content = StaticContent(location, name, 'application/pdf', None)
+        with self.store.fs.new_file(_id=content.get_id(), filename=content.get_url_path(),
+                                    content_type=content.content_type, displayname=content.name,
+                                    thumbnail_location=None, import_path=None) as fp:
+            for chunk in chunks:
+                fp.write(chunk)
+        return location
+
+    def get(self, location, **headers):
+        return self.client.get(StaticContent.get_url_path_from_location(location), **headers)
+
+    def test_small_content_cached(self):
+        response = self.get(self.small)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(''.join(response), self.small_data)
+        self.assertEqual(response['Content-Length'], '10000')
+        self.assertEqual(response['ETag'], '"{0}"'.format(hashlib.md5(self.small_data).hexdigest()))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+        self.assertEqual(get_cached_content(self.small).data, self.small_data)
+        # and served from the cache the next time
+        response = self.get(self.small)
+        self.assertEqual(''.join(response), self.small_data)
+
+    def test_big_content_streamed(self):
+        response = self.get(self.big)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Length'], str(21 * 100000))
+        chunks = list(response)
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(''.join(chunks), ''.join(self.big_chunks))
+        self.assertIsNone(get_cached_content(self.big))
+
+    def test_range(self):
+        for location, data in ((self.small, self.small_data), (self.big, ''.join(self.big_chunks))):
+            response = self.get(location, HTTP_RANGE='bytes=1000-8999')
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(response['Content-Range'], 'bytes 1000-8999/{0}'.format(len(data)))
+            self.assertEqual(response['Content-Length'], '8000')
+            self.assertEqual(''.join(response), data[1000:9000])
+
+            response = self.get(location, HTTP_RANGE='bytes=-10')
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(response['Content-Length'], '10')
+            self.assertEqual(''.join(response), data[-10:])
+
+    def test_range_across_chunks(self):
+        data = ''.join(self.big_chunks)
+        response = self.get(self.big, HTTP_RANGE='bytes=99990-900009')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 99990-900009/2100000')
+        self.assertEqual(''.join(response), data[99990:900010])
+
+    def test_unsatisfiable_range(self):
+        response = self.get(self.big, HTTP_RANGE='bytes=3000000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */2100000')
+
+    def test_if_range(self):
+        etag = self.get(self.big)['ETag']
+        response = self.get(self.big, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        response = self.get(self.big, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Length'], '2100000')
+
+    def test_conditional_get(self):
+        for location in (self.small, self.big):
+            response = self.get(location)
+            etag, last_modified = response['ETag'], response['Last-Modified']
+            self.assertEqual(self.get(location, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            self.assertEqual(self.get(location, HTTP_IF_NONE_MATCH='"other", ' + etag).status_code, 304)
+            self.assertEqual(self.get(location, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+            # the ETag wins over the timestamp
+            self.assertEqual(self.get(location, HTTP_IF_NONE_MATCH='"other"',
+                                      HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+            self.assertEqual(self.get(location, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+    def test_streaming_memory(self):
+        # 300MB, made of 1MB chunks
+        size = 300
+        chunk = ''.join(chr(n % 256) for n in xrange(MB))
+        location = self.save('huge.mp4', (chunk for _ in xrange(size)))
+        self.addCleanup(del_cached_content, location)
+
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        response = self.get(location)
+        received = 0
+        for data in response:
+            received += len(data)
+        response.close()
+        grown = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+
+        self.assertEqual(received, size * MB)
+        self.assertEqual(response['Content-Length'], str(size * MB))
+        # ru_maxrss is in kilobytes: nowhere near the size of the asset was held at once
+        self.assertLess(grown * 1024, 50 * MB)
+
+    def test_range_of_huge_content(self):
+        chunk = 'x' * MB
+        location = self.save('huge.mp4', (chunk for _ in xrange(300)))
+        self.addCleanup(del_cached_content, location)
+
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        response = self.get(location, HTTP_RANGE='bytes={0}-{1}'.format(250 * MB, 250 * MB + 9))
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(''.join(response), 'x' * 10)
+        self.assertLess((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before) * 1024, 10 * MB)
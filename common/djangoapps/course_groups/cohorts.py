@@ -4,12 +4,18 @@ forums, and to the cohort admin views.
 """
 
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
 from django.http import Http404
 import logging
 import random
+import time
 
 from courseware import courses
 from student.models import get_user_by_username_or_email
+from xmodule.course_module import CourseDescriptor
+from xmodule.modulestore.django import modulestore
 from .models import CourseUserGroup
 
 log = logging.getLogger(__name__)
@@ -33,6 +39,162 @@ def local_random():
 
     return _local_random
 
+# How long the generation counters that invalidate cohort directories are kept
+GENERATION_TIMEOUT = 24 * 60 * 60
+
+# The number of users whose cohort a CohortDirectory remembers
+MAX_CACHED_USERS = 10000
+
+# The CohortDirectory of each course, by course_id
+_DIRECTORIES = {}
+
+
+class CohortDirectory(object):
+    """
+    The cohort settings of a course and its cohorts, shared by all requests
+    in this process until the course or its cohorts change: the course, the
+    names of the cohorts by id, and the cohorts of the users looked up so far.
+
+    Use get_cohort_directory to get one.
+    """
+    def __init__(self, store, course_id, version):
+        self.store = store
+        self.course_id = course_id
+        self.version = version
+        # raises Http404 if the course doesn't exist
+        self.course = courses.get_course_by_id(course_id)
+        self.generation = None
+        self.names = {}
+        self._user_cohort_ids = {}
+
+    def load_cohorts(self, generation):
+        """
+        (Re)load the cohorts of the course, and forget the users' cohorts
+        """
+        names = dict(CourseUserGroup.objects.filter(
+            course_id=self.course_id,
+            group_type=CourseUserGroup.COHORT,
+        ).values_list('id', 'name'))
+        self.names, self._user_cohort_ids, self.generation = names, {}, generation
+
+    def cohort_name(self, cohort_id):
+        """
+        Return the name of the cohort with id cohort_id.  Raises
+        CourseUserGroup.DoesNotExist if there isn't one in the course.
+        """
+        try:
+            return self.names[int(cohort_id)]
+        except KeyError:
+            raise CourseUserGroup.DoesNotExist("No cohort {0} in {1}".format(cohort_id, self.course_id))
+
+    def cohort_names(self, cohort_ids):
+        """
+        Return a dict of the names of the cohorts with the given ids, by id.
+        Raises CourseUserGroup.DoesNotExist if any isn't in the course.
+        """
+        return dict((cohort_id, self.cohort_name(cohort_id)) for cohort_id in cohort_ids)
+
+    def user_cohort_ids(self, user_ids):
+        """
+        Return a dict of the id of the cohort each of the users with ids
+        user_ids is in (or None), by user id.  The users not looked up
+        before are looked up in one query.  Doesn't check whether the course
+        is cohorted, or auto-cohort anyone.
+        """
+        user_ids = set(user_ids)
+        missing = user_ids.difference(self._user_cohort_ids)
+        if missing:
+            if len(self._user_cohort_ids) + len(missing) > MAX_CACHED_USERS:
+                self._user_cohort_ids = {}
+            found = dict((user_id, None) for user_id in missing)
+            found.update(CourseUserGroup.users.through.objects.filter(
+                courseusergroup__course_id=self.course_id,
+                courseusergroup__group_type=CourseUserGroup.COHORT,
+                user__in=missing,
+            ).values_list('user_id', 'courseusergroup_id'))
+            self._user_cohort_ids.update(found)
+        return dict((user_id, self._user_cohort_ids[user_id]) for user_id in user_ids)
+
+    def user_cohort_id(self, user_id):
+        """
+        Return the id of the cohort the user with id user_id is in, or None
+        """
+        return self.user_cohort_ids([user_id])[user_id]
+
+
+def _generation_key(course_id):
+    return 'cohorts.generation.{0}'.format(course_id)
+
+
+def _course_version(store, course_id):
+    """
+    Return the edit version of the course, or None if the modulestore doesn't
+    keep versions (e.g. XML courses, which don't change while running)
+    """
+    get_course_version = getattr(store, 'get_course_version', None)
+    if get_course_version is None:
+        return None
+    return get_course_version(CourseDescriptor.id_to_location(course_id))
+
+
+def get_cohort_directory(course_id):
+    """
+    Return the CohortDirectory of the course, reloading the course if it has
+    been edited, and its cohorts if they have changed, since they were
+    loaded.  Costs a cache lookup (and an edit version lookup, for courses in
+    mongo) per call.
+
+    Raises:
+       Http404 if the course doesn't exist.
+    """
+    store = modulestore()
+    version = _course_version(store, course_id)
+    directory = _DIRECTORIES.get(course_id)
+    if directory is None or directory.store is not store or directory.version != version:
+        directory = _DIRECTORIES[course_id] = CohortDirectory(store, course_id, version)
+
+    generation = cache.get(_generation_key(course_id), 0)
+    if directory.generation != generation:
+        directory.load_cohorts(generation)
+    return directory
+
+
+def invalidate_cohort_directories(course_ids):
+    """
+    Make every process reload the cohorts of the given courses
+    """
+    for course_id in course_ids:
+        key = _generation_key(course_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # nothing has changed since the generation expired (or it was
+            # evicted): start from a value no directory can have been loaded
+            # at, since incr doesn't keep the key from expiring
+            cache.set(key, int(time.time() * 1000), GENERATION_TIMEOUT)
+
+
+@receiver(post_save, sender=CourseUserGroup)
+@receiver(post_delete, sender=CourseUserGroup)
+def _cohort_changed(sender, instance, **kwargs):
+    invalidate_cohort_directories([instance.course_id])
+
+
+@receiver(m2m_changed, sender=CourseUserGroup.users.through)
+def _cohort_users_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        # instance is the CourseUserGroup
+        course_ids = [instance.course_id]
+    elif pk_set is None:
+        # all of the user's groups are being cleared
+        course_ids = instance.course_groups.values_list('course_id', flat=True)
+    else:
+        course_ids = CourseUserGroup.objects.filter(pk__in=pk_set).values_list('course_id', flat=True)
+    invalidate_cohort_directories(set(course_ids))
+
+
 def is_course_cohorted(course_id):
     """
     Given a course id, return a boolean for whether or not the course is
@@ -41,16 +203,30 @@ def is_course_cohorted(course_id):
     Raises:
        Http404 if the course doesn't exist.
     """
-    return courses.get_course_by_id(course_id).is_cohorted
+    return get_cohort_directory(course_id).course.is_cohorted
 
 
 def get_cohort_id(user, course_id):
     """
     Given a course id and a user, return the id of the cohort that user is
     assigned to in that course.  If they don't have a cohort, return None.
+
+    Unlike get_cohort, this only goes to the database the first time the
+    user is looked up (or when they need to be auto-cohorted).
     """
-    cohort = get_cohort(user, course_id)
-    return None if cohort is None else cohort.id
+    try:
+        directory = get_cohort_directory(course_id)
+    except Http404:
+        raise ValueError("Invalid course_id")
+
+    if not directory.course.is_cohorted:
+        return None
+
+    cohort_id = directory.user_cohort_id(user.id)
+    if cohort_id is None and directory.course.auto_cohort:
+        cohort = get_cohort(user, course_id)
+        return None if cohort is None else cohort.id
+    return cohort_id
 
 
 def is_commentable_cohorted(course_id, commentable_id):
@@ -65,7 +241,7 @@ def is_commentable_cohorted(course_id, commentable_id):
     Raises:
         Http404 if the course doesn't exist.
     """
-    course = courses.get_course_by_id(course_id)
+    course = get_cohort_directory(course_id).course
 
     if not course.is_cohorted:
         # this is the easy case :)
@@ -89,7 +265,7 @@ def get_cohorted_commentables(course_id):
     Given a course_id return a list of strings representing cohorted commentables
     """
 
-    course = courses.get_course_by_id(course_id)
+    course = get_cohort_directory(course_id).course
 
     if not course.is_cohorted:
         # this is the easy case :)
@@ -119,7 +295,7 @@ def get_cohort(user, course_id):
     # First check whether the course is cohorted (users shouldn't be in a cohort
     # in non-cohorted courses, but settings can change after course starts)
     try:
-        course = courses.get_course_by_id(course_id)
+        course = get_cohort_directory(course_id).course
     except Http404:
         raise ValueError("Invalid course_id")
 
@@ -1,12 +1,17 @@
 import django.test
 from django.contrib.auth.models import User
 from django.conf import settings
+from django.core.cache import cache
 
 from django.test.utils import override_settings
 
+from mock import patch
+
+from course_groups import cohorts
 from course_groups.models import CourseUserGroup
-from course_groups.cohorts import (get_cohort, get_course_cohorts,
-                                   is_commentable_cohorted, get_cohort_by_name)
+from course_groups.cohorts import (get_cohort, get_cohort_id, get_course_cohorts,
+                                   is_commentable_cohorted, get_cohort_by_name,
+                                   get_cohort_directory, add_cohort, add_user_to_cohort)
 
 from xmodule.modulestore.django import modulestore, _MODULESTORES
 
@@ -274,3 +279,69 @@ class TestCohorts(django.test.TestCase):
         self.assertTrue(
             is_commentable_cohorted(course.id, to_id("Feedback")),
             "Feedback was listed as cohorted.  Should be.")
+
+    def test_cohort_directory(self):
+        course = modulestore().get_course("edX/toy/2012_Fall")
+        self.config_course_cohorts(course, [], cohorted=True)
+        user = User.objects.create(username="test", email="a@b.com")
+        other_user = User.objects.create(username="test2", email="a2@b.com")
+
+        cohort = add_cohort(course.id, "TestCohort")
+        add_user_to_cohort(cohort, "test")
+
+        directory = get_cohort_directory(course.id)
+        self.assertEqual(directory.cohort_names([cohort.id]), {cohort.id: "TestCohort"})
+        self.assertEqual(directory.cohort_name(str(cohort.id)), "TestCohort")
+        with self.assertRaises(CourseUserGroup.DoesNotExist):
+            directory.cohort_name(cohort.id + 1)
+        self.assertEqual(directory.user_cohort_ids([user.id, other_user.id]),
+                         {user.id: cohort.id, other_user.id: None})
+
+        # Looked up users aren't looked up again, and the course isn't reloaded
+        with self.assertNumQueries(0):
+            self.assertEqual(get_cohort_id(user, course.id), cohort.id)
+            self.assertIsNone(get_cohort_id(other_user, course.id))
+            self.assertTrue(get_cohort_directory(course.id).course.is_cohorted)
+
+    def test_cohort_directory_invalidation(self):
+        course = modulestore().get_course("edX/toy/2012_Fall")
+        self.config_course_cohorts(course, [], cohorted=True)
+        user = User.objects.create(username="test", email="a@b.com")
+        self.assertIsNone(get_cohort_id(user, course.id))
+
+        cohort = add_cohort(course.id, "TestCohort")
+        self.assertEqual(get_cohort_directory(course.id).cohort_name(cohort.id), "TestCohort")
+
+        add_user_to_cohort(cohort, "test")
+        self.assertEqual(get_cohort_id(user, course.id), cohort.id)
+
+        cohort.users.remove(user)
+        self.assertIsNone(get_cohort_id(user, course.id))
+
+    def test_cohort_directory_generation_expiry(self):
+        course = modulestore().get_course("edX/toy/2012_Fall")
+        self.config_course_cohorts(course, [], cohorted=True)
+        user = User.objects.create(username="test", email="a@b.com")
+        cohort = add_cohort(course.id, "TestCohort")
+        key = cohorts._generation_key(course.id)
+
+        with patch('course_groups.cohorts.time') as mock_time:
+            mock_time.time.side_effect = [1000.0, 2000.0]
+            # The directory is loaded at a generation which then expires...
+            cache.delete(key)
+            cohorts.invalidate_cohort_directories([course.id])
+            self.assertIsNone(get_cohort_id(user, course.id))
+            cache.delete(key)
+
+            # ...and the next change starts it again, at another value
+            CourseUserGroup.users.through.objects.create(courseusergroup=cohort, user=user)
+            cohorts.invalidate_cohort_directories([course.id])
+        self.assertEqual(get_cohort_id(user, course.id), cohort.id)
+
+    def test_cohort_directory_remembers_bounded_users(self):
+        course = modulestore().get_course("edX/toy/2012_Fall")
+        directory = get_cohort_directory(course.id)
+        with patch.object(cohorts, 'MAX_CACHED_USERS', 3):
+            directory.user_cohort_ids([1, 2])
+            directory.user_cohort_ids([3, 4])
+            self.assertLessEqual(len(directory._user_cohort_ids), 3)
@@ -132,4 +132,5 @@ def clear_courses():
     # $ mongo test_xmodule --eval "db.dropDatabase()"
     _MODULESTORES = {}
     modulestore().collection.drop()
+    modulestore().inheritance_collection.drop()
     update_templates(modulestore('direct'))
@@ -0,0 +1,86 @@
+#!/usr/bin/python
+#
+# django management command: filter and count the tracking events stored in
+# segment files (see track.segments), reading them one at a time
+
+import json
+
+from collections import defaultdict
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from track import segments
+
+# --count-by values that aren't event fields, and the length of the prefix
+# of the event's time they count by
+TIME_BUCKETS = {
+    'day': len('2013-06-01'),
+    'hour': len('2013-06-01T12'),
+    'minute': len('2013-06-01T12:00'),
+}
+
+
+class Command(BaseCommand):
+    help = "Print the tracking events in segment files matching the filters, one JSON event per line,\n"
+    help += "or with --count-by, the number of matching events per value of a field."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--dir',
+                    dest='directory',
+                    default=None,
+                    help='Directory of the segments (default: settings.TRACKING_SEGMENT_DIR).'),
+        make_option('--start',
+                    dest='start',
+                    default=None,
+                    help='Only events at or after this UTC time, e.g. 2013-06-01 or 2013-06-01T12:30.'),
+        make_option('--end',
+                    dest='end',
+                    default=None,
+                    help='Only events before this UTC time.'),
+        make_option('--username',
+                    dest='username',
+                    default=None,
+                    help='Only events of this user.'),
+        make_option('--event-type',
+                    dest='event_type',
+                    default=None,
+                    help="Only events whose type matches this pattern, e.g. 'problem_*'."),
+        make_option('--count-by',
+                    dest='count_by',
+                    default=None,
+                    help='Count the events by this field, or by {0}.'.format(', '.join(sorted(TIME_BUCKETS)))),
+        make_option('--limit',
+                    type='int',
+                    dest='limit',
+                    default=None,
+                    help='Stop after printing this many events.'),
+    )
+
+    def handle(self, *args, **options):
+        directory = options['directory'] or settings.TRACKING_SEGMENT_DIR
+        if not directory:
+            raise CommandError("No segment directory: pass --dir, or set TRACKING_SEGMENT_DIR")
+
+        events = segments.query(directory, options['start'], options['end'],
+                                options['username'], options['event_type'])
+
+        count_by = options['count_by']
+        if count_by is None:
+            for n, event in enumerate(events):
+                if options['limit'] is not None and n >= options['limit']:
+                    break
+                self.stdout.write(json.dumps(event) + '\n')
+            return
+
+        counts = defaultdict(int)
+        for event in events:
+            if count_by in TIME_BUCKETS:
+                key = (event.get('time') or '')[:TIME_BUCKETS[count_by]]
+            else:
+                key = event.get(count_by)
+            counts[key] += 1
+
+        for key, count in sorted(counts.items(), key=lambda item: (-item[1], item[0])):
+            self.stdout.write(u'{0}\t{1}\n'.format(count, key))
@@ -0,0 +1,306 @@
+"""
+A file-based store of tracking events, for volumes the TrackingLog table
+can't keep up with.
+
+Events are appended to gzipped NDJSON (one JSON event per line) segment
+files, one per period of event time (an hour, by default) per process:
+
+    <directory>/<period>-<hostname>-<pid>.ndjson.gz
+
+Every batch of events is appended as a gzip member of its own, which gzip
+readers see as one stream, so segments are never rewritten.  Next to each
+segment is a small JSON index of the time range, usernames and event types
+of its events, which lets queries skip the segments that can't match
+without opening them.  The index is only saved every INDEX_SAVE_INTERVAL
+batches and when the segment rolls over, so it records the size of the
+segment it covers, and queries don't skip a segment that has grown since.
+"""
+import fnmatch
+import gzip
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+
+from collections import defaultdict, deque
+from contextlib import closing
+from datetime import datetime
+from itertools import groupby
+
+log = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = '.ndjson.gz'
+INDEX_SUFFIX = '.idx.json'
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+# The number of segments whose index a SegmentSink keeps in memory
+MAX_OPEN_INDEXES = 16
+
+# The number of batches a SegmentSink appends to a segment between saves of its index
+INDEX_SAVE_INTERVAL = 20
+
+
+def event_time(event):
+    """
+    Return the time of the event as a datetime (to the second), or None if it
+    doesn't have a valid one
+    """
+    try:
+        return datetime.strptime(event['time'][:19], TIME_FORMAT)
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class SegmentIndex(object):
+    """
+    What is in a segment: the time range of its events (as ISO 8601 strings,
+    which sort in time order), and the usernames and event types among them,
+    as of when the segment was `size` bytes long
+    """
+    def __init__(self, start=None, end=None, count=0, usernames=(), event_types=(), size=None):
+        self.start = start
+        self.end = end
+        self.count = count
+        self.usernames = set(usernames)
+        self.event_types = set(event_types)
+        self.size = size
+
+    def add(self, event):
+        time = event.get('time')
+        if time is not None:
+            self.start = time if self.start is None else min(self.start, time)
+            self.end = time if self.end is None else max(self.end, time)
+        self.count += 1
+        self.usernames.add(event.get('username'))
+        self.event_types.add(event.get('event_type'))
+
+    def may_match(self, start=None, end=None, username=None, event_type=None):
+        """
+        Return whether the segment may have events matching the filters (see
+        matches)
+        """
+        if start is not None and self.end is not None and self.end < start:
+            return False
+        if end is not None and self.start is not None and self.start >= end:
+            return False
+        if username is not None and username not in self.usernames:
+            return False
+        if event_type is not None and not any(fnmatch.fnmatchcase(t or '', event_type) for t in self.event_types):
+            return False
+        return True
+
+    @classmethod
+    def load(cls, path):
+        """
+        Return the index stored at path, or None if there isn't a readable one
+        """
+        try:
+            with open(path) as index_file:
+                return cls(**json.load(index_file))
+        except (IOError, ValueError, TypeError):
+            return None
+
+    def save(self, path):
+        """
+        Store the index at path, replacing the file in one step so that it
+        is never seen half written
+        """
+        tmp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'w') as index_file:
+            json.dump({
+                'start': self.start,
+                'end': self.end,
+                'count': self.count,
+                'usernames': sorted(self.usernames),
+                'event_types': sorted(self.event_types),
+                'size': self.size,
+            }, index_file)
+        os.rename(tmp_path, path)
+
+
+class SegmentSink(object):
+    """
+    A tracking log writer sink (see track.writer) that appends events to
+    segments in `directory`, one per `period_format` (a strftime format) of
+    event time.  Periods must sort in time order as strings, and not have a
+    '-' in them.
+
+    A segment's index is saved when the sink is given a batch without events
+    for it (i.e. the segment has rolled over), after every
+    INDEX_SAVE_INTERVAL batches appended to it, and by save_indexes.
+    """
+    def __init__(self, directory, period_format='%Y%m%d%H', hostname=None):
+        self.directory = directory
+        self.period_format = period_format
+        self.hostname = hostname or socket.gethostname().split('.')[0]
+        self._indexes = {}
+        # the number of batches appended to each segment since its index was saved
+        self._unsaved = {}
+        self._lock = threading.Lock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def segment_path(self, event):
+        time = event_time(event) or datetime.utcnow()
+        name = '{period}-{host}-{pid}{suffix}'.format(
+            period=time.strftime(self.period_format),
+            host=self.hostname,
+            pid=os.getpid(),
+            suffix=SEGMENT_SUFFIX,
+        )
+        return os.path.join(self.directory, name)
+
+    def write(self, events):
+        by_segment = defaultdict(list)
+        for event in events:
+            by_segment[self.segment_path(event)].append(event)
+
+        with self._lock:
+            for path in self._unsaved.keys():
+                if path not in by_segment:
+                    self._save_index(path)
+
+            if len(self._indexes) + len(by_segment) > MAX_OPEN_INDEXES:
+                # the older periods are unlikely to get any more events
+                self._indexes = dict((path, self._indexes[path]) for path in by_segment if path in self._indexes)
+
+            for path, segment_events in sorted(by_segment.items()):
+                index = self._indexes.get(path) or SegmentIndex.load(path + INDEX_SUFFIX) or SegmentIndex()
+                for event in segment_events:
+                    index.add(event)
+                self._indexes[path] = index
+
+                lines = ''.join(json.dumps(event) + '\n' for event in segment_events)
+                with closing(gzip.open(path, 'ab')) as segment:
+                    segment.write(lines)
+                index.size = os.path.getsize(path)
+
+                self._unsaved[path] = self._unsaved.get(path, 0) + 1
+                if self._unsaved[path] >= INDEX_SAVE_INTERVAL:
+                    self._save_index(path)
+
+    def _save_index(self, path):
+        self._indexes[path].save(path + INDEX_SUFFIX)
+        del self._unsaved[path]
+
+    def save_indexes(self):
+        """
+        Save the indexes of all of the segments appended to since theirs were
+        last saved
+        """
+        with self._lock:
+            for path in self._unsaved.keys():
+                self._save_index(path)
+
+
+def load_index(path):
+    """
+    Return the index of the segment at path, or None if it doesn't have a
+    readable index covering all of its events
+    """
+    index = SegmentIndex.load(path + INDEX_SUFFIX)
+    if index is None:
+        return None
+    # indexes saved before they recorded the size always covered everything
+    if index.size is not None:
+        try:
+            if os.path.getsize(path) != index.size:
+                return None
+        except OSError:
+            return None
+    return index
+
+
+def segment_period(path):
+    """
+    Return the period of event time the segment at path is for, as formatted
+    in its name
+    """
+    return os.path.basename(path).split('-', 1)[0]
+
+
+def find_segments(directory, start=None, end=None, username=None, event_type=None):
+    """
+    Return the paths of the segments in directory which may have events
+    matching the filters (see matches), in order of period.  Segments
+    without a readable, up to date index are always included.
+    """
+    paths = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(SEGMENT_SUFFIX):
+            continue
+        path = os.path.join(directory, name)
+        index = load_index(path)
+        if index is None or index.may_match(start, end, username, event_type):
+            paths.append(path)
+    return paths
+
+
+def read_segment(path):
+    """
+    Yield the events in the segment at path, one at a time.  A segment cut
+    short (e.g. by a crash while appending to it) is read up to where it
+    ends.
+    """
+    with closing(gzip.open(path, 'rb')) as segment:
+        try:
+            for line in segment:
+                if not line.endswith('\n'):
+                    break
+                yield json.loads(line)
+        except (IOError, EOFError, ValueError, struct.error) as err:
+            log.warning("Segment %s is truncated: %s", path, err)
+
+
+def matches(event, start=None, end=None, username=None, event_type=None):
+    """
+    Return whether the event is at or after start and before end (ISO 8601
+    strings), by username, and of an event type matching the shell-style
+    pattern event_type.  Filters which are None match any event.
+    """
+    time = event.get('time')
+    if start is not None and (time is None or time < start):
+        return False
+    if end is not None and (time is None or time >= end):
+        return False
+    if username is not None and event.get('username') != username:
+        return False
+    if event_type is not None and not fnmatch.fnmatchcase(event.get('event_type') or '', event_type):
+        return False
+    return True
+
+
+def query(directory, start=None, end=None, username=None, event_type=None):
+    """
+    Yield the events in directory matching the filters (see matches), a
+    segment at a time, in order of period.  Only one event is in memory at
+    a time.
+    """
+    for path in find_segments(directory, start, end, username, event_type):
+        for event in read_segment(path):
+            if matches(event, start, end, username, event_type):
+                yield event
+
+
+def recent_events(directory, count, username=None):
+    """
+    Return a list of the latest `count` events in directory (by `username`),
+    latest first.  Segments are read from the latest period back, until
+    `count` events have been found.
+    """
+    found = []
+    segments = find_segments(directory, username=username)
+    for _, period_segments in groupby(reversed(segments), segment_period):
+        for path in period_segments:
+            latest = deque(maxlen=count)
+            for event in read_segment(path):
+                if matches(event, username=username):
+                    latest.append(event)
+            found.extend(latest)
+        # the events of earlier periods are all older than these
+        if len(found) >= count:
+            break
+    found.sort(key=lambda event: event.get('time'), reverse=True)
+    return found[:count]
@@ -1,16 +1,265 @@
 """
-This file demonstrates writing tests using the unittest module. These will pass
-when you run "manage.py test".
-
-Replace this with more appropriate tests for your application.
+Tests of the tracking log writer
 """
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from StringIO import StringIO
 
+from django.core.management import call_command
 from django.test import TestCase
+from mock import patch
+
+from track import segments
+from track.models import TrackingLog
+from track.segments import SegmentSink, SegmentIndex
+from track.writer import EventWriter, LoggingSink, SQLSink
+
+
+def make_event(n=0, time='2013-06-01T12:00:00.000000', event_type='/courses'):
+    return {
+        'username': 'user{0}'.format(n),
+        'ip': '127.0.0.1',
+        'event_source': 'server',
+        'event_type': event_type,
+        'event': '{}',
+        'agent': '',
+        'page': None,
+        'time': time,
+        'host': 'testserver',
+    }
+
+
+class ListSink(object):
+    """
+    Keeps the batches it is given
+    """
+    def __init__(self):
+        self.batches = []
+
+    def write(self, events):
+        self.batches.append(list(events))
+
+
+class BlockingSink(ListSink):
+    """
+    Doesn't write anything until it's released
+    """
+    def __init__(self):
+        super(BlockingSink, self).__init__()
+        self.release = threading.Event()
+
+    def write(self, events):
+        self.release.wait(5)
+        super(BlockingSink, self).write(events)
+
+
+class FailingSink(object):
+    def write(self, events):
+        raise IOError("disk full")
+
+
+class EventWriterTest(TestCase):
+    def test_batches(self):
+        sink = ListSink()
+        writer = EventWriter([sink], batch_size=3, flush_interval=5)
+        for n in xrange(7):
+            self.assertTrue(writer.put(make_event(n)))
+        self.assertTrue(writer.flush(5))
+
+        self.assertEqual([len(batch) for batch in sink.batches], [3, 3, 1])
+        self.assertEqual([event['username'] for batch in sink.batches for event in batch],
+                         ['user{0}'.format(n) for n in xrange(7)])
+        self.assertEqual(writer.stats(), {'queued': 7, 'flushed': 7, 'dropped': 0, 'failed': 0, 'pending': 0})
+
+    def test_flush_interval(self):
+        sink = ListSink()
+        writer = EventWriter([sink], batch_size=100, flush_interval=0.05)
+        writer.put(make_event())
+        time.sleep(0.5)
+        self.assertEqual(len(sink.batches), 1)
+
+    def test_drops_when_full(self):
+        sink = BlockingSink()
+        writer = EventWriter([sink], buffer_size=2, batch_size=1, flush_interval=0)
+        results = [writer.put(make_event(n)) for n in xrange(5)]
+        # one event is held by the blocked sink, two wait in the buffer
+        self.assertEqual(results.count(False), writer.stats()['dropped'])
+        self.assertGreaterEqual(writer.stats()['dropped'], 2)
+
+        sink.release.set()
+        self.assertTrue(writer.flush(5))
+        stats = writer.stats()
+        self.assertEqual(stats['queued'], stats['flushed'])
+        self.assertEqual(stats['queued'] + stats['dropped'], 5)
+
+    def test_put_timeout(self):
+        sink = BlockingSink()
+        writer = EventWriter([sink], buffer_size=1, batch_size=1, flush_interval=0, put_timeout=0.01)
+        results = [writer.put(make_event(n)) for n in xrange(4)]
+        self.assertIn(False, results)
+        sink.release.set()
+        self.assertTrue(writer.flush(5))
+
+    def test_failing_sink(self):
+        sink = ListSink()
+        writer = EventWriter([FailingSink(), sink], run_async=False)
+        writer.put(make_event())
+        self.assertEqual(len(sink.batches), 1)
+        self.assertEqual(writer.stats()['failed'], 1)
+
+    @patch('track.writer.log')
+    def test_logging_sink_skips_unserializable(self, mock_log):
+        bad_event = make_event(2)
+        bad_event['event'] = object()
+        LoggingSink().write([make_event(1), bad_event, make_event(3)])
+
+        logged = [json.loads(call[0][0]) for call in mock_log.info.call_args_list]
+        self.assertEqual([event['username'] for event in logged], ['user1', 'user3'])
+
+    def test_sql_sink(self):
+        writer = EventWriter([SQLSink()], run_async=False)
+        writer.put(make_event(1))
+        record = TrackingLog.objects.get(username='user1')
+        self.assertEqual(record.time.year, 2013)
+        self.assertEqual(writer.stats()['flushed'], 1)
+
+    def test_sql_sink_inserts_one_at_a_time_after_failure(self):
+        bad_event = make_event(2)
+        bad_event['username'] = None
+        with patch('track.writer.writer_log') as mock_log:
+            SQLSink().write([make_event(1), bad_event, make_event(3)])
+        self.assertEqual(sorted(TrackingLog.objects.values_list('username', flat=True)), ['user1', 'user3'])
+        self.assertEqual(mock_log.exception.call_count, 2)
+
+    @patch('track.writer.connection')
+    def test_sql_sink_closes_connection(self, mock_connection):
+        with patch.object(TrackingLog.objects, 'bulk_create'):
+            SQLSink(close_connection=True).write([make_event(1)])
+        self.assertTrue(mock_connection.close.called)
+
+
+class SegmentsTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.sink = SegmentSink(self.directory, hostname='test')
+        # two hours, with a few users and event types
+        self.sink.write([make_event(n % 3, '2013-06-01T12:{0:02d}:00.000000'.format(n), 'problem_check')
+                         for n in xrange(10)])
+        self.sink.write([make_event(n % 3, '2013-06-01T13:{0:02d}:00.000000'.format(n), 'page_close')
+                         for n in xrange(5)])
+        self.sink.write([make_event(3, '2013-06-01T13:30:00.000000', 'problem_check')])
+        self.sink.save_indexes()
+
+    def test_segments(self):
+        names = sorted(os.listdir(self.directory))
+        pid = os.getpid()
+        self.assertEqual(names, [
+            '2013060112-test-{0}.ndjson.gz'.format(pid), '2013060112-test-{0}.ndjson.gz.idx.json'.format(pid),
+            '2013060113-test-{0}.ndjson.gz'.format(pid), '2013060113-test-{0}.ndjson.gz.idx.json'.format(pid),
+        ])
+
+        path = os.path.join(self.directory, names[2])
+        # appended batches read back as one stream
+        self.assertEqual([event['username'] for event in segments.read_segment(path)],
+                         ['user0', 'user1', 'user2', 'user0', 'user1', 'user3'])
+
+        index = SegmentIndex.load(path + segments.INDEX_SUFFIX)
+        self.assertEqual(index.count, 6)
+        self.assertEqual((index.start, index.end), ('2013-06-01T13:00:00.000000', '2013-06-01T13:30:00.000000'))
+        self.assertEqual(index.usernames, set(['user0', 'user1', 'user2', 'user3']))
+        self.assertEqual(index.event_types, set(['page_close', 'problem_check']))
+
+    def test_index_saved_on_rollover(self):
+        path = os.path.join(self.directory, '2013060114-test-{0}.ndjson.gz'.format(os.getpid()))
+        self.sink.write([make_event(4, '2013-06-01T14:00:00.000000')])
+        self.assertFalse(os.path.exists(path + segments.INDEX_SUFFIX))
+        self.sink.write([make_event(5, '2013-06-01T15:00:00.000000')])
+        self.assertEqual(SegmentIndex.load(path + segments.INDEX_SUFFIX).usernames, set(['user4']))
+
+    def test_index_saved_every_interval(self):
+        path = os.path.join(self.directory, '2013060113-test-{0}.ndjson.gz'.format(os.getpid()))
+        with patch('track.segments.INDEX_SAVE_INTERVAL', 2):
+            self.sink.write([make_event(4, '2013-06-01T13:40:00.000000')])
+            self.assertEqual(SegmentIndex.load(path + segments.INDEX_SUFFIX).count, 6)
+            self.sink.write([make_event(5, '2013-06-01T13:50:00.000000')])
+            self.assertEqual(SegmentIndex.load(path + segments.INDEX_SUFFIX).count, 8)
+
+    def test_unsaved_index_not_trusted(self):
+        # until its index is saved, a segment that has grown is always searched
+        self.sink.write([make_event(9, '2013-06-01T13:40:00.000000')])
+        self.assertEqual([segments.segment_period(path)
+                          for path in segments.find_segments(self.directory, username='user9')], ['2013060113'])
+        self.assertEqual(len(list(segments.query(self.directory, username='user9'))), 1)
+
+    def test_concurrent_writes(self):
+        def write(n):
+            for _ in xrange(20):
+                self.sink.write([make_event(n, '2013-06-01T14:00:00.000000')])
+
+        threads = [threading.Thread(target=write, args=(n,)) for n in xrange(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.sink.save_indexes()
+
+        events = list(segments.query(self.directory, start='2013-06-01T14'))
+        self.assertEqual(len(events), 80)
+        path = segments.find_segments(self.directory, start='2013-06-01T14')[0]
+        self.assertEqual(segments.load_index(path).count, 80)
+
+    def test_find_segments(self):
+        def periods(**filters):
+            return [segments.segment_period(path) for path in segments.find_segments(self.directory, **filters)]
+
+        self.assertEqual(periods(), ['2013060112', '2013060113'])
+        self.assertEqual(periods(start='2013-06-01T13'), ['2013060113'])
+        self.assertEqual(periods(end='2013-06-01T13'), ['2013060112'])
+        self.assertEqual(periods(username='user3'), ['2013060113'])
+        self.assertEqual(periods(event_type='page_*'), ['2013060113'])
+        self.assertEqual(periods(event_type='seq_*'), [])
+
+    def test_query(self):
+        events = list(segments.query(self.directory, start='2013-06-01T12:05', event_type='problem_*'))
+        self.assertEqual([event['time'][11:16] for event in events],
+                         ['12:05', '12:06', '12:07', '12:08', '12:09', '13:30'])
+
+        events = list(segments.query(self.directory, username='user1', end='2013-06-01T13'))
+        self.assertEqual(len(events), 3)
+
+    def test_truncated_segment(self):
+        path = segments.find_segments(self.directory)[0]
+        with open(path, 'rb') as segment:
+            data = segment.read()
+        with open(path, 'wb') as segment:
+            segment.write(data[:-10])
+        self.assertLess(len(list(segments.read_segment(path))), 10)
+
+    def test_recent_events(self):
+        events = segments.recent_events(self.directory, 3)
+        self.assertEqual([event['time'][11:16] for event in events], ['13:30', '13:04', '13:03'])
+
+        events = segments.recent_events(self.directory, 5, username='user2')
+        self.assertEqual([event['time'][11:16] for event in events], ['13:02', '12:08', '12:05', '12:02'])
+
+    def test_query_command(self):
+        out = StringIO()
+        call_command('query_tracking_logs', directory=self.directory, event_type='problem_check', limit=2,
+                     stdout=out)
+        self.assertEqual([json.loads(line)['time'][11:16] for line in out.getvalue().splitlines()],
+                         ['12:00', '12:01'])
 
+        out = StringIO()
+        call_command('query_tracking_logs', directory=self.directory, count_by='hour', stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), ['10\t2013-06-01T12', '6\t2013-06-01T13'])
 
-class SimpleTest(TestCase):
-    def test_basic_addition(self):
-        """
-        Tests that 1 + 1 always equals 2.
-        """
-        self.assertEqual(1 + 1, 2)
+        out = StringIO()
+        call_command('query_tracking_logs', directory=self.directory, count_by='username',
+                     start='2013-06-01T13', stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), ['2\tuser0', '2\tuser1', '1\tuser2', '1\tuser3'])
@@ -1,9 +1,7 @@
-import json
 import logging
 import os
 import pytz
 import datetime
-import dateutil.parser
 
 from django.contrib.auth.decorators import login_required
 from django.http import HttpResponse
@@ -13,23 +11,19 @@ from django.conf import settings
 from mitxmako.shortcuts import render_to_response
 
 from django_future.csrf import ensure_csrf_cookie
+from track import segments
 from track.models import TrackingLog
+from track.writer import LOGFIELDS, get_writer
 
 log = logging.getLogger("tracking")
 
-LOGFIELDS = ['username', 'ip', 'event_source', 'event_type', 'event', 'agent', 'page', 'time', 'host']
-
 
 def log_event(event):
-    event_str = json.dumps(event)
-    log.info(event_str[:settings.TRACK_MAX_EVENT])
-    if settings.MITX_FEATURES.get('ENABLE_SQL_TRACKING_LOGS'):
-        event['time'] = dateutil.parser.parse(event['time'])
-        tldat = TrackingLog(**dict((x, event[x]) for x in LOGFIELDS))
-        try:
-            tldat.save()
-        except Exception as err:
-            log.exception(err)
+    """
+    Queue the event to be written to the tracking logs, in the background
+    (see track.writer)
+    """
+    get_writer().put(event)
 
 
 def user_track(request):
@@ -108,10 +102,19 @@ def view_tracking_log(request, args=''):
             if arg.startswith('username='):
                 username = arg[9:]
 
-    record_instances = TrackingLog.objects.all().order_by('-time')
-    if username:
-        record_instances = record_instances.filter(username=username)
-    record_instances = record_instances[0:nlen]
+    if settings.TRACKING_SEGMENT_DIR:
+        # unsaved TrackingLogs, to show the same way
+        record_instances = []
+        for event in segments.recent_events(settings.TRACKING_SEGMENT_DIR, nlen, username or None):
+            fields = dict((field, event.get(field)) for field in LOGFIELDS)
+            fields['time'] = segments.event_time(event)
+            if fields['time'] is not None:
+                record_instances.append(TrackingLog(**fields))
+    else:
+        record_instances = TrackingLog.objects.all().order_by('-time')
+        if username:
+            record_instances = record_instances.filter(username=username)
+        record_instances = record_instances[0:nlen]
 
     # fix dtstamp
     fmt = '%a %d-%b-%y %H:%M:%S'  # "%Y-%m-%d %H:%M:%S %Z%z"
@@ -0,0 +1,281 @@
+"""
+Writes tracking events out in batches, from a background thread.
+
+log_event hands each event to the EventWriter, which holds it in a bounded
+buffer.  The writer's thread takes events off the buffer and, once it has
+BATCH_SIZE of them or the oldest has waited FLUSH_INTERVAL seconds, passes
+the batch to each of its sinks: the "tracking" log, the TrackingLog table if
+ENABLE_SQL_TRACKING_LOGS is on, and segment files in TRACKING_SEGMENT_DIR (see
+track.segments) if that is set.  Serializing and saving events is thereby
+kept out of the request.
+
+When the buffer is full, an event waits PUT_TIMEOUT seconds for room, and is
+dropped if there is still none: tracking must never hold up a request for
+long.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import Queue
+
+import dateutil.parser
+from django.conf import settings
+from django.db import connection, transaction
+from statsd import statsd
+
+from track.models import TrackingLog
+from track.segments import SegmentSink
+
+log = logging.getLogger("tracking")
+writer_log = logging.getLogger(__name__)
+
+LOGFIELDS = ['username', 'ip', 'event_source', 'event_type', 'event', 'agent', 'page', 'time', 'host']
+
+DEFAULT_CONFIG = {
+    'BUFFER_SIZE': 10000,
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL': 1.0,
+    'PUT_TIMEOUT': 0,
+    'ASYNC': True,
+}
+
+
+class LoggingSink(object):
+    """
+    Writes events to the "tracking" log, as JSON.  An event that can't be
+    serialized is logged as an error and skipped, without the rest of its
+    batch.
+    """
+    def write(self, events):
+        for event in events:
+            try:
+                line = json.dumps(event)
+            except (TypeError, ValueError):
+                writer_log.exception("Couldn't serialize tracking event %r", event.get('event_type'))
+                statsd.increment('track.writer.unserializable')
+                continue
+            log.info(line[:settings.TRACK_MAX_EVENT])
+
+
+class SQLSink(object):
+    """
+    Writes events to the TrackingLog table, in one insert per batch.  If that
+    fails (e.g. one of the events has an over-long field), the events are
+    inserted one at a time, and those that fail are logged as errors and
+    skipped, without the rest of the batch.
+
+    close_connection: close the database connection after each batch.  The
+        writer's thread isn't a request, so nothing else closes its connection,
+        which would otherwise be dropped by the database once it's been idle
+        for long enough, and every later batch would fail.
+    """
+    def __init__(self, close_connection=False):
+        self.close_connection = close_connection
+
+    def write(self, events):
+        records = []
+        for event in events:
+            fields = dict((field, event[field]) for field in LOGFIELDS)
+            fields['time'] = dateutil.parser.parse(fields['time'])
+            records.append(TrackingLog(**fields))
+        try:
+            try:
+                TrackingLog.objects.bulk_create(records)
+            except Exception:
+                transaction.rollback_unless_managed()
+                writer_log.exception("Couldn't insert %d tracking events at once, inserting them one at a time",
+                                     len(records))
+                self._write_each(records)
+        finally:
+            if self.close_connection:
+                connection.close()
+
+    def _write_each(self, records):
+        for record in records:
+            try:
+                record.save()
+            except Exception:
+                transaction.rollback_unless_managed()
+                writer_log.exception("Couldn't insert tracking event %r", record.event_type)
+                statsd.increment('track.writer.unsaved')
+
+
+class _Flush(object):
+    """
+    Marker put in the buffer by EventWriter.flush, set once everything ahead
+    of it has been written
+    """
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class EventWriter(object):
+    """
+    Buffers events, and writes them to `sinks` in batches from a background
+    thread (or right away, if not run_async).
+
+    Each sink has a method write(events), taking a list of event dicts.  An
+    exception raised by one sink is logged, and doesn't stop the others.
+    """
+    def __init__(self, sinks, buffer_size=10000, batch_size=500, flush_interval=1.0, put_timeout=0,
+                 run_async=True):
+        self.sinks = sinks
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.run_async = run_async
+
+        self._buffer = Queue.Queue(buffer_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._counts = {'queued': 0, 'flushed': 0, 'dropped': 0, 'failed': 0}
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._counts[name] += n
+
+    def stats(self):
+        """
+        Return a dict of the number of events queued, flushed (written by
+        every sink), dropped (because the buffer was full) and failed (to be
+        written by a sink) since the writer was created, and how many are
+        pending in the buffer.
+        """
+        with self._lock:
+            stats = dict(self._counts)
+        stats['pending'] = self._buffer.qsize()
+        return stats
+
+    def _ensure_started(self):
+        """
+        Start the writer's thread, unless it is already running in this
+        process.  A process forked from this one (e.g. a gunicorn worker)
+        doesn't inherit the thread, so starts its own.
+        """
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="tracking-log-writer")
+            self._thread.daemon = True
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def put(self, event):
+        """
+        Queue `event` to be written.  Returns False if it was dropped.
+        """
+        if not self.run_async:
+            self._count('queued')
+            self._write([event])
+            return True
+
+        self._ensure_started()
+        try:
+            if self.put_timeout:
+                self._buffer.put(event, timeout=self.put_timeout)
+            else:
+                self._buffer.put_nowait(event)
+        except Queue.Full:
+            self._count('dropped')
+            statsd.increment('track.writer.dropped')
+            return False
+        self._count('queued')
+        return True
+
+    def flush(self, timeout=None):
+        """
+        Wait until the events queued so far have been written.  Returns False
+        if that took longer than `timeout` seconds.
+        """
+        if not self.run_async or self._pid != os.getpid():
+            # nothing has been queued by this process
+            return True
+        marker = _Flush()
+        try:
+            self._buffer.put(marker, timeout=timeout)
+        except Queue.Full:
+            return False
+        return marker.done.wait(timeout)
+
+    def _write(self, events):
+        if not events:
+            return
+        failed = False
+        for sink in self.sinks:
+            try:
+                sink.write(events)
+            except Exception:
+                failed = True
+                writer_log.exception("Couldn't write %d tracking events to %s", len(events), type(sink).__name__)
+        if failed:
+            self._count('failed', len(events))
+            statsd.increment('track.writer.failed', len(events))
+        else:
+            self._count('flushed', len(events))
+            statsd.increment('track.writer.flushed', len(events))
+
+    def _run(self):
+        while True:
+            batch, markers = [], []
+            # wait as long as it takes for the first event...
+            item = self._buffer.get()
+            deadline = time.time() + self.flush_interval
+            # ...then up to flush_interval for the rest of the batch
+            while True:
+                if isinstance(item, _Flush):
+                    markers.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._buffer.get(timeout=remaining)
+                except Queue.Empty:
+                    break
+
+            self._write(batch)
+            for marker in markers:
+                marker.done.set()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """
+    Return the EventWriter of this process, configured by
+    settings.TRACKING_WRITER, creating it the first time
+    """
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                config = dict(DEFAULT_CONFIG, **getattr(settings, 'TRACKING_WRITER', {}))
+                sinks = [LoggingSink()]
+                if settings.MITX_FEATURES.get('ENABLE_SQL_TRACKING_LOGS'):
+                    sinks.append(SQLSink(close_connection=config['ASYNC']))
+                if getattr(settings, 'TRACKING_SEGMENT_DIR', None):
+                    segment_sink = SegmentSink(settings.TRACKING_SEGMENT_DIR, settings.TRACKING_SEGMENT_PERIOD)
+                    sinks.append(segment_sink)
+                    # exit handlers run last first, so this runs after the flush below
+                    atexit.register(segment_sink.save_indexes)
+                _writer = EventWriter(
+                    sinks,
+                    buffer_size=config['BUFFER_SIZE'],
+                    batch_size=config['BATCH_SIZE'],
+                    flush_interval=config['FLUSH_INTERVAL'],
+                    put_timeout=config['PUT_TIMEOUT'],
+                    run_async=config['ASYNC'],
+                )
+                atexit.register(_writer.flush, config['FLUSH_INTERVAL'] * 2)
+    return _writer
@@ -3,9 +3,9 @@ import logging
 import math
 import operator
 import re
+import threading
 
 import numpy
-import numbers
 import scipy.constants
 
 from pyparsing import Word, alphas, nums, oneOf, Literal
@@ -14,6 +14,8 @@ from pyparsing import StringEnd, Optional, Forward
 from pyparsing import CaselessLiteral, Group, StringEnd
 from pyparsing import NoMatch, stringEnd, alphanums
 
+from lru_cache import LRUCache
+
 default_functions = {'sin': numpy.sin,
                      'cos': numpy.cos,
                      'tan': numpy.tan,
@@ -39,6 +41,11 @@ default_variables = {'j': numpy.complex(0, 1),
 
 log = logging.getLogger("mitx.courseware.capa")
 
+# Maximum number of grammars (one per set of variable and function names) and
+# of parsed expressions to keep around for reuse
+GRAMMAR_CACHE_SIZE = 64
+EXPRESSION_CACHE_SIZE = 1024
+
 
 class UndefinedVariable(Exception):
     def raiseself(self):
@@ -73,108 +80,142 @@ def check_variables(string, variables):
         raise UndefinedVariable(' '.join(bad_variables))
 
 
-def evaluator(variables, functions, string, cs=False):
-    '''
-    Evaluate an expression. Variables are passed as a dictionary
-    from string to value. Unary functions are passed as a dictionary
-    from string to function. Variables must be floats.
-    cs: Case sensitive
+grammar_cache = LRUCache(GRAMMAR_CACHE_SIZE)
+expression_cache = LRUCache(EXPRESSION_CACHE_SIZE)
 
-    TODO: Fix it so we can pass integers and complex numbers in variables dict
-    '''
-    # log.debug("variables: {0}".format(variables))
-    # log.debug("functions: {0}".format(functions))
-    # log.debug("string: {0}".format(string))
+# pyparsing grammars hold some state while parsing, so don't share one between threads
+_parse_lock = threading.Lock()
 
-    def lower_dict(d):
-        return dict([(k.lower(), d[k]) for k in d])
+ops = {"^": operator.pow,
+       "*": operator.mul,
+       "/": operator.truediv,
+       "+": operator.add,
+       "-": operator.sub,
+       }
+# We eliminated extreme ones, since they're rarely used, and potentially
+# confusing. They may also conflict with variables if we ever allow e.g.
+# 5R instead of 5*R
+suffixes = {'%': 0.01, 'k': 1e3, 'M': 1e6, 'G': 1e9,
+            'T': 1e12,  # 'P':1e15,'E':1e18,'Z':1e21,'Y':1e24,
+            'c': 1e-2, 'm': 1e-3, 'u': 1e-6,
+            'n': 1e-9, 'p': 1e-12}  # ,'f':1e-15,'a':1e-18,'z':1e-21,'y':1e-24}
 
-    all_variables = copy.copy(default_variables)
-    all_functions = copy.copy(default_functions)
 
-    if not cs:
-        all_variables = lower_dict(all_variables)
-        all_functions = lower_dict(all_functions)
+def super_float(text):
+    ''' Like float, but with si extensions. 1k goes to 1000'''
+    if text[-1] in suffixes:
+        return float(text[:-1]) * suffixes[text[-1]]
+    else:
+        return float(text)
 
-    all_variables.update(variables)
-    all_functions.update(functions)
 
-    if not cs:
-        string_cs = string.lower()
-        all_functions = lower_dict(all_functions)
-        all_variables = lower_dict(all_variables)
-        CasedLiteral = CaselessLiteral
-    else:
-        string_cs = string
-        CasedLiteral = Literal
+# The parse actions below don't compute values directly. Instead, each one
+# returns a node of the evaluation tree: a function that takes the dicts of
+# variables and functions and returns the value of that part of the
+# expression. This lets a parsed expression be evaluated again and again
+# with different variables.
 
-    check_variables(string_cs, set(all_variables.keys() + all_functions.keys()))
+def number_parse_action(x):  # [ '7' ] ->  [ 7 ]
+    value = super_float("".join(x))
+    return [lambda variables, functions: value]
 
-    if string.strip() == "":
-        return float('nan')
 
-    ops = {"^": operator.pow,
-           "*": operator.mul,
-           "/": operator.truediv,
-           "+": operator.add,
-           "-": operator.sub,
-           }
-    # We eliminated extreme ones, since they're rarely used, and potentially
-    # confusing. They may also conflict with variables if we ever allow e.g.
-    # 5R instead of 5*R
-    suffixes = {'%': 0.01, 'k': 1e3, 'M': 1e6, 'G': 1e9,
-                'T': 1e12,  # 'P':1e15,'E':1e18,'Z':1e21,'Y':1e24,
-                'c': 1e-2, 'm': 1e-3, 'u': 1e-6,
-                'n': 1e-9, 'p': 1e-12}  # ,'f':1e-15,'a':1e-18,'z':1e-21,'y':1e-24}
-
-    def super_float(text):
-        ''' Like float, but with si extensions. 1k goes to 1000'''
-        if text[-1] in suffixes:
-            return float(text[:-1]) * suffixes[text[-1]]
-        else:
-            return float(text)
-
-    def number_parse_action(x):  # [ '7' ] ->  [ 7 ]
-        return [super_float("".join(x))]
-
-    def exp_parse_action(x):  # [ 2 ^ 3 ^ 2 ] -> 512
-        x = [e for e in x if isinstance(e, numbers.Number)]  # Ignore ^
-        x.reverse()
-        x = reduce(lambda a, b: b ** a, x)
-        return x
-
-    def parallel(x):  # Parallel resistors [ 1 2 ] => 2/3
-        # convert from pyparsing.ParseResults, which doesn't support '0 in x'
-        x = list(x)
-        if len(x) == 1:
-            return x[0]
-        if 0 in x:
+def variable_parse_action(x):  # [ 'R1' ] -> [ 0.5 ]
+    name = x[0]
+    return [lambda variables, functions: variables[name]]
+
+
+def func_parse_action(x):  # [ 'sin', 0 ] -> [ 0 ]
+    name, argument = x[0], x[1]
+    return [lambda variables, functions: functions[name](argument(variables, functions))]
+
+
+def exp_parse_action(x):  # [ 2 ^ 3 ^ 2 ] -> 512
+    nodes = [e for e in x if not isinstance(e, basestring)]  # Ignore ^ and parens
+    if len(nodes) == 1:
+        return nodes[0]
+
+    def evaluate(variables, functions):
+        values = [node(variables, functions) for node in nodes]
+        values.reverse()
+        return reduce(lambda a, b: b ** a, values)
+    return evaluate
+
+
+def parallel(x):  # Parallel resistors [ 1 2 ] => 2/3
+    # convert from pyparsing.ParseResults, which doesn't support '0 in x'
+    x = list(x)
+    if len(x) == 1:
+        return x[0]
+    nodes = [e for e in x if not isinstance(e, basestring)]  # Ignore ||
+
+    def evaluate(variables, functions):
+        values = [node(variables, functions) for node in nodes]
+        if any(numpy.ndim(value) for value in values):
+            # evaluating many samples at once (see evaluate_samples), so give
+            # nan for just the samples that have a zero
+            zero = reduce(numpy.logical_or, [numpy.equal(value, 0) for value in values])
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                result = 1. / sum([1. / e for e in values])
+            return numpy.where(zero, float('nan'), result)
+        if 0 in values:
             return float('nan')
-        x = [1. / e for e in x if isinstance(e, numbers.Number)]  # Ignore ||
-        return 1. / sum(x)
+        return 1. / sum([1. / e for e in values])
+    return evaluate
 
-    def sum_parse_action(x):  # [ 1 + 2 - 3 ] -> 0
+
+def sum_parse_action(x):  # [ 1 + 2 - 3 ] -> 0
+    terms = []
+    op = ops['+']
+    for e in x:
+        if isinstance(e, basestring):
+            op = ops[e]
+        else:
+            terms.append((op, e))
+
+    def evaluate(variables, functions):
         total = 0.0
-        op = ops['+']
-        for e in x:
-            if e in set('+-'):
-                op = ops[e]
-            else:
-                total = op(total, e)
+        for op, node in terms:
+            total = op(total, node(variables, functions))
         return total
+    return evaluate
+
 
-    def prod_parse_action(x):  # [ 1 * 2 / 3 ] => 0.66
+def prod_parse_action(x):  # [ 1 * 2 / 3 ] => 0.66
+    factors = []
+    op = ops['*']
+    for e in x:
+        if isinstance(e, basestring):
+            op = ops[e]
+        else:
+            factors.append((op, e))
+
+    def evaluate(variables, functions):
         prod = 1.0
-        op = ops['*']
-        for e in x:
-            if e in set('*/'):
-                op = ops[e]
-            else:
-                prod = op(prod, e)
+        for op, node in factors:
+            prod = op(prod, node(variables, functions))
         return prod
+    return evaluate
+
 
-    def func_parse_action(x):
-        return [all_functions[x[0]](x[1])]
+def sreduce(f, l):
+    ''' Same as reduce, but handle len 1 and len 0 lists sensibly '''
+    if len(l) == 0:
+        return NoMatch()
+    if len(l) == 1:
+        return l[0]
+    return reduce(f, l)
+
+
+def build_grammar(variable_names, function_names, cs):
+    '''
+    Build the pyparsing grammar for expressions using the specified names of
+    variables and unary functions. cs: Case sensitive
+    '''
+    if cs:
+        CasedLiteral = Literal
+    else:
+        CasedLiteral = CaselessLiteral
 
     # SI suffixes and percent
     number_suffix = reduce(lambda a, b: a | b, map(Literal, suffixes.keys()), NoMatch())
@@ -195,29 +236,22 @@ def evaluator(variables, functions, string, cs=False):
     expr = Forward()
     factor = Forward()
 
-    def sreduce(f, l):
-        ''' Same as reduce, but handle len 1 and len 0 lists sensibly '''
-        if len(l) == 0:
-            return NoMatch()
-        if len(l) == 1:
-            return l[0]
-        return reduce(f, l)
-
     # Handle variables passed in. E.g. if we have {'R':0.5}, we make the substitution.
     # Special case for no variables because of how we understand PyParsing is put together
-    if len(all_variables) > 0:
+    if len(variable_names) > 0:
         # We sort the list so that var names (like "e2") match before
         # mathematical constants (like "e"). This is kind of a hack.
-        all_variables_keys = sorted(all_variables.keys(), key=len, reverse=True)
+        all_variables_keys = sorted(variable_names, key=len, reverse=True)
         varnames = sreduce(lambda x, y: x | y, map(lambda x: CasedLiteral(x), all_variables_keys))
-        varnames.setParseAction(lambda x: map(lambda y: all_variables[y], x))
+        varnames.setParseAction(variable_parse_action)
     else:
         varnames = NoMatch()
 
-    # Same thing for functions.
-    if len(all_functions) > 0:
+    # Same thing for functions (so that e.g. "factorial" matches before "fact")
+    if len(function_names) > 0:
+        all_functions_keys = sorted(function_names, key=len, reverse=True)
         funcnames = sreduce(lambda x, y: x | y,
-                            map(lambda x: CasedLiteral(x), all_functions.keys()))
+                            map(lambda x: CasedLiteral(x), all_functions_keys))
         function = funcnames + lpar.suppress() + expr + rpar.suppress()
         function.setParseAction(func_parse_action)
     else:
@@ -231,4 +265,92 @@ def evaluator(variables, functions, string, cs=False):
     term = term.setParseAction(prod_parse_action)
     expr << Optional((plus | minus)) + term + ZeroOrMore((plus | minus) + term)  # -5 + 4 - 3
     expr = expr.setParseAction(sum_parse_action)
-    return (expr + stringEnd).parseString(string)[0]
+    return expr + stringEnd
+
+
+def parse(variable_names, function_names, string, cs=False):
+    '''
+    Parse an expression into an evaluation tree: a function that takes dicts
+    of variables and functions (with the specified names) and returns the
+    value of the expression.
+
+    Grammars and evaluation trees are cached, so that the same expression
+    can be evaluated many times without parsing it again.
+    '''
+    variable_names = frozenset(variable_names)
+    function_names = frozenset(function_names)
+    grammar_key = (variable_names, function_names, cs)
+
+    tree = expression_cache.get(grammar_key + (string,))
+    if tree is not None:
+        return tree
+
+    if not cs:
+        string_cs = string.lower()
+    else:
+        string_cs = string
+    check_variables(string_cs, variable_names | function_names)
+
+    grammar = grammar_cache.get(grammar_key)
+    if grammar is None:
+        grammar = build_grammar(variable_names, function_names, cs)
+        grammar_cache.set(grammar_key, grammar)
+
+    with _parse_lock:
+        tree = grammar.parseString(string)[0]
+    expression_cache.set(grammar_key + (string,), tree)
+    return tree
+
+
+def evaluator(variables, functions, string, cs=False):
+    '''
+    Evaluate an expression. Variables are passed as a dictionary
+    from string to value. Unary functions are passed as a dictionary
+    from string to function. Variables must be floats.
+    cs: Case sensitive
+
+    TODO: Fix it so we can pass integers and complex numbers in variables dict
+    '''
+    # log.debug("variables: {0}".format(variables))
+    # log.debug("functions: {0}".format(functions))
+    # log.debug("string: {0}".format(string))
+
+    def lower_dict(d):
+        return dict([(k.lower(), d[k]) for k in d])
+
+    all_variables = copy.copy(default_variables)
+    all_functions = copy.copy(default_functions)
+
+    if not cs:
+        all_variables = lower_dict(all_variables)
+        all_functions = lower_dict(all_functions)
+
+    all_variables.update(variables)
+    all_functions.update(functions)
+
+    if not cs:
+        all_functions = lower_dict(all_functions)
+        all_variables = lower_dict(all_variables)
+
+    if string.strip() == "":
+        return float('nan')
+
+    tree = parse(all_variables.keys(), all_functions.keys(), string, cs)
+    return tree(all_variables, all_functions)
+
+
+def evaluate_samples(variables, functions, string, cs=False):
+    '''
+    Evaluate an expression for many samples at once. Like evaluator, but the
+    values of variables may be numpy arrays, with one element per sample, in
+    which case the result is an array of the value of the expression for each
+    sample.
+
+    The expression is only parsed once, and evaluated with numpy operations
+    on the whole arrays. Where evaluating a sample on its own would raise an
+    error (e.g. dividing by zero), a FloatingPointError is raised instead of
+    giving inf or nan for that sample, so callers can fall back to evaluator
+    to handle errors one sample at a time.
+    '''
+    with numpy.errstate(divide='raise', over='raise', invalid='raise', under='ignore'):
+        return evaluator(variables, functions, string, cs)
@@ -2,7 +2,7 @@ from setuptools import setup
 
 setup(
     name="calc",
-    version="0.1.1",
+    version="0.1.2",
     py_modules=["calc"],
     install_requires=[
         "pyparsing==1.5.6",
@@ -375,3 +375,41 @@ class EvaluatorTest(unittest.TestCase):
                           {'r1': 5}, {}, "r1+r2")
         self.assertRaises(calc.UndefinedVariable, calc.evaluator,
                           variables, {}, "r1*r3", cs=True)
+
+    def test_evaluate_samples(self):
+        """
+        Evaluating many samples at once should give the same results as
+        evaluating them one at a time
+        """
+        samples = numpy.array([0.5, 1.0, 2.5])
+        expression = "R1||(x+1) + sin(x)^2 - 3k*x/e"
+        results = calc.evaluate_samples({'x': samples, 'R1': 2.0}, {}, expression)
+        for sample, result in zip(samples, results):
+            self.assertAlmostEqual(calc.evaluator({'x': sample, 'R1': 2.0}, {}, expression), result)
+
+    def test_evaluate_samples_errors(self):
+        """
+        Samples that give a zero in parallel resistors should be nan, but those
+        that divide by zero should raise an error
+        """
+        results = calc.evaluate_samples({'x': numpy.array([0.0, 1.0])}, {}, "x||1")
+        self.assertTrue(numpy.isnan(results[0]))
+        self.assertAlmostEqual(results[1], 0.5)
+
+        self.assertRaises(FloatingPointError, calc.evaluate_samples,
+                          {'x': numpy.array([0.0, 1.0])}, {}, "1/x")
+
+    def test_cached_results_match(self):
+        """
+        Evaluating an expression with the parsed expression cached should
+        give the same results as parsing it again
+        """
+        expression = "R1*sin(x)^2 + R2||R3 - 5k/(1+e^(-x))"
+        variables = [{'R1': 1.0 + i, 'R2': 2.0, 'R3': 3.0, 'x': i / 10.0} for i in xrange(10)]
+        uncached = []
+        for values in variables:
+            calc.grammar_cache.clear()
+            calc.expression_cache.clear()
+            uncached.append(calc.evaluator(values, {}, expression))
+        cached = [calc.evaluator(values, {}, expression) for values in variables]
+        self.assertEqual(uncached, cached)
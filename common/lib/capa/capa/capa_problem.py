@@ -56,6 +56,77 @@ html_problem_semantics = ["codeparam", "responseparam", "answer", "script", "hin
 log = logging.getLogger(__name__)
 
 #-----------------------------------------------------------------------------
+
+
+def get_static_max_score(problem_text):
+    '''
+    Return the maximum score of the problem defined by problem_text (a string
+    of xml), computed from the xml alone: without building a LoncapaProblem,
+    and so without running any of its scripts.
+
+    Returns None if the max score can't be computed that way, e.g. if the
+    problem has <include> tags, or doesn't parse.
+    '''
+    problem_text = re.sub("startouttext\s*/", "text", problem_text)
+    problem_text = re.sub("endouttext\s*/", "/text", problem_text)
+    try:
+        tree = etree.XML(problem_text)
+    except etree.XMLSyntaxError:
+        return None
+
+    # included files can only be read through the ModuleSystem
+    if tree.xpath('//include'):
+        return None
+
+    input_tags = inputtypes.registry.registered_tags()
+    max_score = 0
+    for response in tree.xpath('//' + "|//".join(response_tag_dict)):
+        # the same input fields that _preprocess_problem gives the Response
+        inputfields = response.xpath("|".join(['.//' + x for x in (input_tags + solution_tags)]))
+        try:
+            max_score += response_tag_dict[response.tag].get_static_max_score(inputfields)
+        except ValueError:
+            return None
+    return max_score
+
+
+def batch_check_functions(problems, answers_list):
+    '''
+    Call the customresponse check functions that grading answers_list[i] for
+    problems[i] needs, for each i, with one sandboxed execution per check
+    function rather than one per problem.  The results are kept by the
+    problems' responses, so that grading the same answers with
+    problem.grade_answers afterwards doesn't run the check functions again.
+    '''
+    # Group the check function calls by the code that needs running for them
+    batches = {}
+    for problem, answers in zip(problems, answers_list):
+        answers = convert_files_to_filenames(answers)
+        for responder in problem.responders.values():
+            if not isinstance(responder, responsetypes.CustomResponse):
+                continue
+            call = responder.check_function_call(answers)
+            if call is None:
+                continue
+            key = (responder.context['script_code'], responder.cfn, tuple(responder.context['python_path']))
+            batches.setdefault(key, []).append((responder, call))
+
+    for responses_and_calls in batches.values():
+        responsetypes.run_check_function_batch(responses_and_calls)
+
+
+def grade_answers_batch(problems, answers_list):
+    '''
+    Grade answers_list[i] for problems[i] for each i, as problem.grade_answers
+    does, but calling each customresponse check function for all of the
+    problems in one sandboxed execution (see batch_check_functions).
+
+    Returns the list of the new CorrectMaps of the problems.
+    '''
+    batch_check_functions(problems, answers_list)
+    return [problem.grade_answers(answers) for problem, answers in zip(problems, answers_list)]
+
+#-----------------------------------------------------------------------------
 # main class for this module
 
 
@@ -463,7 +534,9 @@ class LoncapaProblem(object):
 
         if all_code:
             try:
-                safe_exec.safe_exec(
+                # The context only depends on the code and the seed, so reuse
+                # the results of running the same code with the same seed
+                safe_exec.context_store.execute(
                     all_code,
                     context,
                     random_seed=self.seed,
@@ -588,9 +661,7 @@ class LoncapaProblem(object):
 
             answer_id = 1
             input_tags = inputtypes.registry.registered_tags()
-            inputfields = tree.xpath("|".join(['//' + response.tag + '[@id=$id]//' + x
-                                               for x in (input_tags + solution_tags)]),
-                                    id=response_id_str)
+            inputfields = response.xpath("|".join(['.//' + x for x in (input_tags + solution_tags)]))
 
             # assign one answer_id for each input type or solution type
             for entry in inputfields:
@@ -31,7 +31,7 @@ from collections import namedtuple
 from shapely.geometry import Point, MultiPoint
 
 # specific library imports
-from calc import evaluator, UndefinedVariable
+from calc import evaluator, evaluate_samples, UndefinedVariable
 from . import correctmap
 from datetime import datetime
 from .util import *
@@ -40,6 +40,7 @@ from lxml.html.soupparser import fromstring as fromstring_bs     # uses Beautifu
 import capa.xqueue_interface as xqueue_interface
 
 import safe_exec
+from codejail.safe_exec import SafeExecException
 
 log = logging.getLogger(__name__)
 
@@ -195,6 +196,15 @@ class LoncapaResponse(object):
         '''
         return sum(self.maxpoints.values())
 
+    @classmethod
+    def get_static_max_score(cls, inputfields):
+        '''
+        Return the total maximum points of the answer fields inputfields, without
+        setting up the Response (so without needing the problem's script context).
+        Must agree with get_max_score.
+        '''
+        return sum(int(inputfield.get('points', '1')) for inputfield in inputfields)
+
     def render_html(self, renderer, response_msg=''):
         '''
         Return XHTML Element tree representation of this Response.
@@ -459,14 +469,11 @@ class JavascriptResponse(LoncapaResponse):
         self.display_filename = 'compiled/' + filename
 
     def parse_xml(self):
-        self.generator_xml = self.xml.xpath('//*[@id=$id]//generator',
-                                            id=self.xml.get('id'))[0]
+        self.generator_xml = self.xml.xpath('.//generator')[0]
 
-        self.grader_xml = self.xml.xpath('//*[@id=$id]//grader',
-                                         id=self.xml.get('id'))[0]
+        self.grader_xml = self.xml.xpath('.//grader')[0]
 
-        self.display_xml = self.xml.xpath('//*[@id=$id]//display',
-                                          id=self.xml.get('id'))[0]
+        self.display_xml = self.xml.xpath('.//display')[0]
 
         self.xml.remove(self.generator_xml)
         self.xml.remove(self.grader_xml)
@@ -531,8 +538,7 @@ class JavascriptResponse(LoncapaResponse):
 
         params = {}
 
-        for param in self.xml.xpath('//*[@id=$id]//responseparam',
-                                    id=self.xml.get('id')):
+        for param in self.xml.xpath('.//responseparam'):
 
             raw_param = param.get("value")
             params[param.get("name")] = json.loads(
@@ -542,8 +548,7 @@ class JavascriptResponse(LoncapaResponse):
 
     def prepare_inputfield(self):
 
-        for inputfield in self.xml.xpath('//*[@id=$id]//javascriptinput',
-                                         id=self.xml.get('id')):
+        for inputfield in self.xml.xpath('.//javascriptinput'):
 
             escapedict = {'"': '&quot;'}
 
@@ -652,8 +657,7 @@ class ChoiceResponse(LoncapaResponse):
 
         self.assign_choice_names()
 
-        correct_xml = self.xml.xpath('//*[@id=$id]//choice[@correct="true"]',
-                                     id=self.xml.get('id'))
+        correct_xml = self.xml.xpath('.//choice[@correct="true"]')
 
         self.correct_choices = set([choice.get(
             'name') for choice in correct_xml])
@@ -663,8 +667,7 @@ class ChoiceResponse(LoncapaResponse):
         Initialize name attributes in <choice> tags for this response.
         '''
 
-        for index, choice in enumerate(self.xml.xpath('//*[@id=$id]//choice',
-                                                      id=self.xml.get('id'))):
+        for index, choice in enumerate(self.xml.xpath('.//choice')):
             choice.set("name", "choice_" + str(index))
 
     def get_score(self, student_answers):
@@ -706,7 +709,7 @@ class MultipleChoiceResponse(LoncapaResponse):
 
         # define correct choices (after calling secondary setup)
         xml = self.xml
-        cxml = xml.xpath('//*[@id=$id]//choice', id=xml.get('id'))
+        cxml = xml.xpath('.//choice')
 
         # contextualize correct attribute and then select ones for which
         # correct = "true"
@@ -824,15 +827,12 @@ class NumericalResponse(LoncapaResponse):
         context = self.context
         self.correct_answer = contextualize_text(xml.get('answer'), context)
         try:
-            self.tolerance_xml = xml.xpath(
-                '//*[@id=$id]//responseparam[@type="tolerance"]/@default',
-                id=xml.get('id'))[0]
+            self.tolerance_xml = xml.xpath('.//responseparam[@type="tolerance"]/@default')[0]
             self.tolerance = contextualize_text(self.tolerance_xml, context)
         except IndexError:  # xpath found an empty list, so (...)[0] is the error
             self.tolerance = '0'
         try:
-            self.answer_id = xml.xpath('//*[@id=$id]//textline/@id',
-                                       id=xml.get('id'))[0]
+            self.answer_id = xml.xpath('.//textline/@id')[0]
         except IndexError:  # Same as above
             self.answer_id = None
 
@@ -943,9 +943,13 @@ class CustomResponse(LoncapaResponse):
         # the <answer>...</answer> stanza should be local to the current <customresponse>.
         # So try looking there first.
         self.code = None
+        self.cfn = None
+        # results of calls to the cfn check function made by run_check_function_batch,
+        # keyed by check_function_call_key
+        self.check_function_results = {}
         answer = None
         try:
-            answer = xml.xpath('//*[@id=$id]//answer', id=xml.get('id'))[0]
+            answer = xml.xpath('.//answer')[0]
         except IndexError:
             # print "xml = ",etree.tostring(xml,pretty_print=True)
 
@@ -963,6 +967,15 @@ class CustomResponse(LoncapaResponse):
                 # and invoke the function with the data needed.
                 def make_check_function(script_code, cfn):
                     def check_function(expect, ans, **kwargs):
+                        # Use the result of a batch run, if there was one
+                        if self.check_function_results:
+                            key = check_function_call_key(expect, ans, kwargs)
+                            if key in self.check_function_results:
+                                emsg, ret = self.check_function_results.pop(key)
+                                if emsg:
+                                    raise SafeExecException("Couldn't execute jailed code: %s" % emsg)
+                                return ret
+
                         extra_args = "".join(", {0}={0}".format(k) for k in kwargs)
                         code = (
                             script_code + "\n" +
@@ -978,6 +991,7 @@ class CustomResponse(LoncapaResponse):
                     return check_function
 
                 self.code = make_check_function(self.context['script_code'], cfn)
+                self.cfn = cfn
 
         if not self.code:
             if answer is None:
@@ -997,7 +1011,35 @@ class CustomResponse(LoncapaResponse):
         student_answers is a dict with everything from request.POST, but with the first part
         of each key removed (the string before the first "_").
         '''
+        submission = self._prepare_context(student_answers)
+        if isinstance(submission, CorrectMap):
+            return submission
+        idset, submission = submission
+
+        # Run the check function
+        self.execute_check_function(idset, submission)
+
+        # build map giving "correct"ness of the answer(s)
+        correct = self.context['correct']
+        messages = self.context['messages']
+        overall_message = self.clean_message_html(self.context['overall_message'])
+        correct_map = CorrectMap()
+        correct_map.set_overall_message(overall_message)
+
+        for k in range(len(idset)):
+            npoints = self.maxpoints[idset[k]] if correct[k] == 'correct' else 0
+            correct_map.set(idset[k], correct[k], msg=messages[k],
+                            npoints=npoints)
+        return correct_map
+
+    def _prepare_context(self, student_answers):
+        '''
+        Put student_answers in the context for the check function.
 
+        Returns the sorted list of answer ids and the list of answers for
+        them, or a CorrectMap if student_answers can be graded without
+        running the check function.
+        '''
         log.debug('%s: student_answers=%s' % (unicode(self), student_answers))
 
         # ordered list of answer id's
@@ -1070,21 +1112,30 @@ class CustomResponse(LoncapaResponse):
         # pass self.system.debug to cfn
         self.context['debug'] = self.system.DEBUG
 
-        # Run the check function
-        self.execute_check_function(idset, submission)
+        return idset, submission
 
-        # build map giving "correct"ness of the answer(s)
-        correct = self.context['correct']
-        messages = self.context['messages']
-        overall_message = self.clean_message_html(self.context['overall_message'])
-        correct_map = CorrectMap()
-        correct_map.set_overall_message(overall_message)
+    def _check_function_args(self, idset, submission):
+        '''
+        Return the answer and the keyword arguments to call the cfn check function with
+        '''
+        answer_given = submission[0] if (len(idset) == 1) else submission
+        kwnames = self.xml.get("cfn_extra_args", "").split()
+        kwargs = {n:self.context.get(n) for n in kwnames}
+        return answer_given, kwargs
 
-        for k in range(len(idset)):
-            npoints = self.maxpoints[idset[k]] if correct[k] == 'correct' else 0
-            correct_map.set(idset[k], correct[k], msg=messages[k],
-                            npoints=npoints)
-        return correct_map
+    def check_function_call(self, student_answers):
+        '''
+        Return the (expect, answer, kwargs) that grading student_answers calls
+        the cfn check function with, or None if it doesn't call one.  Used to
+        grade many submissions at once with run_check_function_batch.
+        '''
+        if self.cfn is None:
+            return None
+        submission = self._prepare_context(student_answers)
+        if isinstance(submission, CorrectMap):
+            return None
+        answer_given, kwargs = self._check_function_args(*submission)
+        return self.expect, answer_given, kwargs
 
     def execute_check_function(self, idset, submission):
         # exec the check function
@@ -1099,9 +1150,7 @@ class CustomResponse(LoncapaResponse):
 
             # this is an interface to the Tutor2 check functions
             fn = self.code
-            answer_given = submission[0] if (len(idset) == 1) else submission
-            kwnames = self.xml.get("cfn_extra_args", "").split()
-            kwargs = {n:self.context.get(n) for n in kwnames}
+            answer_given, kwargs = self._check_function_args(idset, submission)
             log.debug(" submission = %s" % submission)
             try:
                 ret = fn(self.expect, answer_given, **kwargs)
@@ -1226,6 +1275,96 @@ class CustomResponse(LoncapaResponse):
         _, _, traceback_obj = sys.exc_info()
         raise ResponseError, err.message, traceback_obj
 
+
+def check_function_call_key(expect, ans, kwargs):
+    '''
+    Identify a call to a cfn check function by its arguments
+    '''
+    return json.dumps([expect, ans, kwargs], sort_keys=True)
+
+
+# Code to call a cfn check function with each of a list of arguments, keeping
+# the traceback of any exception instead of stopping.  Each call runs the
+# script again, in globals of its own, as it would in a sandbox of its own, so
+# that calls can't see each other's changes to the script's globals.
+CHECK_FUNCTION_BATCH_CODE = """
+import traceback as cfn_traceback
+cfn_base_globals = dict(globals())
+cfn_code = compile(cfn_script, "<script>", "exec")
+cfn_results = []
+for cfn_expect, cfn_ans, cfn_kwargs in cfn_calls:
+    cfn_globals = dict(cfn_base_globals)
+    cfn_globals.update(cfn_kwargs)
+    cfn_globals.update(expect=cfn_expect, ans=cfn_ans)
+    try:
+        exec cfn_code in cfn_globals
+        cfn_results.append([None, cfn_globals[cfn_name](cfn_expect, cfn_ans, **cfn_kwargs)])
+    except Exception:
+        cfn_results.append([cfn_traceback.format_exc(), None])
+"""
+
+# The most check function calls to make in one sandboxed execution.  They all
+# share its CPU limit (codejail's LIMITS['CPU']), so a batch is cut short if
+# its calls average more than LIMITS['CPU'] / CHECK_FUNCTION_BATCH_SIZE
+# seconds, in which case its calls are made one per sandbox instead.
+CHECK_FUNCTION_BATCH_SIZE = 10
+
+
+def run_check_function_batch(responses_and_calls):
+    '''
+    Run many calls to the same cfn check function in a few sandboxed
+    executions (one per CHECK_FUNCTION_BATCH_SIZE calls), instead of one
+    execution per call.
+
+    responses_and_calls is a list of (response, call) pairs, where each
+    response is a CustomResponse with the same script code, check function
+    and python path, and call is the (expect, answer, kwargs) returned by its
+    check_function_call.  The result of each call is stored on its response,
+    to be used instead of running the check function when it grades the
+    same answer.
+
+    Returns a list with an (error message or None, return value) pair for
+    each call, or None in place of the pair for calls whose batch couldn't
+    be run, in which case their responses run the check function on their
+    own as usual.
+    '''
+    results = []
+    for start in xrange(0, len(responses_and_calls), CHECK_FUNCTION_BATCH_SIZE):
+        chunk = responses_and_calls[start:start + CHECK_FUNCTION_BATCH_SIZE]
+        chunk_results = _run_check_function_chunk(chunk)
+        if chunk_results is None:
+            chunk_results = [None] * len(chunk)
+        results.extend(chunk_results)
+    return results
+
+
+def _run_check_function_chunk(responses_and_calls):
+    '''
+    Run the calls in responses_and_calls (as for run_check_function_batch) in
+    one sandboxed execution, and return their results, or None if that failed
+    '''
+    response = responses_and_calls[0][0]
+    globals_dict = {
+        'cfn_script': response.context['script_code'],
+        'cfn_name': response.cfn,
+        'cfn_calls': [list(call) for _, call in responses_and_calls],
+    }
+    try:
+        safe_exec.safe_exec(CHECK_FUNCTION_BATCH_CODE, globals_dict,
+                            python_path=response.context['python_path'], slug=response.id)
+    except Exception:
+        log.warning("Couldn't run check function %s in a batch", response.cfn, exc_info=True)
+        return None
+
+    # If any return value isn't JSON-safe, cfn_results won't make it out of the sandbox
+    results = globals_dict.get('cfn_results')
+    if results is None:
+        return None
+
+    for (response, call), result in zip(responses_and_calls, results):
+        response.check_function_results[check_function_call_key(*call)] = tuple(result)
+    return [tuple(result) for result in results]
+
 #-----------------------------------------------------------------------------
 
 
@@ -1246,6 +1385,10 @@ class SymbolicResponse(CustomResponse):
         # Let CustomResponse do its setup
         super(SymbolicResponse, self).setup_response()
 
+    def check_function_call(self, student_answers):
+        # symmath_check runs outside of the sandbox, so there's nothing to batch
+        return None
+
     def execute_check_function(self, idset, submission):
         from symmath import symmath_check
         try:
@@ -1677,9 +1820,7 @@ class FormulaResponse(LoncapaResponse):
         self.correct_answer = contextualize_text(xml.get('answer'), context)
         self.samples = contextualize_text(xml.get('samples'), context)
         try:
-            self.tolerance_xml = xml.xpath(
-                '//*[@id=$id]//responseparam[@type="tolerance"]/@default',
-                id=xml.get('id'))[0]
+            self.tolerance_xml = xml.xpath('.//responseparam[@type="tolerance"]/@default')[0]
             self.tolerance = contextualize_text(self.tolerance_xml, context)
         except Exception:
             self.tolerance = '0.00001'
@@ -1712,52 +1853,91 @@ class FormulaResponse(LoncapaResponse):
                            samples.split('@')[1].split('#')[0].split(':')))
 
         ranges = dict(zip(variables, sranges))
+        sample_values = []
         for i in range(numsamples):
-            instructor_variables = self.strip_dict(dict(self.context))
-            student_variables = dict()
             # ranges give numerical ranges for testing
-            for var in ranges:
-                value = random.uniform(*ranges[var])
-                instructor_variables[str(var)] = value
-                student_variables[str(var)] = value
-            # log.debug('formula: instructor_vars=%s, expected=%s' %
-            # (instructor_variables,expected))
-            instructor_result = evaluator(instructor_variables, dict(),
-                                          expected, cs=self.case_sensitive)
-            try:
-                # log.debug('formula: student_vars=%s, given=%s' %
-                # (student_variables,given))
-                student_result = evaluator(student_variables,
-                                           dict(),
-                                           given,
-                                           cs=self.case_sensitive)
-            except UndefinedVariable as uv:
-                log.debug(
-                    'formularesponse: undefined variable in given=%s' % given)
-                raise StudentInputError(
-                    "Invalid input: " + uv.message + " not permitted in answer")
-            except ValueError as ve:
-                if 'factorial' in ve.message:
-                    # This is thrown when fact() or factorial() is used in a formularesponse answer
-                    #   that tests on negative and/or non-integer inputs
-                    # ve.message will be: `factorial() only accepts integral values` or `factorial() not defined for negative values`
-                    log.debug(
-                        'formularesponse: factorial function used in response that tests negative and/or non-integer inputs. given={0}'.format(given))
-                    raise StudentInputError(
-                        "factorial function not permitted in answer for this problem. Provided answer was: {0}".format(given))
-                # If non-factorial related ValueError thrown, handle it the same as any other Exception
-                log.debug('formularesponse: error {0} in formula'.format(ve))
-                raise StudentInputError("Invalid input: Could not parse '%s' as a formula" %
-                                        cgi.escape(given))
-            except Exception as err:
-                # traceback.print_exc()
-                log.debug('formularesponse: error %s in formula' % err)
-                raise StudentInputError("Invalid input: Could not parse '%s' as a formula" %
-                                        cgi.escape(given))
-            if not compare_with_tolerance(student_result, instructor_result, self.tolerance):
+            sample_values.append(dict((str(var), random.uniform(*ranges[var])) for var in ranges))
+
+        # Evaluate all of the samples at once, unless that hits an error, in which
+        # case check them one at a time so that the error is reported as before
+        try:
+            return self.check_formula_samples(expected, given, sample_values)
+        except Exception:
+            log.debug('formularesponse: falling back to checking one sample at a time')
+
+        for values in sample_values:
+            if not self.check_formula_sample(expected, given, values):
                 return "incorrect"
         return "correct"
 
+    def check_formula_samples(self, expected, given, sample_values):
+        '''
+        Check the formula for all of sample_values (a list of dicts of variable
+        values) at once, with one array evaluation of each expression.
+        Raises an error if the evaluation of any sample fails.
+        '''
+        if not sample_values:
+            return "correct"
+
+        instructor_variables = self.strip_dict(dict(self.context))
+        student_variables = dict()
+        for var in sample_values[0]:
+            values = numpy.array([sample[var] for sample in sample_values])
+            instructor_variables[var] = values
+            student_variables[var] = values
+
+        instructor_result = evaluate_samples(instructor_variables, dict(),
+                                             expected, cs=self.case_sensitive)
+        student_result = evaluate_samples(student_variables, dict(),
+                                          given, cs=self.case_sensitive)
+        if compare_with_tolerance(student_result, instructor_result, self.tolerance):
+            return "correct"
+        return "incorrect"
+
+    def check_formula_sample(self, expected, given, values):
+        '''
+        Check the formula for one sample of variable values. Returns whether
+        the student's answer is within tolerance.
+        '''
+        instructor_variables = self.strip_dict(dict(self.context))
+        instructor_variables.update(values)
+        student_variables = dict(values)
+        # log.debug('formula: instructor_vars=%s, expected=%s' %
+        # (instructor_variables,expected))
+        instructor_result = evaluator(instructor_variables, dict(),
+                                      expected, cs=self.case_sensitive)
+        try:
+            # log.debug('formula: student_vars=%s, given=%s' %
+            # (student_variables,given))
+            student_result = evaluator(student_variables,
+                                       dict(),
+                                       given,
+                                       cs=self.case_sensitive)
+        except UndefinedVariable as uv:
+            log.debug(
+                'formularesponse: undefined variable in given=%s' % given)
+            raise StudentInputError(
+                "Invalid input: " + uv.message + " not permitted in answer")
+        except ValueError as ve:
+            if 'factorial' in ve.message:
+                # This is thrown when fact() or factorial() is used in a formularesponse answer
+                #   that tests on negative and/or non-integer inputs
+                # ve.message will be: `factorial() only accepts integral values` or `factorial() not defined for negative values`
+                log.debug(
+                    'formularesponse: factorial function used in response that tests negative and/or non-integer inputs. given={0}'.format(given))
+                raise StudentInputError(
+                    "factorial function not permitted in answer for this problem. Provided answer was: {0}".format(given))
+            # If non-factorial related ValueError thrown, handle it the same as any other Exception
+            log.debug('formularesponse: error {0} in formula'.format(ve))
+            raise StudentInputError("Invalid input: Could not parse '%s' as a formula" %
+                                    cgi.escape(given))
+        except Exception as err:
+            # traceback.print_exc()
+            log.debug('formularesponse: error %s in formula' % err)
+            raise StudentInputError("Invalid input: Could not parse '%s' as a formula" %
+                                    cgi.escape(given))
+        return compare_with_tolerance(student_result, instructor_result, self.tolerance)
+
     def strip_dict(self, d):
         ''' Takes a dict. Returns an identical dict, with all non-word
         keys and all non-numeric values stripped out. All values also
@@ -1799,7 +1979,7 @@ class SchematicResponse(LoncapaResponse):
 
     def setup_response(self):
         xml = self.xml
-        answer = xml.xpath('//*[@id=$id]//answer', id=xml.get('id'))[0]
+        answer = xml.xpath('.//answer')[0]
         answer_src = answer.get('src')
         if answer_src is not None:
             # Untested; never used
@@ -2028,6 +2208,10 @@ class AnnotationResponse(LoncapaResponse):
         correct_points = scoring.get('correct')
         return dict([(inputfield.get('id'), correct_points) for inputfield in self.inputfields])
 
+    @classmethod
+    def get_static_max_score(cls, inputfields):
+        return cls.default_scoring.get('correct') * len(inputfields)
+
     def _find_options(self, inputfield):
         ''' Returns an array of dicts where each dict represents an option. '''
         elements = inputfield.findall('./options/option')
@@ -0,0 +1,176 @@
+"""
+A two-tier store of the results of running capa problems' scripts.
+
+A problem's <script> code only depends on the code and the random seed, and the
+number of seeds a problem can have is capped (see MAX_RANDOMIZATION_BINS in
+capa_module), so the set of possible script contexts is small. Keeping them
+means most problem instantiations don't need to run the sandbox at all.
+"""
+
+import copy
+import hashlib
+import os
+import time
+
+from lru_cache import LRUCache
+from codejail.safe_exec import json_safe, SafeExecException
+from statsd import statsd
+
+from .safe_exec import safe_exec
+
+# Maximum number of script contexts to keep in each process
+LOCAL_CONTEXT_STORE_SIZE = 1000
+
+# Seconds for which the signature of a python_path directory is reused, rather
+# than walking the directory again (see path_signature)
+PATH_SIGNATURE_TTL = 60
+
+
+class ContextStore(object):
+    """
+    Results of running scripts, kept in a least-recently-used store in this
+    process, in front of an optional shared cache (e.g. memcached) with
+    .get(key) and .set(key, value) methods.
+    """
+    def __init__(self, size):
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self._results = LRUCache(size)
+
+    @staticmethod
+    def key(code, python_path, random_seed):
+        """
+        Return the key for the results of running code with python_path and random_seed.
+
+        The key covers the names, sizes and modification times of the files
+        in the python_path directories, so that replacing e.g. a course's
+        python_lib.zip gives new keys (within PATH_SIGNATURE_TTL seconds).
+        """
+        md5er = hashlib.md5()
+        md5er.update(code.encode('utf-8') if isinstance(code, unicode) else code)
+        md5er.update(repr(python_path))
+        for path in python_path or ():
+            md5er.update(path_signature(path))
+        return "capa.script_context.%r.%s" % (random_seed, md5er.hexdigest())
+
+    def execute(self, code, globals_dict, random_seed, python_path=None, cache=None, slug=None):
+        """
+        Run code with safe_exec, or reuse the results of running it before.
+
+        This is only correct for code whose results depend on nothing but the
+        code, python_path and random_seed: globals_dict must be the same every
+        time the same code is run with the same seed.
+
+        `cache` is the shared cache to use as well as the one in this process,
+        if any. The other arguments are as for safe_exec.
+        """
+        key = self.key(code, python_path, random_seed)
+
+        result = self._results.get(key)
+        if result is not None:
+            self.local_hits += 1
+            statsd.increment('capa.script_context.hit', tags=['tier:local'])
+        elif cache:
+            result = cache.get(key)
+            if result is not None:
+                self.shared_hits += 1
+                statsd.increment('capa.script_context.hit', tags=['tier:shared'])
+                self._results.set(key, result)
+
+        if result is not None:
+            # We have stored results.  They are a pair: the exception
+            # message, if any, else None; and the resulting globals dictionary.
+            # Callers modify the context, so give them their own copy.
+            emsg, cleaned_results = result
+            globals_dict.update(copy.deepcopy(cleaned_results))
+            if emsg:
+                raise SafeExecException(emsg)
+            return
+
+        self.misses += 1
+        statsd.increment('capa.script_context.miss')
+
+        error = None
+        try:
+            safe_exec(code, globals_dict, random_seed=random_seed, python_path=python_path, slug=slug)
+        except SafeExecException as err:
+            error = err
+
+        result = (error.message if error else None, copy.deepcopy(json_safe(globals_dict)))
+        self._results.set(key, result)
+        if cache:
+            cache.set(key, result)
+
+        if error:
+            raise error
+
+    def clear(self):
+        """
+        Drop all of the results stored in this process
+        """
+        self._results.clear()
+
+    def stats(self):
+        """
+        Return a dict of the counters for this store
+        """
+        lookups = self.local_hits + self.shared_hits + self.misses
+        return {
+            'size': len(self._results),
+            'local_hits': self.local_hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'hit_rate': float(self.local_hits + self.shared_hits) / lookups if lookups else 0.0,
+        }
+
+
+# path -> (time the signature was computed, signature), for path_signature
+_path_signatures = {}
+
+
+def path_signature(path):
+    """
+    Return a digest of the names, sizes and modification times of the files
+    under the directory path, or of path itself if it's a file.
+
+    Every problem with a script computes this for each of its python_path
+    directories, so it's only recomputed once it's PATH_SIGNATURE_TTL seconds
+    old, not on every call.
+    """
+    now = time.time()
+    cached = _path_signatures.get(path)
+    if cached is not None and now - cached[0] < PATH_SIGNATURE_TTL:
+        return cached[1]
+
+    signature = hashlib.md5(repr(_list_files(path))).hexdigest()
+    _path_signatures[path] = (now, signature)
+    return signature
+
+
+def _list_files(path):
+    """
+    Return a sorted list of (file name, size, modification time) for the
+    files under the directory path, or for path itself if it's a file
+    """
+    if not os.path.isdir(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return []
+        return [(path, stat.st_size, stat.st_mtime)]
+
+    files = []
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            filepath = os.path.join(dirpath, filename)
+            try:
+                stat = os.stat(filepath)
+            except OSError:
+                continue
+            files.append((os.path.relpath(filepath, path), stat.st_size, stat.st_mtime))
+    files.sort()
+    return files
+
+
+context_store = ContextStore(LOCAL_CONTEXT_STORE_SIZE)
@@ -3,6 +3,7 @@
 from codejail.safe_exec import safe_exec as codejail_safe_exec
 from codejail.safe_exec import json_safe, SafeExecException
 from . import lazymod
+from . import sandbox_pool
 from statsd import statsd
 
 import hashlib
@@ -113,10 +114,22 @@ def safe_exec(code, globals_dict, random_seed=None, python_path=None, cache=None
 
     # Run the code!  Results are side effects in globals_dict.
     try:
-        codejail_safe_exec(
-            code_prolog + LAZY_IMPORTS + code, globals_dict,
-            python_path=python_path, slug=slug,
-        )
+        # The pool's processes have the assumed imports already imported, but
+        # can't have anything else added to their path.
+        pool = sandbox_pool.sandbox_pool
+        ran = False
+        if pool.enabled() and not python_path:
+            try:
+                pool.safe_exec(code_prolog + code, globals_dict, slug=slug)
+                ran = True
+            except sandbox_pool.SandboxPoolSaturated:
+                # Every pool process is busy: start a sandbox just for this.
+                pass
+        if not ran:
+            codejail_safe_exec(
+                code_prolog + LAZY_IMPORTS + code, globals_dict,
+                python_path=python_path, slug=slug,
+            )
     except SafeExecException as e:
         emsg = e.message
     else:
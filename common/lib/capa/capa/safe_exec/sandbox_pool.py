@@ -0,0 +1,418 @@
+"""
+A pool of pre-started, warm sandbox processes for capa's safe_exec.
+
+Running code with codejail starts a new sandboxed Python for every execution,
+which then has to import numpy, scipy and the rest of the assumed imports
+before it can do any work.  The pool keeps a number of sandboxed Pythons
+running with those modules already imported, and sends each execution to an
+idle one.
+
+By default each process runs only one piece of code and is then replaced, so
+no state (modules, builtins, files) can leak from one execution into another:
+executions still skip the process start and the imports.  Each process runs
+in a session of its own, in a temporary directory of its own, with codejail's
+rlimits applied.
+"""
+
+import errno
+import json
+import logging
+import os
+import Queue
+import resource
+import select
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+
+from codejail import jail_code
+from codejail.safe_exec import json_safe, SafeExecException
+from statsd import statsd
+
+from . import sandbox_worker
+
+log = logging.getLogger(__name__)
+
+# We pass the worker program to the sandboxed Python with -c, so read it now.
+sandbox_worker_py_file = sandbox_worker.__file__
+if sandbox_worker_py_file.endswith("c"):
+    sandbox_worker_py_file = sandbox_worker_py_file[:-1]
+
+sandbox_worker_py = open(sandbox_worker_py_file).read()
+
+
+class SandboxPoolSaturated(Exception):
+    """
+    Raised when no pool process became idle within the queue timeout.
+    """
+    pass
+
+
+class SandboxWorkerError(Exception):
+    """
+    Raised when a pool process died, timed out, or replied with nonsense.
+    """
+    pass
+
+
+class SandboxWorker(object):
+    """
+    One running sandbox_worker process.
+    """
+    def __init__(self, cmdline, user=None, assumed_imports=(), max_executions=1):
+        # Like codejail, run in a directory of our own, readable by the sandbox
+        # user, with a world-writable tmp directory in it.
+        self.homedir = tempfile.mkdtemp(prefix="sandbox-pool-")
+        os.chmod(self.homedir, 0775)
+        tmpdir = os.path.join(self.homedir, "tmp")
+        os.mkdir(tmpdir)
+        os.chmod(tmpdir, 0777)
+
+        cmd = []
+        if user:
+            cmd.extend(['sudo', '-u', user, 'TMPDIR=tmp'])
+        cmd.extend(cmdline)
+        cmd.extend(['-c', sandbox_worker_py])
+
+        cpu = jail_code.LIMITS.get("CPU")
+        self.user = user
+        self.executions = 0
+        self._buffer = ''
+        self._devnull = open(os.devnull, 'w')
+        self.process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=self._devnull,
+            cwd=self.homedir, env={'TMPDIR': 'tmp'}, close_fds=True,
+            preexec_fn=lambda: set_process_limits(max_executions),
+        )
+        self._send({"imports": [list(imp) for imp in assumed_imports], "cpu": cpu})
+
+    def _send(self, message):
+        try:
+            self.process.stdin.write(json.dumps(message) + "\n")
+            self.process.stdin.flush()
+        except IOError as err:
+            raise SandboxWorkerError("Couldn't write to sandbox process: %s" % err)
+
+    def _receive(self, timeout):
+        """
+        Read one message, waiting at most `timeout` seconds for it
+        (or forever if `timeout` is None)
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        fd = self.process.stdout.fileno()
+        while "\n" not in self._buffer:
+            remaining = None if deadline is None else deadline - time.time()
+            if remaining is not None and remaining <= 0:
+                raise SandboxWorkerError("timed out")
+            try:
+                readable, _, _ = select.select([fd], [], [], remaining)
+            except select.error as err:
+                if err.args[0] == errno.EINTR:
+                    continue
+                raise
+            if not readable:
+                raise SandboxWorkerError("timed out")
+            data = os.read(fd, 65536)
+            if not data:
+                raise SandboxWorkerError("sandbox process exited")
+            self._buffer += data
+
+        line, self._buffer = self._buffer.split("\n", 1)
+        try:
+            return json.loads(line)
+        except ValueError:
+            raise SandboxWorkerError("Bad reply from sandbox process: %r" % line[:100])
+
+    def wait_until_ready(self, timeout):
+        """
+        Wait for the process to finish importing the assumed imports.
+        """
+        if self._receive(timeout) != "ready":
+            raise SandboxWorkerError("Bad reply from sandbox process")
+
+    def execute(self, code, globals_dict, timeout):
+        """
+        Run `code` with `globals_dict`, as codejail's safe_exec would.
+
+        Returns a pair: the exception traceback, if any, else None; and the
+        resulting JSON-safe globals.
+        """
+        self.executions += 1
+        self._send({"code": code, "globals": json_safe(globals_dict)})
+        reply = self._receive(timeout)
+        if "error" in reply:
+            return reply["error"], {}
+        return None, reply["globals"]
+
+    def is_alive(self):
+        return self.process.poll() is None
+
+    def kill(self):
+        """
+        Stop the process, whatever it's doing.
+        """
+        try:
+            self.process.stdin.close()
+        except IOError:
+            pass
+        # The process leads a session of its own (see set_process_limits):
+        # kill everything in it, including any processes the code started.
+        if self.user:
+            # The sandboxed Python runs as another user, under sudo.
+            subprocess.call(["sudo", "pkill", "-9", "-s", str(self.process.pid)])
+        else:
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except OSError:
+                pass
+        if self.is_alive():
+            try:
+                self.process.kill()
+            except OSError:
+                pass
+        self.process.wait()
+        self._devnull.close()
+        shutil.rmtree(self.homedir, ignore_errors=True)
+
+
+def set_process_limits(max_executions):
+    """
+    Set codejail's limits on a pool process, which is about to run
+    `max_executions` executions.
+
+    As in codejail, the process starts a session of its own, so that it can
+    be killed with all of its children, and can't start processes or write
+    files (unless FSIZE is set).  The CPU limit is set for the whole life of
+    the process, allowing for the imports, and tightened before each
+    execution by the process itself.  The real-time limit is enforced by the
+    pool.
+    """
+    os.setsid()
+
+    resource.setrlimit(resource.RLIMIT_NPROC, (0, 0))
+
+    cpu = jail_code.LIMITS.get("CPU")
+    if cpu:
+        # A process gets as much CPU time for its imports as for an execution.
+        budget = cpu * (max_executions + 1)
+        resource.setrlimit(resource.RLIMIT_CPU, (budget, budget + 1))
+
+    vmem = jail_code.LIMITS.get("VMEM")
+    if vmem:
+        resource.setrlimit(resource.RLIMIT_AS, (vmem, vmem))
+
+    fsize = jail_code.LIMITS.get("FSIZE", 0)
+    resource.setrlimit(resource.RLIMIT_FSIZE, (fsize, fsize))
+
+
+class SandboxPool(object):
+    """
+    A fixed-size pool of SandboxWorkers.
+
+    `size` is the number of processes to keep running, 0 to disable the pool.
+
+    `max_executions` is the number of executions after which a process is
+    replaced by a new one.  Code can leave state behind in a process for
+    the next code run in it, so anything other than 1 trades away isolation
+    between executions, which may be from different students and courses.
+
+    `timeout` is the number of seconds an execution can take before its
+    process is killed.  By default, codejail's REALTIME (or else CPU) limit.
+
+    `queue_timeout` is the number of seconds to wait for an idle process
+    before giving up with SandboxPoolSaturated.
+
+    `cmdline` is the command to start a Python with, by default the one
+    configured for codejail.  Setting it runs the pool outside of the sandbox,
+    which is only meant for tests.
+    """
+    def __init__(self, size=0, max_executions=1, timeout=None, queue_timeout=1.0,
+                 startup_timeout=30.0, cmdline=None, assumed_imports=()):
+        self.size = size
+        self.max_executions = max_executions
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.startup_timeout = startup_timeout
+        self.cmdline = cmdline
+        self.assumed_imports = assumed_imports
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._idle = None
+        self._missing = 0
+        self.busy = 0
+
+    def enabled(self):
+        return self.size > 0 and (self.cmdline is not None or jail_code.is_configured("python"))
+
+    def _execution_timeout(self):
+        if self.timeout is not None:
+            return self.timeout
+        return jail_code.LIMITS.get("REALTIME") or jail_code.LIMITS.get("CPU") or None
+
+    def _start_worker(self):
+        if self.cmdline is not None:
+            cmdline, user = self.cmdline, None
+        else:
+            command = jail_code.COMMANDS["python"]
+            cmdline, user = command['cmdline_start'], command['user']
+        return SandboxWorker(cmdline, user=user, assumed_imports=self.assumed_imports,
+                             max_executions=self.max_executions)
+
+    def _add_worker(self, idle):
+        """
+        Start a new process and add it to `idle` once it's ready.
+        """
+        try:
+            worker = self._start_worker()
+            try:
+                worker.wait_until_ready(self.startup_timeout)
+            except SandboxWorkerError:
+                worker.kill()
+                raise
+        except Exception:
+            log.exception("Couldn't start a sandbox pool process")
+            statsd.increment('capa.safe_exec.pool.start_failed')
+            with self._lock:
+                if idle is self._idle:
+                    self._missing += 1
+        else:
+            idle.put(worker)
+
+    def _replenish(self):
+        """
+        Start processes in the background to replace any that were lost.
+        Called with the lock held.
+        """
+        while self._missing:
+            self._missing -= 1
+            thread = threading.Thread(target=self._add_worker, args=(self._idle,))
+            thread.daemon = True
+            thread.start()
+
+    def start(self):
+        """
+        Start the pool's processes in this process.
+
+        Processes started by a parent process before a fork (e.g. by a
+        preloading gunicorn master) can't be used, so a pool is started
+        lazily, once per OS process.  Does nothing if the pool is already
+        running in this process.
+        """
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._idle = Queue.Queue()
+            self._missing = self.size
+            self.busy = 0
+            self._replenish()
+
+    def stop(self):
+        """
+        Kill all of the idle processes, and forget the busy ones.
+        """
+        with self._lock:
+            idle, self._idle, self._pid = self._idle, None, None
+        while idle is not None:
+            try:
+                idle.get_nowait().kill()
+            except Queue.Empty:
+                break
+
+    def _acquire(self):
+        self.start()
+        with self._lock:
+            self._replenish()
+            idle = self._idle
+
+        start = time.time()
+        try:
+            worker = idle.get(timeout=self.queue_timeout)
+        except Queue.Empty:
+            statsd.increment('capa.safe_exec.pool.saturated')
+            raise SandboxPoolSaturated()
+        finally:
+            statsd.histogram('capa.safe_exec.pool.wait_time', (time.time() - start) * 1000)
+
+        with self._lock:
+            self.busy += 1
+            statsd.gauge('capa.safe_exec.pool.busy', self.busy)
+        return idle, worker
+
+    def _release(self, idle, worker, reason=None):
+        """
+        Put `worker` back in the pool, or replace it if it should be recycled
+        for `reason` or its number of executions.
+        """
+        if reason is None and worker.executions >= self.max_executions:
+            reason = 'executions'
+        if reason is None and not worker.is_alive():
+            reason = 'died'
+
+        with self._lock:
+            self.busy -= 1
+            current = idle is self._idle
+
+        if reason is None and current:
+            idle.put(worker)
+            return
+
+        worker.kill()
+        if current:
+            statsd.increment('capa.safe_exec.pool.recycled', tags=['reason:%s' % reason])
+            with self._lock:
+                self._missing += 1
+                self._replenish()
+
+    def safe_exec(self, code, globals_dict, slug=None):
+        """
+        Execute code in a pool process, with the same effects as codejail's safe_exec.
+
+        Raises SandboxPoolSaturated if no process became idle in time, in
+        which case the code has not been run.
+        """
+        idle, worker = self._acquire()
+        try:
+            emsg, results = worker.execute(code, globals_dict, self._execution_timeout())
+        except SandboxWorkerError as err:
+            log.warning("Sandbox pool process failed running %s: %s", slug, err)
+            self._release(idle, worker, reason='failed')
+            raise SafeExecException("Couldn't execute jailed code: %s" % err)
+        except:
+            self._release(idle, worker, reason='failed')
+            raise
+        self._release(idle, worker)
+
+        if emsg:
+            raise SafeExecException("Couldn't execute jailed code: %s" % emsg)
+        globals_dict.update(results)
+
+    def stats(self):
+        """
+        Return a dict of the pool's current state
+        """
+        return {
+            'size': self.size,
+            'busy': self.busy,
+            'idle': self._idle.qsize() if self._idle is not None else 0,
+        }
+
+
+sandbox_pool = SandboxPool()
+
+
+def configure(**kwargs):
+    """
+    Replace the module's sandbox pool with one configured with `kwargs`,
+    as for SandboxPool.  The new pool starts when it's first used.
+    """
+    global sandbox_pool
+    from .safe_exec import ASSUMED_IMPORTS
+    kwargs.setdefault('assumed_imports', ASSUMED_IMPORTS)
+    old_pool, sandbox_pool = sandbox_pool, SandboxPool(**kwargs)
+    old_pool.stop()
@@ -0,0 +1,94 @@
+"""
+The program run by each process in capa's sandbox pool.
+
+This is not imported: its source is passed to the sandboxed Python with -c, so
+it can only use the standard library.  It reads one JSON message per line on
+stdin, and writes one JSON message per line on stdout:
+
+    - first, {"imports": ..., "cpu": ...}: a list of [name, module name] pairs
+      to import, to which it replies "ready" once they are imported, and the
+      CPU seconds each execution may use,
+    - then any number of {"code": ..., "globals": ...} requests, to which it
+      replies {"globals": ...} with the JSON-safe globals after running the
+      code, or {"error": ...} with the traceback if the code raised an exception.
+
+It exits when stdin is closed.
+"""
+
+import json
+import math
+import os
+import resource
+import sys
+import traceback
+
+
+def jsonable(value):
+    try:
+        json.dumps(value)
+    except Exception:
+        return False
+    else:
+        return True
+
+
+def main():
+    # Keep the real stdout for our replies, and send anything the code prints
+    # to stderr instead.
+    replies = os.fdopen(os.dup(1), "w")
+    os.dup2(2, 1)
+
+    def reply(message):
+        replies.write(json.dumps(message) + "\n")
+        replies.flush()
+
+    def limit_cpu(seconds):
+        # The process's CPU limit covers its whole life: allow `seconds` more,
+        # within the limit the pool set.
+        soft, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        limit = int(math.ceil(usage.ru_utime + usage.ru_stime)) + seconds
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        resource.setrlimit(resource.RLIMIT_CPU, (limit, hard))
+
+    setup = json.loads(sys.stdin.readline())
+    preloaded = {}
+    for name, modname in setup["imports"]:
+        try:
+            __import__(modname)
+        except Exception:
+            # Code using this module will fail just as it would have if the
+            # module were imported lazily.
+            continue
+        preloaded[name] = sys.modules[modname]
+
+    random_module = __import__("random")
+    reply("ready")
+
+    while True:
+        line = sys.stdin.readline()
+        if not line:
+            break
+        request = json.loads(line)
+
+        if setup["cpu"]:
+            limit_cpu(setup["cpu"])
+        g_dict = dict(preloaded)
+        g_dict.update(request["globals"])
+        try:
+            exec compile(request["code"], "jailed_code", "exec", 0, True) in g_dict
+        except Exception:
+            reply({"error": traceback.format_exc()})
+        else:
+            reply({"globals": dict(
+                (k, v) for k, v in g_dict.iteritems()
+                if k != "__builtins__" and jsonable(v)
+            )})
+        finally:
+            # The capa prolog replaces the random module with a seeded instance.
+            sys.modules["random"] = random_module
+
+
+if __name__ == "__main__":
+    main()
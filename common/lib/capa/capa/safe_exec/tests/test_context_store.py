@@ -0,0 +1,95 @@
+"""Test context_store.py"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from capa.safe_exec.context_store import ContextStore, PATH_SIGNATURE_TTL
+from codejail.safe_exec import SafeExecException
+from mock import patch
+
+from test_safe_exec import DictCache
+
+
+class TestContextStore(unittest.TestCase):
+
+    def setUp(self):
+        self.store = ContextStore(10)
+
+    def test_local_hit(self):
+        code = "a = random.randint(0, 999)"
+        g = {'seed': 17}
+        self.store.execute(code, g, random_seed=17)
+
+        h = {'seed': 17}
+        self.store.execute(code, h, random_seed=17)
+        self.assertEqual(g, h)
+        self.assertEqual(1, self.store.stats()['misses'])
+        self.assertEqual(1, self.store.stats()['local_hits'])
+
+    def test_seed_is_part_of_key(self):
+        code = "a = random.randint(0, 999)"
+        self.store.execute(code, {}, random_seed=17)
+        self.store.execute(code, {}, random_seed=18)
+        self.assertEqual(2, self.store.stats()['misses'])
+
+    def test_shared_hit(self):
+        cache = {}
+        self.store.execute("a = 17", {}, random_seed=1, cache=DictCache(cache))
+        self.assertEqual(1, len(cache))
+
+        other_store = ContextStore(10)
+        g = {}
+        other_store.execute("a = 17", g, random_seed=1, cache=DictCache(cache))
+        self.assertEqual(17, g['a'])
+        self.assertEqual(1, other_store.stats()['shared_hits'])
+
+    def test_results_are_copied(self):
+        g = {}
+        self.store.execute("a = [1]", g, random_seed=1)
+        g['a'].append(2)
+
+        h = {}
+        self.store.execute("a = [1]", h, random_seed=1)
+        self.assertEqual([1], h['a'])
+
+    def test_exceptions_are_stored(self):
+        with self.assertRaises(SafeExecException):
+            self.store.execute("1/0", {}, random_seed=1)
+        with self.assertRaises(SafeExecException):
+            self.store.execute("1/0", {}, random_seed=1)
+        self.assertEqual(1, self.store.stats()['local_hits'])
+
+    def test_evicts_least_recently_used(self):
+        store = ContextStore(1)
+        store.execute("a = 1", {}, random_seed=1)
+        store.execute("a = 2", {}, random_seed=1)
+        store.execute("a = 1", {}, random_seed=1)
+        self.assertEqual(3, store.stats()['misses'])
+
+    def test_python_path_files_are_part_of_key(self):
+        lib = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, lib)
+        with open(os.path.join(lib, "python_lib.zip"), "w") as zipfile:
+            zipfile.write("old")
+        key = ContextStore.key("a = 1", [lib], 1)
+        self.assertEqual(key, ContextStore.key("a = 1", [lib], 1))
+
+        # replacing the file changes the key, even with the same size, once
+        # the directory's signature has expired
+        with open(os.path.join(lib, "python_lib.zip"), "w") as zipfile:
+            zipfile.write("new")
+        os.utime(os.path.join(lib, "python_lib.zip"), (0, 0))
+        self.assertEqual(key, ContextStore.key("a = 1", [lib], 1))
+        with patch('time.time', return_value=time.time() + PATH_SIGNATURE_TTL):
+            self.assertNotEqual(key, ContextStore.key("a = 1", [lib], 1))
+
+    def test_python_path_not_walked_every_time(self):
+        lib = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, lib)
+        ContextStore.key("a = 1", [lib], 1)
+        with patch('os.walk') as mock_walk:
+            ContextStore.key("a = 1", [lib], 2)
+        self.assertFalse(mock_walk.called)
@@ -0,0 +1,164 @@
+"""Test sandbox_pool.py"""
+
+import os
+import random
+import sys
+import time
+import unittest
+
+from capa.safe_exec.safe_exec import ASSUMED_IMPORTS, CODE_PROLOG
+from capa.safe_exec.sandbox_pool import SandboxPool, SandboxPoolSaturated, SandboxWorkerError
+from codejail.safe_exec import SafeExecException
+
+
+def live_processes_in_session(sid):
+    """
+    Return the pids of the processes, other than zombies, in session `sid`
+    """
+    pids = []
+    for pid in os.listdir('/proc'):
+        try:
+            with open('/proc/%s/stat' % pid) as stat_file:
+                # pid (comm) state ppid pgrp session ...
+                fields = stat_file.read().rsplit(')', 1)[1].split()
+        except (IOError, IndexError):
+            continue
+        if fields[0] != 'Z' and int(fields[3]) == sid:
+            pids.append(int(pid))
+    return pids
+
+
+class TestSandboxPool(unittest.TestCase):
+    """
+    These run the pool's processes with this Python, outside of the sandbox.
+    """
+    def make_pool(self, **kwargs):
+        kwargs.setdefault('size', 2)
+        kwargs.setdefault('cmdline', [sys.executable])
+        kwargs.setdefault('assumed_imports', [("math", "math")])
+        pool = SandboxPool(**kwargs)
+        self.addCleanup(pool.stop)
+        return pool
+
+    def test_disabled_by_default(self):
+        self.assertFalse(SandboxPool().enabled())
+
+    def test_set_values(self):
+        pool = self.make_pool()
+        g = {'b': 2}
+        pool.safe_exec("a = 15 + b", g)
+        self.assertEqual(g, {'a': 17, 'b': 2})
+
+    def test_assumed_imports(self):
+        pool = self.make_pool()
+        g = {}
+        pool.safe_exec("a = int(math.pi)", g)
+        self.assertEqual(g['a'], 3)
+
+    def test_capa_prolog(self):
+        pool = self.make_pool(size=1)
+        r = random.Random(17)
+        rnums = [r.randint(0, 999) for _ in xrange(10)]
+        code = "import random\nrnums = [random.randint(0, 999) for _ in xrange(10)]\na = 1/2\n"
+
+        # The seeded random module doesn't leak into the next execution.
+        for seed in [17, 18, 17]:
+            g = {}
+            pool.safe_exec(CODE_PROLOG % seed + code, g)
+            self.assertEqual(g['a'], 0.5)
+            self.assertEqual(g['rnums'] == rnums, seed == 17)
+
+    def test_raising_exceptions(self):
+        pool = self.make_pool()
+        with self.assertRaises(SafeExecException) as cm:
+            pool.safe_exec("1/0", {})
+        self.assertIn("ZeroDivisionError", cm.exception.message)
+
+        # The process is still usable.
+        g = {}
+        pool.safe_exec("a = 1", g)
+        self.assertEqual(g['a'], 1)
+
+    def test_printing_doesnt_break_replies(self):
+        pool = self.make_pool()
+        g = {}
+        pool.safe_exec("print 'hello'\na = 1", g)
+        self.assertEqual(g['a'], 1)
+
+    def test_isolated_by_default(self):
+        pool = self.make_pool(size=1)
+        g1, g2 = {}, {}
+        pool.safe_exec("import os, __builtin__\n__builtin__.leak = 1\npid, cwd = os.getpid(), os.getcwd()", g1)
+        pool.safe_exec("import os\npid, cwd = os.getpid(), os.getcwd()\nleaked = 'leak' in dir(__builtins__)", g2)
+        self.assertNotEqual(g1['pid'], g2['pid'])
+        self.assertNotEqual(g1['cwd'], g2['cwd'])
+        self.assertFalse(g2['leaked'])
+        # The first process's directory was removed with it.
+        self.assertFalse(os.path.exists(g1['cwd']))
+
+    def test_recycling(self):
+        pool = self.make_pool(size=1, max_executions=2)
+        pids = []
+        for _ in xrange(4):
+            g = {}
+            pool.safe_exec("import os\npid = os.getpid()", g)
+            pids.append(g['pid'])
+        self.assertEqual(pids[0], pids[1])
+        self.assertNotEqual(pids[1], pids[2])
+        self.assertEqual(pids[2], pids[3])
+
+    def test_timeout(self):
+        pool = self.make_pool(size=1, timeout=0.5, queue_timeout=10)
+        with self.assertRaises(SafeExecException) as cm:
+            pool.safe_exec("while True: pass", {})
+        self.assertIn("timed out", cm.exception.message)
+
+        # The stuck process was replaced.
+        g = {}
+        pool.safe_exec("a = 1", g)
+        self.assertEqual(g['a'], 1)
+
+    def test_cpu_limit(self):
+        # codejail's CPU limit applies to each execution.
+        pool = self.make_pool(size=1, timeout=30, queue_timeout=10)
+        start = time.time()
+        with self.assertRaises(SafeExecException):
+            pool.safe_exec("while True: pass", {})
+        self.assertLess(time.time() - start, 10)
+
+    def test_timeout_kills_children(self):
+        pool = self.make_pool(size=1, queue_timeout=10)
+        idle, worker = pool._acquire()
+        code = (
+            "import os, time\n"
+            "try:\n"
+            "    if os.fork() == 0:\n"
+            "        if os.fork() == 0:\n"
+            "            time.sleep(60)\n"
+            "        os._exit(0)\n"
+            "except OSError:\n"
+            "    pass\n"
+            "time.sleep(60)\n"
+        )
+        with self.assertRaises(SandboxWorkerError):
+            worker.execute(code, {}, 0.5)
+        pool._release(idle, worker, reason='failed')
+        # Nothing is left running in the process's session.
+        self.assertEqual(live_processes_in_session(worker.process.pid), [])
+
+    def test_saturation(self):
+        pool = self.make_pool(size=1, queue_timeout=0.1)
+        idle, worker = pool._acquire()
+        try:
+            with self.assertRaises(SandboxPoolSaturated):
+                pool.safe_exec("a = 1", {})
+        finally:
+            pool._release(idle, worker)
+        self.assertEqual(pool.stats()['busy'], 0)
+
+    def test_all_assumed_imports(self):
+        # Modules that can't be imported don't stop the process starting.
+        pool = self.make_pool(size=1, assumed_imports=ASSUMED_IMPORTS + [("nope", "no.such.module")])
+        g = {}
+        pool.safe_exec("a = int(math.pi)", g)
+        self.assertEqual(g['a'], 3)
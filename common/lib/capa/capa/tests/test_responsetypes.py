@@ -13,11 +13,14 @@ import mock
 
 from . import new_loncapa_problem, test_system
 
+from capa import safe_exec
+from capa.capa_problem import grade_answers_batch
 from capa.responsetypes import LoncapaProblemError, \
     StudentInputError, ResponseError
 from capa.correctmap import CorrectMap
 from capa.util import convert_files_to_filenames
 from capa.xqueue_interface import dateformat
+from codejail.safe_exec import SafeExecException
 
 
 class ResponseTest(unittest.TestCase):
@@ -568,6 +571,19 @@ class FormulaResponseTest(ResponseTest):
         input_dict = {'1_2_1': '1/0'}
         self.assertRaises(StudentInputError, problem.grade_answers, input_dict)
 
+    def test_raises_zero_division_err_for_sample(self):
+        """
+        See if division by zero for a sampled variable raises an error,
+        even though all of the samples are evaluated at once.
+        """
+        sample_dict = {'x': (0, 0)}
+        problem = self.build_problem(sample_dict=sample_dict,
+                                     num_samples=10,
+                                     tolerance="1%",
+                                     answer="x")
+        input_dict = {'1_2_1': '1/x'}
+        self.assertRaises(StudentInputError, problem.grade_answers, input_dict)
+
 
 class StringResponseTest(ResponseTest):
     from response_xml_factory import StringResponseXMLFactory
@@ -1188,6 +1204,86 @@ class CustomResponseTest(ResponseTest):
         with self.assertRaises(ResponseError):
             problem.grade_answers({'1_2_1': '42'})
 
+    def test_grade_answers_batch(self):
+        script = textwrap.dedent("""
+            def check_func(expect, answer_given):
+                if answer_given == "oops":
+                    raise Exception("Test")
+                return {'ok': answer_given == expect, 'msg': 'Message text'}
+            """)
+
+        problems = [self.build_problem(script=script, cfn="check_func", expect="42") for _ in range(3)]
+        answers = [{'1_2_1': '42'}, {'1_2_1': '0'}, {'1_2_1': '42'}]
+
+        # One sandboxed execution grades all of the answers
+        with mock.patch('capa.responsetypes.safe_exec.safe_exec', wraps=safe_exec.safe_exec) as mock_exec:
+            correct_maps = grade_answers_batch(problems, answers)
+        self.assertEqual(mock_exec.call_count, 1)
+
+        self.assertEqual([cmap.get_correctness('1_2_1') for cmap in correct_maps],
+                         ['correct', 'incorrect', 'correct'])
+        self.assertEqual(correct_maps[1].get_msg('1_2_1'), "Message text")
+        self.assertEqual(problems[1].get_score()['score'], 0)
+
+        # An exception in the check function only affects its own answer
+        problems = [self.build_problem(script=script, cfn="check_func", expect="42") for _ in range(2)]
+        with self.assertRaises(ResponseError):
+            grade_answers_batch(problems, [{'1_2_1': '42'}, {'1_2_1': 'oops'}])
+        self.assertEqual(problems[0].correct_map.get_correctness('1_2_1'), 'correct')
+
+    def test_grade_answers_batch_resets_globals(self):
+        # Each call sees the script's globals as they were after the script
+        # ran, and its own arguments, as it would in a sandbox of its own
+        script = textwrap.dedent("""
+            calls = []
+            answer_length = len(ans)
+            def check_func(expect, answer_given):
+                calls.append(answer_given)
+                return len(calls) == 1 and answer_length == len(answer_given)
+            """)
+
+        problems = [self.build_problem(script=script, cfn="check_func", expect="42") for _ in range(3)]
+        with mock.patch('capa.responsetypes.safe_exec.safe_exec', wraps=safe_exec.safe_exec) as mock_exec:
+            correct_maps = grade_answers_batch(problems, [{'1_2_1': '42'}, {'1_2_1': '7'}, {'1_2_1': '100'}])
+        self.assertEqual(mock_exec.call_count, 1)
+        self.assertEqual([cmap.get_correctness('1_2_1') for cmap in correct_maps], ['correct'] * 3)
+
+    @mock.patch('capa.responsetypes.CHECK_FUNCTION_BATCH_SIZE', 2)
+    def test_grade_answers_batch_chunks(self):
+        script = textwrap.dedent("""
+            def check_func(expect, answer_given):
+                return answer_given == expect
+            """)
+
+        problems = [self.build_problem(script=script, cfn="check_func", expect="42") for _ in range(5)]
+        with mock.patch('capa.responsetypes.safe_exec.safe_exec', wraps=safe_exec.safe_exec) as mock_exec:
+            correct_maps = grade_answers_batch(problems, [{'1_2_1': '42'}] * 5)
+        self.assertEqual(mock_exec.call_count, 3)
+        self.assertEqual([cmap.get_correctness('1_2_1') for cmap in correct_maps], ['correct'] * 5)
+
+    def test_grade_answers_batch_falls_back(self):
+        # If the batch can't be run (e.g. it runs out of CPU time), each
+        # problem is graded on its own
+        script = textwrap.dedent("""
+            def check_func(expect, answer_given):
+                return answer_given == expect
+            """)
+
+        problems = [self.build_problem(script=script, cfn="check_func", expect="42") for _ in range(2)]
+        side_effects = [SafeExecException("Couldn't execute jailed code"),
+                        safe_exec.safe_exec, safe_exec.safe_exec]
+
+        def exec_or_fail(*args, **kwargs):
+            effect = side_effects.pop(0)
+            if isinstance(effect, Exception):
+                raise effect
+            return effect(*args, **kwargs)
+
+        with mock.patch('capa.responsetypes.safe_exec.safe_exec', side_effect=exec_or_fail) as mock_exec:
+            correct_maps = grade_answers_batch(problems, [{'1_2_1': '42'}, {'1_2_1': '42'}])
+        self.assertEqual(mock_exec.call_count, 3)
+        self.assertEqual([cmap.get_correctness('1_2_1') for cmap in correct_maps], ['correct', 'correct'])
+
     def test_script_exception_inline(self):
 
         # Construct a script that will raise an exception
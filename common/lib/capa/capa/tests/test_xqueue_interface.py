@@ -0,0 +1,127 @@
+"""Test xqueue_interface.py"""
+
+import json
+import threading
+import unittest
+
+import requests
+from mock import Mock, patch
+
+from capa.xqueue_interface import XQueueInterface
+
+
+def xreply(return_code=0, content='Success!', status_code=200):
+    """
+    A response from xqueue
+    """
+    return Mock(status_code=status_code, text=json.dumps({'return_code': return_code, 'content': content}))
+
+
+class TestXQueueInterface(unittest.TestCase):
+
+    def make_interface(self, replies, **kwargs):
+        kwargs.setdefault('backoff', 0)
+        xqueue = XQueueInterface('http://xqueue', {'username': 'lms', 'password': 'secret'}, **kwargs)
+        xqueue.session = Mock()
+        xqueue.session.post.side_effect = replies
+        return xqueue
+
+    def test_send(self):
+        xqueue = self.make_interface([xreply()])
+        self.assertEqual(xqueue.send_to_queue('header', 'body'), (0, 'Success!'))
+        url, = xqueue.session.post.call_args[0]
+        self.assertEqual(url, 'http://xqueue/xqueue/submit/')
+        self.assertEqual(xqueue.in_flight(), 0)
+
+    def test_login_required(self):
+        xqueue = self.make_interface([xreply(1, 'login_required'), xreply(), xreply()])
+        self.assertEqual(xqueue.send_to_queue('header', 'body'), (0, 'Success!'))
+        urls = [call[0][0] for call in xqueue.session.post.call_args_list]
+        self.assertEqual(urls, ['http://xqueue/xqueue/submit/', 'http://xqueue/xqueue/login/',
+                                'http://xqueue/xqueue/submit/'])
+
+    def test_retries_connection_errors(self):
+        xqueue = self.make_interface([requests.exceptions.ConnectionError(),
+                                      xreply(status_code=502), xreply()], retries=2)
+        with patch('capa.xqueue_interface.time.sleep') as sleep:
+            self.assertEqual(xqueue.send_to_queue('header', 'body'), (0, 'Success!'))
+        self.assertEqual(xqueue.session.post.call_count, 3)
+        self.assertEqual(sleep.call_count, 2)
+
+    def test_doesnt_retry_rejections(self):
+        xqueue = self.make_interface([xreply(1, 'invalid queue name')], retries=2)
+        self.assertEqual(xqueue.send_to_queue('header', 'body'), (1, 'invalid queue name'))
+        self.assertEqual(xqueue.session.post.call_count, 1)
+
+    def test_gives_up(self):
+        xqueue = self.make_interface([requests.exceptions.Timeout()] * 2, retries=1)
+        error, msg = xqueue.send_to_queue('header', 'body')
+        self.assertEqual(error, 1)
+        self.assertIn('timed out', msg)
+
+    def test_send_timeout(self):
+        clock = [0]
+
+        def slow_timeout(*args, **kwargs):
+            clock[0] += kwargs['timeout']
+            raise requests.exceptions.Timeout()
+
+        def sleep(seconds):
+            clock[0] += seconds
+
+        xqueue = self.make_interface(slow_timeout, retries=2, backoff=1, timeout=10, send_timeout=12)
+        with patch('capa.xqueue_interface.time.time', lambda: clock[0]):
+            with patch('capa.xqueue_interface.time.sleep', sleep):
+                error, msg = xqueue.send_to_queue('header', 'body')
+        self.assertEqual(error, 1)
+        self.assertIn('timed out', msg)
+        # the retry only gets what's left after the first attempt and the
+        # backoff, and there's no time for a third attempt
+        timeouts = [call[1]['timeout'] for call in xqueue.session.post.call_args_list]
+        self.assertEqual(timeouts, [10, 1])
+        self.assertEqual(clock[0], 12)
+
+    def test_outbox(self):
+        outbox = Mock()
+        upload = Mock()
+        upload.name = 'answer.py'
+        upload.read.return_value = 'print 42'
+        xqueue = self.make_interface([requests.exceptions.ConnectionError()], outbox=outbox)
+
+        self.assertEqual(xqueue.send_to_queue('header', 'body', [upload]), (0, 'queued for delivery'))
+        outbox.put.assert_called_once_with('header', 'body', [('answer.py', 'print 42')])
+
+    def test_outbox_not_used_for_rejections(self):
+        outbox = Mock()
+        xqueue = self.make_interface([xreply(1, 'invalid queue name')], outbox=outbox)
+        self.assertEqual(xqueue.send_to_queue('header', 'body'), (1, 'invalid queue name'))
+        self.assertFalse(outbox.put.called)
+
+    def test_bounded_in_flight(self):
+        outbox = Mock()
+        sending = threading.Event()
+        release = threading.Event()
+
+        def slow_reply(*args, **kwargs):
+            sending.set()
+            release.wait()
+            return xreply()
+
+        xqueue = self.make_interface(slow_reply, max_in_flight=1, acquire_timeout=0.01, outbox=outbox)
+        thread = threading.Thread(target=xqueue.send_to_queue, args=('first', 'body'))
+        thread.start()
+        sending.wait()
+        try:
+            # The second submission doesn't wait for the first to be sent
+            self.assertEqual(xqueue.send_to_queue('second', 'body'), (0, 'queued for delivery'))
+            outbox.put.assert_called_once_with('second', 'body', [])
+        finally:
+            release.set()
+            thread.join()
+        self.assertEqual(xqueue.in_flight(), 0)
+
+    def test_deliver(self):
+        xqueue = self.make_interface([xreply()])
+        self.assertEqual(xqueue.deliver('header', 'body', [('answer.py', 'print 42')]), (0, 'Success!'))
+        files = xqueue.session.post.call_args[1]['files']
+        self.assertEqual(files['answer.py'].read(), 'print 42')
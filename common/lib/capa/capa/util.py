@@ -1,3 +1,5 @@
+import numpy
+
 from calc import evaluator, UndefinedVariable
 from cmath import isinf
 
@@ -10,11 +12,16 @@ def compare_with_tolerance(v1, v2, tol):
     ''' Compare v1 to v2 with maximum tolerance tol
     tol is relative if it ends in %; otherwise, it is absolute
 
-     - v1    :  student result (number)
-     - v2    :  instructor result (number)
+     - v1    :  student result (number, or numpy array of numbers)
+     - v2    :  instructor result (number, or numpy array of numbers)
      - tol   :  tolerance (string representing a number)
 
+    Arrays (e.g. of results for many samples) are compared elementwise,
+    and are only within tolerance if every element is.
     '''
+    if numpy.ndim(v1) or numpy.ndim(v2):
+        return compare_arrays_with_tolerance(numpy.asarray(v1), numpy.asarray(v2), tol)
+
     relative = tol.endswith('%')
     if relative:
         tolerance_rel = evaluator(dict(), dict(), tol[:-1]) * 0.01
@@ -31,6 +38,26 @@ def compare_with_tolerance(v1, v2, tol):
         return abs(v1 - v2) <= tolerance
 
 
+def compare_arrays_with_tolerance(v1, v2, tol):
+    ''' Vectorized version of compare_with_tolerance, for numpy arrays '''
+    relative = tol.endswith('%')
+    if relative:
+        tolerance_rel = evaluator(dict(), dict(), tol[:-1]) * 0.01
+        tolerance = tolerance_rel * numpy.maximum(abs(v1), abs(v2))
+    else:
+        tolerance = evaluator(dict(), dict(), tol)
+
+    # Infinite elements are compared directly, as in compare_with_tolerance,
+    # so ignore the invalid `inf - inf` for them
+    with numpy.errstate(invalid='ignore'):
+        within_tolerance = numpy.where(
+            numpy.isinf(v1) | numpy.isinf(v2),
+            v1 == v2,
+            abs(v1 - v2) <= tolerance
+        )
+    return bool(numpy.all(within_tolerance))
+
+
 def contextualize_text(text, context):  # private
     ''' Takes a string with variables. E.g. $a+$b.
     Does a substitution of those variables from the context '''
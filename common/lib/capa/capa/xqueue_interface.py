@@ -4,12 +4,23 @@
 import hashlib
 import json
 import logging
+import threading
+import time
+
+from StringIO import StringIO
+
 import requests
+from statsd import statsd
 
 
 log = logging.getLogger(__name__)
 dateformat = '%Y%m%d%H%M%S'
 
+# Messages for failures to reach xqueue, which are worth trying again
+CONNECTION_ERROR_MSG = 'cannot connect to server'
+TIMEOUT_MSG = 'timed out waiting for server'
+SERVER_ERROR_MSG = 'server error'
+
 
 def make_hashkey(seed):
     '''
@@ -57,12 +68,42 @@ def parse_xreply(xreply):
 class XQueueInterface(object):
     '''
     Interface to the external grading system
+
+    Submissions are posted over a keep-alive session whose connection pool
+    holds pool_size connections.  At most max_in_flight submissions are sent
+    at once from a process; a submission that waits more than acquire_timeout
+    seconds for a slot isn't sent from the student's request.  Each post
+    times out after `timeout` seconds, and sending a submission from the
+    student's request, retries included, takes at most send_timeout seconds.
+    A submission that can't be delivered (no slot, or still failing after
+    `retries` retries spaced by exponential backoff, or when send_timeout is
+    up) is handed to `outbox`, if one is given, to be delivered later by a
+    drain worker calling `deliver`.
+
+    outbox: an object whose put(header, body, files) durably stores a
+        submission, where files is a list of (name, contents) pairs.
     '''
 
-    def __init__(self, url, django_auth, requests_auth=None):
+    def __init__(self, url, django_auth, requests_auth=None, pool_size=10, max_in_flight=None,
+                 acquire_timeout=0.5, retries=0, backoff=0.25, timeout=None, send_timeout=None,
+                 outbox=None):
         self.url  = url
         self.auth = django_auth
-        self.session = requests.session(auth=requests_auth)
+        self.session = requests.session(auth=requests_auth, config={
+            'keep_alive': True,
+            'pool_connections': 1,
+            'pool_maxsize': pool_size,
+        })
+        self.max_in_flight = max_in_flight or pool_size
+        self.acquire_timeout = acquire_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.send_timeout = send_timeout
+        self.outbox = outbox
+
+        self._in_flight = 0
+        self._in_flight_cond = threading.Condition()
 
     def send_to_queue(self, header, body, files_to_upload=None):
         """
@@ -77,32 +118,131 @@ class XQueueInterface(object):
 
         Returns (error_code, msg) where error_code != 0 indicates an error
         """
+        if not self._acquire():
+            statsd.increment('xqueue.submit.saturated')
+            return self._to_outbox(header, body, files_to_upload, 'too many submissions in flight')
+        try:
+            (error, msg) = self._send_with_retries(header, body, files_to_upload)
+        finally:
+            self._release()
+
+        if is_unreachable(error, msg):
+            return self._to_outbox(header, body, files_to_upload, msg)
+        return (error, msg)
+
+    def deliver(self, header, body, files=None):
+        """
+        Submit a request that was stored in the outbox, where files is a list
+        of (name, contents) pairs.  The request is tried once: the outbox
+        decides when to try again.
+
+        Returns (error_code, msg) where error_code != 0 indicates an error
+        """
+        files_to_upload = [NamedFile(name, contents) for name, contents in files or []]
+        return self._send_logged_in(header, body, files_to_upload)
+
+    def in_flight(self):
+        """
+        Return the number of submissions being sent by this process
+        """
+        return self._in_flight
+
+    def _acquire(self):
+        """
+        Wait up to acquire_timeout seconds for a slot to send a submission.
+        Returns whether one was taken.
+        """
+        start = time.time()
+        with self._in_flight_cond:
+            while self._in_flight >= self.max_in_flight:
+                remaining = start + self.acquire_timeout - time.time()
+                if remaining <= 0:
+                    return False
+                self._in_flight_cond.wait(remaining)
+            self._in_flight += 1
+            statsd.gauge('xqueue.submit.in_flight', self._in_flight)
+        statsd.histogram('xqueue.submit.wait_time', time.time() - start)
+        return True
+
+    def _release(self):
+        with self._in_flight_cond:
+            self._in_flight -= 1
+            self._in_flight_cond.notify()
+
+    def _send_with_retries(self, header, body, files_to_upload):
+        """
+        Send a submission, retrying failures to reach xqueue with exponential
+        backoff, for up to send_timeout seconds in all.  Answers from xqueue
+        itself aren't retried.
+        """
+        deadline = None
+        if self.send_timeout is not None:
+            deadline = time.time() + self.send_timeout
+        attempt = 0
+        while True:
+            start = time.time()
+            (error, msg) = self._send_logged_in(header, body, files_to_upload, deadline)
+            statsd.histogram('xqueue.submit.latency', time.time() - start,
+                             tags=['result:{0}'.format('error' if error else 'success')])
+            if not is_unreachable(error, msg) or attempt >= self.retries:
+                return (error, msg)
+
+            delay = self.backoff * 2 ** attempt
+            if deadline is not None and time.time() + delay >= deadline:
+                # no time left to try again
+                return (error, msg)
+
+            statsd.increment('xqueue.submit.retry')
+            time.sleep(delay)
+            attempt += 1
+            _rewind(files_to_upload)
+
+    def _send_logged_in(self, header, body, files_to_upload, deadline=None):
+        """
+        Send a submission, logging in to xqueue if it asks.  Gives up on
+        posts that would run past the time deadline, if there is one.
+        """
         # Attempt to send to queue
-        (error, msg) = self._send_to_queue(header, body, files_to_upload)
+        (error, msg) = self._send_to_queue(header, body, files_to_upload, deadline)
 
         # Log in, then try again
         if error and (msg == 'login_required'):
-            (error, content) = self._login()
+            (error, content) = self._login(deadline)
             if error != 0:
                 # when the login fails
                 log.debug("Failed to login to queue: %s", content)
                 return (error, content)
-            if files_to_upload is not None:
-                # Need to rewind file pointers
-                for f in files_to_upload:
-                    f.seek(0)
-            (error, msg) = self._send_to_queue(header, body, files_to_upload)
+            _rewind(files_to_upload)
+            (error, msg) = self._send_to_queue(header, body, files_to_upload, deadline)
 
         return (error, msg)
 
+    def _to_outbox(self, header, body, files_to_upload, reason):
+        """
+        Store a submission that couldn't be delivered in the outbox.  Returns
+        (error_code, msg) for send_to_queue: success if the submission is
+        stored, because it will be delivered later.
+        """
+        if self.outbox is None:
+            return (1, reason)
+        _rewind(files_to_upload)
+        files = [(f.name, f.read()) for f in files_to_upload or []]
+        try:
+            self.outbox.put(header, body, files)
+        except Exception:
+            log.exception("Couldn't store submission in the xqueue outbox")
+            return (1, reason)
+        log.warning("Submission stored in the xqueue outbox: %s", reason)
+        statsd.increment('xqueue.submit.outbox')
+        return (0, 'queued for delivery')
 
-    def _login(self):
+    def _login(self, deadline=None):
         payload = {'username': self.auth['username'],
                     'password': self.auth['password']}
-        return self._http_post(self.url + '/xqueue/login/', payload)
+        return self._http_post(self.url + '/xqueue/login/', payload, deadline=deadline)
 
 
-    def _send_to_queue(self, header, body, files_to_upload):
+    def _send_to_queue(self, header, body, files_to_upload, deadline=None):
         payload = {'xqueue_header': header,
                    'xqueue_body': body}
         files = {}
@@ -110,17 +250,55 @@ class XQueueInterface(object):
             for f in files_to_upload:
                 files.update({f.name: f})
 
-        return self._http_post(self.url + '/xqueue/submit/', payload, files=files)
+        return self._http_post(self.url + '/xqueue/submit/', payload, files=files, deadline=deadline)
 
 
-    def _http_post(self, url, data, files=None):
+    def _http_post(self, url, data, files=None, deadline=None):
+        timeout = self.timeout
+        if deadline is not None:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return (1, TIMEOUT_MSG)
+            timeout = remaining if timeout is None else min(timeout, remaining)
         try:
-            r = self.session.post(url, data=data, files=files)
+            r = self.session.post(url, data=data, files=files, timeout=timeout)
+        except requests.exceptions.Timeout, err:
+            log.error(err)
+            return (1, TIMEOUT_MSG)
         except requests.exceptions.ConnectionError, err:
             log.error(err)
-            return (1, 'cannot connect to server')
+            return (1, CONNECTION_ERROR_MSG)
 
+        if r.status_code >= 500:
+            return (1, SERVER_ERROR_MSG + ' [%d]' % r.status_code)
         if r.status_code not in [200]:
             return (1, 'unexpected HTTP status code [%d]' % r.status_code)
 
         return parse_xreply(r.text)
+
+
+
+class NamedFile(StringIO):
+    """
+    File of an outbox submission, named like the uploaded file it was read from
+    """
+    def __init__(self, name, contents):
+        StringIO.__init__(self, contents)
+        self.name = name
+
+
+def is_unreachable(error, msg):
+    """
+    Return whether an (error_code, msg) result means xqueue couldn't be
+    reached, rather than that it turned the submission down
+    """
+    return bool(error) and (msg in (CONNECTION_ERROR_MSG, TIMEOUT_MSG) or msg.startswith(SERVER_ERROR_MSG))
+
+
+def _rewind(files_to_upload):
+    """
+    Rewind file pointers before sending files again
+    """
+    if files_to_upload is not None:
+        for f in files_to_upload:
+            f.seek(0)
@@ -0,0 +1,85 @@
+"""
+A thread-safe, size-bounded, least-recently-used cache, for the in-process
+caches of calc, capa and xmodule.
+"""
+
+import threading
+
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    A dictionary-like cache that holds items whose weights add up to at most
+    `size`, discarding the least recently used items when it's full.  Items
+    weigh 1 unless set with another weight, so by default the cache holds at
+    most `size` items.  It is safe to share between threads.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> (value, weight)
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return the item cached for key, or None
+        """
+        with self._lock:
+            entry = self._items.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            # re-insert to mark as most recently used
+            self._items[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, weight=1):
+        """
+        Cache value for key.  Returns False, without caching it, if weight is
+        more than the whole size of the cache.
+        """
+        with self._lock:
+            entry = self._items.pop(key, None)
+            if entry is not None:
+                self.weight -= entry[1]
+            if weight > self.size:
+                return False
+            self._items[key] = (value, weight)
+            self.weight += weight
+            while self.weight > self.size:
+                _, (_, evicted_weight) = self._items.popitem(last=False)
+                self.weight -= evicted_weight
+                self.evictions += 1
+            return True
+
+    def delete(self, key):
+        """
+        Drop the item cached for key, returning whether there was one
+        """
+        with self._lock:
+            entry = self._items.pop(key, None)
+            if entry is None:
+                return False
+            self.weight -= entry[1]
+            return True
+
+    def keys(self):
+        """
+        Return a list of the keys of the cached items
+        """
+        with self._lock:
+            return self._items.keys()
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.weight = 0
+
+    def __len__(self):
+        return len(self._items)
@@ -0,0 +1,49 @@
+"""
+Unit tests for lru_cache.py
+"""
+
+import unittest
+
+from lru_cache import LRUCache
+
+
+class LRUCacheTest(unittest.TestCase):
+    """
+    Tests of LRUCache
+    """
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(len(cache), 2)
+
+    def test_delete(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        self.assertTrue(cache.delete('a'))
+        self.assertFalse(cache.delete('a'))
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.keys(), [])
+
+    def test_weights(self):
+        cache = LRUCache(5)
+        cache.set('a', 1, weight=2)
+        cache.set('b', 2, weight=2)
+        cache.set('c', 3, weight=2)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.weight, 4)
+
+        # an item heavier than the whole cache isn't cached
+        self.assertFalse(cache.set('d', 4, weight=6))
+        self.assertIsNone(cache.get('d'))
+        self.assertEqual(cache.keys(), ['b', 'c'])
+
+        cache.delete('b')
+        self.assertEqual(cache.weight, 2)
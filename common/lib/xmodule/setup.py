@@ -8,6 +8,7 @@ setup(
         'distribute',
         'docopt',
         'capa',
+        'lru_cache',
         'path.py',
     ],
     package_data={
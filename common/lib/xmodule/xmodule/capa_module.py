@@ -10,7 +10,7 @@ import sys
 
 from pkg_resources import resource_string
 
-from capa.capa_problem import LoncapaProblem
+from capa.capa_problem import LoncapaProblem, get_static_max_score
 from capa.responsetypes import StudentInputError,\
     ResponseError, LoncapaProblemError
 from capa.util import convert_files_to_filenames
@@ -107,6 +107,10 @@ class CapaFields(object):
         scope=Scope.settings
     )
     markdown = String(help="Markdown source of this module", scope=Scope.settings)
+    max_score_cache = Object(
+        help="Maximum score of this problem, computed when it is imported or published",
+        scope=Scope.settings
+    )
     source_code = String(
         help="Source code for LaTeX and Word problems. This feature is not well-supported.",
         scope=Scope.settings
@@ -920,6 +924,45 @@ class CapaDescriptor(CapaFields, RawDescriptor):
     metadata_translations = dict(RawDescriptor.metadata_translations)
     metadata_translations['attempts'] = 'max_attempts'
 
+    # max_score_cache is recomputed on import, so don't export it
+    metadata_to_strip = RawDescriptor.metadata_to_strip + ('max_score_cache',)
+
+    @classmethod
+    def from_xml(cls, xml_data, system, org=None, course=None):
+        descriptor = super(CapaDescriptor, cls).from_xml(xml_data, system, org, course)
+        # compute the max score at import, so that it is stored with the problem
+        descriptor.update_max_score_cache()
+        return descriptor
+
+    def update_max_score_cache(self):
+        """
+        Compute the max score of the problem from its xml, and store it in
+        max_score_cache. Returns the max score, or None if it can't be computed
+        without instantiating the problem.
+
+        This is only called when the problem is imported or published, which
+        are the only times the published xml changes.
+        """
+        try:
+            max_score = get_static_max_score(self.data or '')
+        except Exception:
+            log.warning("Failed to compute max score of {0}".format(self.location), exc_info=True)
+            max_score = None
+
+        self.max_score_cache = {'max_score': max_score}
+        return max_score
+
+    def max_score(self):
+        """
+        Return the max score of the problem stored when it was imported or
+        published, or None if there isn't one, in which case the problem must
+        be instantiated to find its max score.
+        """
+        cached = self.max_score_cache
+        if cached:
+            return cached.get('max_score')
+        return None
+
     def get_context(self):
         _context = RawDescriptor.get_context(self)
         _context.update({'markdown': self.markdown,
@@ -940,5 +983,6 @@ class CapaDescriptor(CapaFields, RawDescriptor):
     def non_editable_metadata_fields(self):
         non_editable_fields = super(CapaDescriptor, self).non_editable_metadata_fields
         non_editable_fields.extend([CapaDescriptor.due, CapaDescriptor.graceperiod,
-                                    CapaDescriptor.force_save_button, CapaDescriptor.markdown])
+                                    CapaDescriptor.force_save_button, CapaDescriptor.markdown,
+                                    CapaDescriptor.max_score_cache])
         return non_editable_fields
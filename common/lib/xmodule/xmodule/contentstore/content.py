@@ -13,8 +13,17 @@ from .django import contentstore
 from PIL import Image
 
 
+# Size of the chunks content is streamed in
+STREAM_DATA_CHUNK_SIZE = 1024 * 256
+
+
 class StaticContent(object):
-    def __init__(self, loc, name, content_type, data, last_modified_at=None, thumbnail_location=None, import_path=None):
+    # class defaults, for instances pickled (e.g. into the cache) before these attributes were added
+    _length = None
+    content_digest = None
+
+    def __init__(self, loc, name, content_type, data, last_modified_at=None, thumbnail_location=None, import_path=None,
+                 length=None, content_digest=None):
         self.location = loc
         self.name = name   # a display string which can be edited, and thus not part of the location which needs to be fixed
         self.content_type = content_type
@@ -24,6 +33,32 @@ class StaticContent(object):
         # optional information about where this file was imported from. This is needed to support import/export
         # cycles
         self.import_path = import_path
+        self._length = length
+        # a hash of the data (e.g. the md5 GridFS keeps), to tell versions of the content apart
+        self.content_digest = content_digest
+
+    @property
+    def length(self):
+        """
+        The size of the content's data, in bytes
+        """
+        if self._length is None:
+            return len(self.data)
+        return self._length
+
+    def stream_data(self, first=0, last=None):
+        """
+        Iterate over the data from byte `first` to byte `last` (inclusive; by
+        default the last byte), in chunks
+        """
+        end = self.length if last is None else last + 1
+        yield self.data[first:end]
+
+    def close(self):
+        """
+        Release anything held to read the data
+        """
+        pass
 
     @property
     def is_thumbnail(self):
@@ -81,6 +116,54 @@ class StaticContent(object):
         return StaticContent.get_url_path_from_location(loc)
 
 
+class StaticContentStream(StaticContent):
+    """
+    StaticContent whose data is read from a file-like object (e.g. a GridFS
+    file) as it is streamed, rather than held in memory.  `length` is
+    required.
+    """
+    def __init__(self, loc, name, content_type, stream, last_modified_at=None, thumbnail_location=None,
+                 import_path=None, length=None, content_digest=None):
+        super(StaticContentStream, self).__init__(loc, name, content_type, None, last_modified_at=last_modified_at,
+                                                  thumbnail_location=thumbnail_location, import_path=import_path,
+                                                  length=length, content_digest=content_digest)
+        self._stream = stream
+
+    def stream_data(self, first=0, last=None):
+        """
+        Iterate over the data from byte `first` to byte `last` (inclusive; by
+        default the last byte), reading it in chunks of
+        STREAM_DATA_CHUNK_SIZE.  The stream is closed once the iteration is
+        over (or abandoned).
+        """
+        try:
+            self._stream.seek(first)
+            remaining = (self.length if last is None else last + 1) - first
+            while remaining > 0:
+                chunk = self._stream.read(min(STREAM_DATA_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            self.close()
+
+    def close(self):
+        self._stream.close()
+
+    def copy_to_in_mem(self):
+        """
+        Read all the data, and return it as a StaticContent (which, unlike
+        this, can be pickled)
+        """
+        self._stream.seek(0)
+        content = StaticContent(self.location, self.name, self.content_type, self._stream.read(),
+                                last_modified_at=self.last_modified_at, thumbnail_location=self.thumbnail_location,
+                                import_path=self.import_path, length=self.length, content_digest=self.content_digest)
+        self.close()
+        return content
+
+
 class ContentStore(object):
     '''
     Abstraction for all ContentStore providers (e.g. MongoDB)
@@ -88,7 +171,7 @@ class ContentStore(object):
     def save(self, content):
         raise NotImplementedError
 
-    def find(self, filename):
+    def find(self, location, as_stream=False):
         raise NotImplementedError
 
     def get_all_content_for_course(self, location):
@@ -8,7 +8,7 @@ from xmodule.contentstore.content import XASSET_LOCATION_TAG
 
 import logging
 
-from .content import StaticContent, ContentStore
+from .content import StaticContent, StaticContentStream, ContentStore
 from xmodule.exceptions import NotFoundError
 from fs.osfs import OSFS
 import os
@@ -43,14 +43,28 @@ class MongoContentStore(ContentStore):
         if self.fs.exists({"_id": id}):
             self.fs.delete(id)
 
-    def find(self, location):
+    def find(self, location, as_stream=False):
+        """
+        Return the StaticContent at location.  With as_stream, it is a
+        StaticContentStream reading the data from GridFS as it is streamed,
+        which must be closed (e.g. by streaming it) when done with.
+        """
         id = StaticContent.get_id_from_location(location)
         try:
+            if as_stream:
+                fp = self.fs.get(id)
+                return StaticContentStream(
+                    location, fp.displayname, fp.content_type, fp, last_modified_at=fp.uploadDate,
+                    thumbnail_location=fp.thumbnail_location if hasattr(fp, 'thumbnail_location') else None,
+                    import_path=fp.import_path if hasattr(fp, 'import_path') else None,
+                    length=fp.length, content_digest=fp.md5
+                )
             with self.fs.get(id) as fp:
                 return StaticContent(location, fp.displayname, fp.content_type, fp.read(),
                                      fp.uploadDate,
                                      thumbnail_location=fp.thumbnail_location if hasattr(fp, 'thumbnail_location') else None,
-                                     import_path=fp.import_path if hasattr(fp, 'import_path') else None)
+                                     import_path=fp.import_path if hasattr(fp, 'import_path') else None,
+                                     length=fp.length, content_digest=fp.md5)
         except NoFile:
             raise NotFoundError()
 
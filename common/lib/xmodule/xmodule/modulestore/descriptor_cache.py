@@ -0,0 +1,81 @@
+"""
+A process-local, size-bounded cache of loaded XModuleDescriptors, for modulestores
+whose course structure changes much less often than it is read.
+"""
+
+from lru_cache import LRUCache
+
+
+class DescriptorCache(object):
+    """
+    A least-recently-used cache of descriptors, keyed by course id and an
+    arbitrary key within the course (e.g. a location url and load depth).
+
+    Every entry records the edit version of its course at the time it was
+    loaded, and is only returned to callers asking for that same version, so
+    that edits made by other processes are picked up as soon as the course
+    version changes.
+    """
+    def __init__(self, max_size):
+        """
+        max_size: the maximum number of descriptors to keep, counting all of
+            the descriptors loaded with each cached one (e.g. every descendent
+            of a course cached with depth=None)
+        """
+        self.max_size = max_size
+        self._entries = LRUCache(max_size)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, course_id, key, version):
+        """
+        Return the descriptor cached for key in course_id at the specified
+        course version, or None if there isn't one
+        """
+        entry = self._entries.get((course_id, key))
+        if entry is None or entry[0] != version:
+            if entry is not None:
+                # loaded at an older version, so it won't be needed again
+                self._entries.delete((course_id, key))
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return entry[1]
+
+    def set(self, course_id, key, version, descriptor, size=1):
+        """
+        Cache descriptor for key in course_id, as loaded at the specified course
+        version, along with size descriptors in all (itself included). It isn't
+        cached if size is more than max_size.
+        """
+        self._entries.set((course_id, key), (version, descriptor), size)
+
+    def invalidate_course(self, course_id):
+        """
+        Drop all of the cached descriptors for course_id
+        """
+        for entry_key in self._entries.keys():
+            if entry_key[0] == course_id and self._entries.delete(entry_key):
+                self.invalidations += 1
+
+    def clear(self):
+        """
+        Drop all of the cached descriptors
+        """
+        self._entries.clear()
+
+    def stats(self):
+        """
+        Return a dict of the counters for this cache
+        """
+        return {
+            'size': self._entries.weight,
+            'entries': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self._entries.evictions,
+            'invalidations': self.invalidations,
+        }
@@ -194,6 +194,9 @@ class DraftModuleStore(ModuleStoreBase):
 
         draft.cms.published_date = datetime.utcnow()
         draft.cms.published_by = published_by_id
+        # problems store their max score, so it can be graded without instantiating them
+        if hasattr(draft, 'update_max_score_cache'):
+            draft.update_max_score_cache()
         super(DraftModuleStore, self).update_item(location, draft._model_data._kvs._data)
         super(DraftModuleStore, self).update_children(location, draft._model_data._kvs._children)
         super(DraftModuleStore, self).update_metadata(location, own_metadata(draft))
@@ -238,3 +241,16 @@ class DraftModuleStore(ModuleStoreBase):
             queried_children.append(value)
 
         return queried_children
+
+    def _wrap_child_item(self, item):
+        """
+        Return item with the draft semantics that get_item gives it
+        """
+        return wrap_draft(item)
+
+    def _child_item(self, structure, location):
+        """
+        Return the draft of the child at location, if it has one, since the semantics
+        of the DraftStore is to always return the draft - if available
+        """
+        return structure.get(as_draft(location), structure.get(location))
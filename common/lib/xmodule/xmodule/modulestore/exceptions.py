@@ -21,3 +21,7 @@ class NoPathToItem(Exception):
 
 class DuplicateItemError(Exception):
     pass
+
+
+class ReadOnlyItemError(Exception):
+    pass
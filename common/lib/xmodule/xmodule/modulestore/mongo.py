@@ -2,6 +2,7 @@ import pymongo
 import sys
 import logging
 import copy
+import threading
 
 from collections import namedtuple
 from fs.osfs import OSFS
@@ -19,9 +20,11 @@ from xblock.runtime import DbModel, KeyValueStore, InvalidScopeError
 from xblock.core import Scope
 
 from . import ModuleStoreBase, Location, namedtuple_to_son
-from .draft import DraftModuleStore
+from .descriptor_cache import DescriptorCache
+from .parent_index import ParentIndex
+from .draft import DraftModuleStore, DRAFT
 from .exceptions import (ItemNotFoundError,
-                         DuplicateItemError)
+                         DuplicateItemError, ReadOnlyItemError)
 from .inheritance import own_metadata, INHERITABLE_METADATA, inherit_metadata
 
 log = logging.getLogger(__name__)
@@ -46,6 +49,8 @@ class MongoKeyValueStore(KeyValueStore):
         self._data = data
         self._children = children
         self._metadata = metadata
+        # Set for descriptors that are shared between callers, e.g. by the descriptor cache
+        self.read_only = False
 
     def get(self, key):
         if key.scope == Scope.children:
@@ -63,6 +68,8 @@ class MongoKeyValueStore(KeyValueStore):
             raise InvalidScopeError(key.scope)
 
     def set(self, key, value):
+        if self.read_only:
+            raise ReadOnlyItemError(key.field_name)
         if key.scope == Scope.children:
             self._children = value
         elif key.scope == Scope.settings:
@@ -76,6 +83,8 @@ class MongoKeyValueStore(KeyValueStore):
             raise InvalidScopeError(key.scope)
 
     def delete(self, key):
+        if self.read_only:
+            raise ReadOnlyItemError(key.field_name)
         if key.scope == Scope.children:
             self._children = []
         elif key.scope == Scope.settings:
@@ -114,7 +123,8 @@ class CachingDescriptorSystem(MakoDescriptorSystem):
     references to metadata_inheritance_tree
     """
     def __init__(self, modulestore, module_data, default_class, resources_fs,
-                 error_tracker, render_template, cached_metadata=None):
+                 error_tracker, render_template, cached_metadata=None, read_only=False,
+                 course_structures=None):
         """
         modulestore: the module store that can be used to retrieve additional modules
 
@@ -130,6 +140,15 @@ class CachingDescriptorSystem(MakoDescriptorSystem):
 
         render_template: a function for rendering templates, as per
             MakoDescriptorSystem
+
+        read_only: if True, the fields of the descriptors loaded can't be changed
+
+        course_structures: if not None, a dict mapping (org, course) -> the
+            structure of that course (as returned by
+            MongoModuleStore._query_course_structure), which is filled in the
+            first time an item of the course isn't found in module_data, and is
+            then used for all of the items of the course that aren't. It can be
+            shared between systems that load items from the same courses.
         """
         super(CachingDescriptorSystem, self).__init__(self.load_item, resources_fs,
                                                       error_tracker, render_template)
@@ -140,6 +159,27 @@ class CachingDescriptorSystem(MakoDescriptorSystem):
         # define an attribute here as well, even though it's None
         self.course_id = None
         self.cached_metadata = cached_metadata
+        self.read_only = read_only
+        self.course_structures = course_structures
+
+    def _course_item(self, location):
+        """
+        Returns the item data that should be loaded for location, found in the
+        structure of its course, or None if there isn't any. The structure is
+        fetched in a single query the first time it's needed.
+        """
+        if self.course_structures is None:
+            return None
+        course_key = (location.org, location.course)
+        if course_key not in self.course_structures:
+            self.course_structures[course_key] = self.modulestore._query_course_structure(location)
+        item = self.modulestore._child_item(self.course_structures[course_key], location)
+        if item is None:
+            return None
+        # the structure is shared, so clean a copy of the item data
+        item = dict(item)
+        self.modulestore._clean_item_data(item)
+        return item
 
     def load_item(self, location):
         """
@@ -148,6 +188,12 @@ class CachingDescriptorSystem(MakoDescriptorSystem):
         location = Location(location)
         json_data = self.module_data.get(location)
         if json_data is None:
+            json_data = self._course_item(location)
+            if json_data is not None:
+                item_location = Location(json_data['location'])
+                self.module_data[item_location] = json_data
+                return self.modulestore._wrap_child_item(self.load_item(item_location))
+
             module = self.modulestore.get_item(location)
             if module is not None:
                 # update our own cache after going to the DB to get cache miss
@@ -181,6 +227,7 @@ class CachingDescriptorSystem(MakoDescriptorSystem):
                     non_draft_loc = location._replace(revision=None)
                     metadata_to_inherit = self.cached_metadata.get(non_draft_loc.url(), {})
                     inherit_metadata(module, metadata_to_inherit)
+                kvs.read_only = self.read_only
                 return module
             except:
                 log.warning("Failed to load descriptor", exc_info=True)
@@ -213,6 +260,120 @@ def location_to_query(location, wildcard=True):
 
 metadata_cache_key = attrgetter('org', 'course')
 
+# Categories of items that can have children, and so are the only items that
+# contribute to the metadata inheritance tree. Note that when we add new
+# categories of containers, we have to add them here.
+INHERITANCE_CONTAINER_CATEGORIES = ('course', 'chapter', 'sequential', 'vertical',
+                                    'wrapper', 'problemset', 'conditional', 'randomize')
+
+# Bump this when the format of the persisted metadata inheritance documents
+# changes, so that documents written in an older format are recomputed
+INHERITANCE_DOCUMENT_FORMAT = 1
+
+
+def _collate_inheritance_records(records):
+    """
+    Returns (results_by_url, root), where results_by_url maps the url of each of the
+    container records (as returned by a query for the inheritable metadata)
+    to a copy of the record, and root is the url of the course.
+    """
+    results_by_url = {}
+    root = None
+
+    # now go through the results and order them by the location url
+    for result in copy.deepcopy(records):
+        location = Location(result['_id'])
+        # We need to collate between draft and non-draft
+        # i.e. draft verticals can have children which are not in non-draft versions
+        location = location._replace(revision=None)
+        location_url = location.url()
+        if location_url in results_by_url:
+            existing_children = results_by_url[location_url].get('definition', {}).get('children', [])
+            additional_children = result.get('definition', {}).get('children', [])
+            total_children = existing_children + additional_children
+            if 'definition' not in results_by_url[location_url]:
+                results_by_url[location_url]['definition'] = {}
+            results_by_url[location_url]['definition']['children'] = total_children
+        results_by_url[location.url()] = result
+        if location.category == 'course':
+            root = location.url()
+
+    return results_by_url, root
+
+
+def _compute_inherited_metadata(results_by_url, url, metadata_to_inherit):
+    """
+    Helper method for computing inherited metadata for a specific location url,
+    and recording it for all of its descendents in metadata_to_inherit
+    """
+    # check for presence of metadata key. Note that a given module may not yet be fully formed.
+    # example: update_item -> update_children -> update_metadata sequence on new item create
+    # if we get called here without update_metadata called first then 'metadata' hasn't been set
+    # as we're not fully transactional at the DB layer. Same comment applies to below key name
+    # check
+    my_metadata = results_by_url[url].get('metadata', {})
+
+    # go through all the children and recurse, but only if we have
+    # in the result set. Remember results will not contain leaf nodes
+    for child in results_by_url[url].get('definition', {}).get('children', []):
+        if child in results_by_url:
+            new_child_metadata = copy.deepcopy(my_metadata)
+            new_child_metadata.update(results_by_url[child].get('metadata', {}))
+            results_by_url[child]['metadata'] = new_child_metadata
+            metadata_to_inherit[child] = new_child_metadata
+            _compute_inherited_metadata(results_by_url, child, metadata_to_inherit)
+        else:
+            # this is likely a leaf node, so let's record what metadata we need to inherit
+            metadata_to_inherit[child] = my_metadata
+
+
+def compute_inheritance_tree(records):
+    """
+    Compute the metadata inheritance tree (a dict mapping location url to the
+    metadata inherited by that location) from the container records of a course
+    """
+    results_by_url, root = _collate_inheritance_records(records)
+
+    # now traverse the tree and compute down the inherited metadata
+    metadata_to_inherit = {}
+    if root is not None:
+        _compute_inherited_metadata(results_by_url, root, metadata_to_inherit)
+
+    return metadata_to_inherit
+
+
+def update_inheritance_subtree(records, tree, location):
+    """
+    Update the metadata inheritance tree `tree` in place, after the metadata of
+    the container at `location` has changed, by recomputing only the subtree
+    rooted at that container. records are the container records of the course,
+    including the changed one.
+    """
+    results_by_url, root = _collate_inheritance_records(records)
+    url = Location(location)._replace(revision=None).url()
+
+    if url == root or url not in results_by_url:
+        return compute_inheritance_tree(records)
+
+    for parent_url, parent in results_by_url.iteritems():
+        if url in parent.get('definition', {}).get('children', []):
+            break
+    else:
+        # The container isn't attached to the course (yet), so nothing inherits from it
+        return tree
+
+    if parent_url == root:
+        parent_metadata = results_by_url[root].get('metadata', {})
+    else:
+        parent_metadata = tree.get(parent_url, {})
+
+    my_metadata = copy.deepcopy(parent_metadata)
+    my_metadata.update(results_by_url[url].get('metadata', {}))
+    results_by_url[url]['metadata'] = my_metadata
+    tree[url] = my_metadata
+    _compute_inherited_metadata(results_by_url, url, tree)
+    return tree
+
 
 class MongoModuleStore(ModuleStoreBase):
     """
@@ -224,7 +385,8 @@ class MongoModuleStore(ModuleStoreBase):
                  port=27017, default_class=None,
                  error_tracker=null_error_tracker,
                  user=None, password=None, request_cache=None,
-                 metadata_inheritance_cache_subsystem=None, **kwargs):
+                 metadata_inheritance_cache_subsystem=None,
+                 descriptor_cache_size=0, **kwargs):
 
         ModuleStoreBase.__init__(self)
 
@@ -240,6 +402,14 @@ class MongoModuleStore(ModuleStoreBase):
         # Force mongo to report errors, at the expense of performance
         self.collection.safe = True
 
+        # Per-course metadata inheritance trees, kept up to date by writes to the course
+        self.inheritance_collection = self.collection['inheritance']
+        self.inheritance_collection.safe = True
+
+        # Per-course edit versions, bumped on every write to the course
+        self.versions_collection = self.collection['versions']
+        self.versions_collection.safe = True
+
         # Force mongo to maintain an index over _id.* that is in the same order
         # that is used when querying by a location
         self.collection.ensure_index(
@@ -258,17 +428,25 @@ class MongoModuleStore(ModuleStoreBase):
         self.request_cache = request_cache
         self.metadata_inheritance_cache_subsystem = metadata_inheritance_cache_subsystem
 
-    def compute_metadata_inheritance_tree(self, location):
-        '''
-        TODO (cdodge) This method can be deleted when the 'split module store' work has been completed
-        '''
+        # The descriptors returned from the descriptor cache are shared between callers, so
+        # are read-only: it should only be enabled for stores whose callers don't modify them (e.g. the LMS)
+        self.descriptor_cache = None
+        if descriptor_cache_size:
+            self.descriptor_cache = DescriptorCache(descriptor_cache_size)
 
+        # Per-course ParentIndex of the courses whose parents have been looked up
+        self._parent_indexes = {}
+        self._parent_index_lock = threading.Lock()
+
+    def _inheritance_query(self, location):
+        """
+        Returns (query, record_filter) to find the container records of the course
+        containing location, with just the data needed for metadata inheritance
+        """
         # get all collections in the course, this query should not return any leaf nodes
-        # note this is a bit ugly as when we add new categories of containers, we have to add it here
         query = {'_id.org': location.org,
                  '_id.course': location.course,
-                 '_id.category': {'$in': ['course', 'chapter', 'sequential', 'vertical',
-                                          'wrapper', 'problemset', 'conditional', 'randomize']}
+                 '_id.category': {'$in': list(INHERITANCE_CONTAINER_CATEGORIES)}
                  }
         # we just want the Location, children, and inheritable metadata
         record_filter = {'_id': 1, 'definition.children': 1}
@@ -278,61 +456,76 @@ class MongoModuleStore(ModuleStoreBase):
         for attr in INHERITABLE_METADATA:
             record_filter['metadata.{0}'.format(attr)] = 1
 
+        return query, record_filter
+
+    def compute_metadata_inheritance_tree(self, location):
+        '''
+        TODO (cdodge) This method can be deleted when the 'split module store' work has been completed
+        '''
+        query, record_filter = self._inheritance_query(location)
+
         # call out to the DB
-        resultset = self.collection.find(query, record_filter)
-
-        results_by_url = {}
-        root = None
-
-        # now go through the results and order them by the location url
-        for result in resultset:
-            location = Location(result['_id'])
-            # We need to collate between draft and non-draft
-            # i.e. draft verticals can have children which are not in non-draft versions
-            location = location._replace(revision=None)
-            location_url = location.url()
-            if location_url in results_by_url:
-                existing_children = results_by_url[location_url].get('definition', {}).get('children', [])
-                additional_children = result.get('definition', {}).get('children', [])
-                total_children = existing_children + additional_children
-                if 'definition' not in results_by_url[location_url]:
-                    results_by_url[location_url]['definition'] = {}
-                results_by_url[location_url]['definition']['children'] = total_children
-            results_by_url[location.url()] = result
-            if location.category == 'course':
-                root = location.url()
-
-        # now traverse the tree and compute down the inherited metadata
-        metadata_to_inherit = {}
-
-        def _compute_inherited_metadata(url):
-            """
-            Helper method for computing inherited metadata for a specific location url
-            """
-            # check for presence of metadata key. Note that a given module may not yet be fully formed.
-            # example: update_item -> update_children -> update_metadata sequence on new item create
-            # if we get called here without update_metadata called first then 'metadata' hasn't been set
-            # as we're not fully transactional at the DB layer. Same comment applies to below key name
-            # check
-            my_metadata = results_by_url[url].get('metadata', {})
-
-            # go through all the children and recurse, but only if we have
-            # in the result set. Remember results will not contain leaf nodes
-            for child in results_by_url[url].get('definition', {}).get('children', []):
-                if child in results_by_url:
-                    new_child_metadata = copy.deepcopy(my_metadata)
-                    new_child_metadata.update(results_by_url[child].get('metadata', {}))
-                    results_by_url[child]['metadata'] = new_child_metadata
-                    metadata_to_inherit[child] = new_child_metadata
-                    _compute_inherited_metadata(child)
-                else:
-                    # this is likely a leaf node, so let's record what metadata we need to inherit
-                    metadata_to_inherit[child] = my_metadata
+        return compute_inheritance_tree(self.collection.find(query, record_filter))
+
+    def _find_inheritance_document(self, location):
+        """
+        Return the persisted metadata inheritance document for the course
+        containing location, or None if there isn't a current one
+        """
+        document = self.inheritance_collection.find_one({'_id': get_course_id_no_run(location)})
+        if document is None or document.get('format') != INHERITANCE_DOCUMENT_FORMAT:
+            return None
+        return document
+
+    def _save_inheritance_document(self, location, records, tree, version=None):
+        """
+        Persist the container records and metadata inheritance tree for the course
+        containing location, so that other processes can load the tree without
+        recomputing it.
+
+        If version is not None, the document is only written if the currently
+        persisted document is at that version. Returns whether it was written.
+        """
+        course_id = get_course_id_no_run(location)
+        document = {
+            '_id': course_id,
+            'format': INHERITANCE_DOCUMENT_FORMAT,
+            'version': (version or 0) + 1,
+            'records': list(records),
+            # stored as pairs, since urls aren't valid mongo keys
+            'tree': tree.items(),
+        }
+        spec = {'_id': course_id}
+        if version is not None:
+            spec['version'] = version
+
+        try:
+            result = self.inheritance_collection.update(
+                spec,
+                document,
+                upsert=(version is None),
+                safe=self.inheritance_collection.safe
+            )
+        except pymongo.errors.DuplicateKeyError:
+            return False
+        return result['n'] == 1
 
-        if root is not None:
-            _compute_inherited_metadata(root)
+    def _cache_metadata_inheritance_tree(self, location, tree):
+        """
+        Store tree in the caching subsystem (e.g. memcached) and the request cache
+        """
+        key = metadata_cache_key(location)
 
-        return metadata_to_inherit
+        # write out tree to caching subsystem (e.g. memcached), if available
+        if self.metadata_inheritance_cache_subsystem is not None:
+            self.metadata_inheritance_cache_subsystem.set(key, tree)
+
+        if self.request_cache is not None:
+            # we can't assume the 'metadatat_inheritance' part of the request cache dict has been
+            # defined
+            if 'metadata_inheritance' not in self.request_cache.data:
+                self.request_cache.data['metadata_inheritance'] = {}
+            self.request_cache.data['metadata_inheritance'][key] = tree
 
     def get_cached_metadata_inheritance_tree(self, location, force_refresh=False):
         '''
@@ -352,23 +545,23 @@ class MongoModuleStore(ModuleStoreBase):
             else:
                 logging.warning('Running MongoModuleStore without a metadata_inheritance_cache_subsystem. This is OK in localdev and testing environment. Not OK in production.')
 
-        if not tree:
-            # if not in subsystem, or we are on force refresh, then we have to compute
-            tree = self.compute_metadata_inheritance_tree(location)
+            # then look for the tree persisted by the last write to the course
+            if not tree:
+                document = self._find_inheritance_document(location)
+                if document is not None:
+                    tree = dict(document['tree'])
 
-            # now write out computed tree to caching subsystem (e.g. memcached), if available
-            if self.metadata_inheritance_cache_subsystem is not None:
-                self.metadata_inheritance_cache_subsystem.set(key, tree)
+        if not tree:
+            # if not persisted, or we are on force refresh, then we have to compute
+            query, record_filter = self._inheritance_query(location)
+            records = list(self.collection.find(query, record_filter))
+            tree = compute_inheritance_tree(records)
+            self._save_inheritance_document(location, records, tree)
 
-        # now populate a request_cache, if available. NOTE, we are outside of the
+        # now populate the caching subsystem and the request_cache, if available. NOTE, we are outside of the
         # scope of the above if: statement so that after a memcache hit, it'll get
         # put into the request_cache
-        if self.request_cache is not None:
-            # we can't assume the 'metadatat_inheritance' part of the request cache dict has been
-            # defined
-            if 'metadata_inheritance' not in self.request_cache.data:
-                self.request_cache.data['metadata_inheritance'] = {}
-            self.request_cache.data['metadata_inheritance'][key] = tree
+        self._cache_metadata_inheritance_tree(location, tree)
 
         return tree
 
@@ -381,6 +574,96 @@ class MongoModuleStore(ModuleStoreBase):
         if pseudo_course_id not in self.ignore_write_events_on_courses:
             self.get_cached_metadata_inheritance_tree(location, force_refresh=True)
 
+    def update_cached_metadata_inheritance_tree(self, location, structure_changed=True):
+        """
+        Bring the cached metadata inheritance tree for the org/course combination
+        for location up to date after the item at location has been written or
+        deleted, without recomputing it from the whole course.
+
+        structure_changed: False if only the metadata of the item changed, in
+            which case only the subtree under it is recomputed
+        """
+        location = Location(location)
+        pseudo_course_id = '/'.join([location.org, location.course])
+        if pseudo_course_id in self.ignore_write_events_on_courses:
+            return
+
+        # Only containers contribute to the tree; the metadata of leaves isn't inherited
+        if location.category not in INHERITANCE_CONTAINER_CATEGORIES:
+            return
+
+        document = self._find_inheritance_document(location)
+        if document is None:
+            self.refresh_cached_metadata_inheritance_tree(location)
+            return
+
+        records = [record for record in document['records'] if Location(record['_id']) != location]
+        _, record_filter = self._inheritance_query(location)
+        record = self.collection.find_one({'_id': location.dict()}, record_filter)
+        if record is not None:
+            records.append(record)
+
+        if structure_changed or record is None:
+            tree = compute_inheritance_tree(records)
+        else:
+            tree = update_inheritance_subtree(records, dict(document['tree']), location)
+
+        if self._save_inheritance_document(location, records, tree, document['version']):
+            self._cache_metadata_inheritance_tree(location, tree)
+        else:
+            # someone else changed the course at the same time, so start from scratch
+            self.refresh_cached_metadata_inheritance_tree(location)
+
+    def get_course_version(self, location):
+        """
+        Return the edit version of the course containing location. The version
+        changes every time the course is written to, by any process.
+        """
+        course_id = get_course_id_no_run(location)
+
+        # see if we've already looked it up during this request
+        versions = None
+        if self.request_cache is not None:
+            versions = self.request_cache.data.setdefault('course_versions', {})
+            if course_id in versions:
+                return versions[course_id]
+
+        document = self.versions_collection.find_one({'_id': course_id})
+        version = document['version'] if document is not None else 0
+
+        if versions is not None:
+            versions[course_id] = version
+        return version
+
+    def invalidate_cached_descriptors(self, location):
+        """
+        Bump the edit version of the course containing location, so that all
+        processes stop using the descriptors they have cached for it
+        """
+        course_id = get_course_id_no_run(location)
+        document = self.versions_collection.find_and_modify(
+            {'_id': course_id},
+            {'$inc': {'version': 1}},
+            upsert=True,
+            new=True,
+        )
+
+        if self.request_cache is not None:
+            self.request_cache.data.get('course_versions', {}).pop(course_id, None)
+
+        # This process's writes have been applied to its parent index, so if no one
+        # else has written to the course since, the index is still current
+        with self._parent_index_lock:
+            index = self._parent_indexes.get(course_id)
+            if index is not None:
+                if index.version == document['version'] - 1:
+                    index.version = document['version']
+                else:
+                    del self._parent_indexes[course_id]
+
+        if self.descriptor_cache is not None:
+            self.descriptor_cache.invalidate_course(course_id)
+
     def _clean_item_data(self, item):
         """
         Renames the '_id' field in item to 'location'
@@ -388,6 +671,38 @@ class MongoModuleStore(ModuleStoreBase):
         item['location'] = item['_id']
         del item['_id']
 
+    def _query_course_structure(self, location, fields=None):
+        """
+        Returns a dictionary mapping Location -> item data for all of the items
+        (both draft and non-draft) in the course containing location, fetched in
+        a single query over the _id index.
+
+        fields: if not None, the list of fields to fetch for each item
+        """
+        query = {
+            '_id.tag': location.tag,
+            '_id.org': location.org,
+            '_id.course': location.course,
+        }
+        return dict(
+            (Location(item['_id']), item)
+            for item in self.collection.find(query, fields)
+        )
+
+    def _child_item(self, structure, location):
+        """
+        Returns the item data in structure (as returned by _query_course_structure)
+        that should be loaded for the child at location, or None if there isn't one
+        """
+        return structure.get(location)
+
+    def _wrap_child_item(self, item):
+        """
+        Returns item, which was loaded from the structure of its course by
+        CachingDescriptorSystem.load_item, as get_item would return it
+        """
+        return item
+
     def _query_children_for_cache_children(self, items):
         # first get non-draft in a round-trip
         query = {
@@ -395,14 +710,48 @@ class MongoModuleStore(ModuleStoreBase):
         }
         return list(self.collection.find(query))
 
+    def _cache_course(self, item):
+        """
+        Returns a dictionary mapping Location -> item data for the course item and
+        all of its descendents, found in memory from the whole of the course, which
+        is fetched in a single query.
+        """
+        structure = self._query_course_structure(Location(item['_id']))
+        subtree = [item]
+        seen = set([Location(item['_id'])])
+        to_process = [item]
+        while to_process:
+            children = []
+            for parent in to_process:
+                for child in parent.get('definition', {}).get('children', []):
+                    child_item = self._child_item(structure, Location(child))
+                    if child_item is not None and Location(child_item['_id']) not in seen:
+                        seen.add(Location(child_item['_id']))
+                        children.append(child_item)
+            subtree.extend(children)
+            to_process = children
+
+        data = {}
+        for subtree_item in subtree:
+            self._clean_item_data(subtree_item)
+            data[Location(subtree_item['location'])] = subtree_item
+        return data
+
     def _cache_children(self, items, depth=0):
         """
         Returns a dictionary mapping Location -> item data, populated with json data
         for all descendents of items up to the specified depth.
         (0 = no descendents, 1 = children, 2 = grandchildren, etc)
         If depth is None, will load all the children.
-        This will make a number of queries that is linear in the depth.
+        This will make a number of queries that is linear in the depth, except when
+        all of the descendents of courses are wanted: each of those courses is then
+        fetched whole, in one query.
         """
+        if depth is None and items and all(item['_id']['category'] == 'course' for item in items):
+            data = {}
+            for item in items:
+                data.update(self._cache_course(item))
+            return data
 
         data = {}
         to_process = list(items)
@@ -429,9 +778,14 @@ class MongoModuleStore(ModuleStoreBase):
 
         return data
 
-    def _load_item(self, item, data_cache, apply_cached_metadata=True):
+    def _load_item(self, item, data_cache, apply_cached_metadata=True, read_only=False,
+                   course_structures=None):
         """
-        Load an XModuleDescriptor from item, using the children stored in data_cache
+        Load an XModuleDescriptor from item, using the children stored in data_cache,
+        and otherwise the structures of their courses in course_structures (see
+        CachingDescriptorSystem)
+
+        read_only: if True, the fields of the descriptor and its descendents can't be changed
         """
         data_dir = getattr(item, 'data_dir', item['location']['course'])
         root = self.fs_root / data_dir
@@ -455,20 +809,33 @@ class MongoModuleStore(ModuleStoreBase):
             self.error_tracker,
             self.render_template,
             cached_metadata,
+            read_only,
+            course_structures,
         )
         return system.load_item(item['location'])
 
-    def _load_items(self, items, depth=0):
+    def _load_items(self, items, depth=0, read_only=False):
         """
         Load a list of xmodules from the data in items, with children cached up
         to specified depth
+
+        read_only: if True, the fields of the xmodules and their descendents can't be changed
         """
         data_cache = self._cache_children(items, depth)
 
+        # Descendents that weren't prefetched are loaded from the structure of
+        # their course, which is fetched once for all of the items, rather than
+        # with a query per descendent. Read-only items may be kept in the
+        # descriptor cache, which only counts the descriptors that were
+        # prefetched, so they load their other descendents with get_item
+        # (which caches those separately) rather than hold on to the course.
+        course_structures = None if read_only else {}
+
         # if we are loading a course object, if we're not prefetching children (depth != 0) then don't
         # bother with the metadata inheritance
         return [self._load_item(item, data_cache,
-                apply_cached_metadata=(item['location']['category'] != 'course' or depth != 0)) for item in items]
+                apply_cached_metadata=(item['location']['category'] != 'course' or depth != 0),
+                read_only=read_only, course_structures=course_structures) for item in items]
 
     def get_courses(self):
         '''
@@ -526,8 +893,20 @@ class MongoModuleStore(ModuleStoreBase):
             calls to get_children() to cache. None indicates to cache all descendents.
         """
         location = Location.ensure_fully_specified(location)
-        item = self._find_one(location)
-        module = self._load_items([item], depth)[0]
+
+        # Drafts are edited in place, so never come from the descriptor cache
+        if self.descriptor_cache is None or location.revision == DRAFT:
+            return self._load_items([self._find_one(location)], depth)[0]
+
+        course_id = get_course_id_no_run(location)
+        version = self.get_course_version(location)
+        module = self.descriptor_cache.get(course_id, (location.url(), depth), version)
+        if module is None:
+            # cached descriptors are shared between requests, so mustn't be changed
+            module = self._load_items([self._find_one(location)], depth, read_only=True)[0]
+            # counted as all of the descriptors loaded with it
+            self.descriptor_cache.set(course_id, (location.url(), depth), version, module,
+                                      len(module.system.module_data))
         return module
 
     def get_instance(self, course_id, location, depth=0):
@@ -572,6 +951,7 @@ class MongoModuleStore(ModuleStoreBase):
                 # from overriding our default value set in the init method.
                 safe=self.collection.safe
             )
+            self._update_parent_index(location, source_item.get('definition', {}).get('children', []))
             item = self._load_items([source_item])[0]
 
             # VS[compat] cdodge: This is a hack because static_tabs also have references from the course module, so
@@ -591,13 +971,20 @@ class MongoModuleStore(ModuleStoreBase):
         except pymongo.errors.DuplicateKeyError:
             raise DuplicateItemError(location)
 
-        # recompute (and update) the metadata inheritance tree which is cached
-        self.refresh_cached_metadata_inheritance_tree(Location(location))
+        # recompute (and update) the metadata inheritance tree which is cached for a new course,
+        # otherwise just update it
+        if Location(location).category == 'course':
+            self.refresh_cached_metadata_inheritance_tree(Location(location))
+        else:
+            self.update_cached_metadata_inheritance_tree(Location(location))
         self.fire_updated_modulestore_signal(get_course_id_no_run(Location(location)), Location(location))
 
         return item
 
     def fire_updated_modulestore_signal(self, course_id, location):
+        if course_id not in self.ignore_write_events_on_courses:
+            self.invalidate_cached_descriptors(location)
+
         if self.modulestore_update_signal is not None:
             self.modulestore_update_signal.send(self, modulestore=self, course_id=course_id,
                                                 location=location)
@@ -659,6 +1046,8 @@ class MongoModuleStore(ModuleStoreBase):
         """
 
         self._update_single_item(location, {'definition.data': data})
+        # fire signal that we've written to DB
+        self.fire_updated_modulestore_signal(get_course_id_no_run(Location(location)), Location(location))
 
     def update_children(self, location, children):
         """
@@ -670,8 +1059,9 @@ class MongoModuleStore(ModuleStoreBase):
         """
 
         self._update_single_item(location, {'definition.children': children})
-        # recompute (and update) the metadata inheritance tree which is cached
-        self.refresh_cached_metadata_inheritance_tree(Location(location))
+        self._update_parent_index(location, children)
+        # update the metadata inheritance tree which is cached
+        self.update_cached_metadata_inheritance_tree(Location(location))
         # fire signal that we've written to DB
         self.fire_updated_modulestore_signal(get_course_id_no_run(Location(location)), Location(location))
 
@@ -698,8 +1088,8 @@ class MongoModuleStore(ModuleStoreBase):
             self.update_metadata(course.location, own_metadata(course))
 
         self._update_single_item(location, {'metadata': metadata})
-        # recompute (and update) the metadata inheritance tree which is cached
-        self.refresh_cached_metadata_inheritance_tree(loc)
+        # update the metadata inheritance tree which is cached
+        self.update_cached_metadata_inheritance_tree(loc, structure_changed=False)
         self.fire_updated_modulestore_signal(get_course_id_no_run(Location(location)), Location(location))
 
     def delete_item(self, location, delete_all_versions=False):
@@ -722,18 +1112,53 @@ class MongoModuleStore(ModuleStoreBase):
         # Must include this to avoid the django debug toolbar (which defines the deprecated "safe=False")
         # from overriding our default value set in the init method.
         self.collection.remove({'_id': Location(location).dict()}, safe=self.collection.safe)
-        # recompute (and update) the metadata inheritance tree which is cached
-        self.refresh_cached_metadata_inheritance_tree(Location(location))
+        self._update_parent_index(location)
+        # update the metadata inheritance tree which is cached
+        self.update_cached_metadata_inheritance_tree(Location(location))
         self.fire_updated_modulestore_signal(get_course_id_no_run(Location(location)), Location(location))
 
+    def _get_parent_index(self, location):
+        """
+        Return a current ParentIndex of the course containing location, building
+        it from the course structure if this process doesn't have one
+        """
+        course_id = get_course_id_no_run(location)
+        version = self.get_course_version(location)
+        with self._parent_index_lock:
+            index = self._parent_indexes.get(course_id)
+        if index is not None and index.version == version:
+            return index
+
+        structure = self._query_course_structure(location, fields=['definition.children'])
+        index = ParentIndex(version, structure)
+        with self._parent_index_lock:
+            self._parent_indexes[course_id] = index
+        return index
+
+    def _update_parent_index(self, location, children=None):
+        """
+        Apply a write of the children of the item at location (or, if children
+        is None, its deletion) to this process's index of the course, if it has one
+        """
+        location = Location(location)
+        with self._parent_index_lock:
+            index = self._parent_indexes.get(get_course_id_no_run(location))
+            if index is None:
+                return
+            if children is None:
+                index.remove_item(location)
+            else:
+                index.set_children(location, children)
+
     def get_parent_locations(self, location, course_id):
         '''Find all locations that are the parents of this location in this
         course.  Needed for path_to_location().
+
+        The parents are looked up in an index of the course kept in memory,
+        rather than by searching the children of every item in the course.
         '''
         location = Location.ensure_fully_specified(location)
-        items = self.collection.find({'definition.children': location.url()},
-                                     {'_id': True})
-        return [i['_id'] for i in items]
+        return self._get_parent_index(location).parents(location.url())
 
     def get_errored_courses(self):
         """
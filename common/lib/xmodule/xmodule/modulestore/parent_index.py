@@ -0,0 +1,58 @@
+"""
+A process-local index from the items of a course to their parents, for
+modulestores that otherwise have to search the children of every item in the
+course to find the parents of one.
+"""
+
+from collections import defaultdict
+
+
+class ParentIndex(object):
+    """
+    Maps the url of every child in a course to the locations of the items
+    (draft or not) that list it as a child.
+
+    The index records the edit version of its course at the time it was
+    built.  Writes made by this process are applied to it in place, so that it
+    stays current; writes made by other processes are picked up by building
+    it again once the course version changes.
+    """
+    def __init__(self, version, structure):
+        """
+        version: the edit version of the course
+        structure: a dict mapping the Location of each item in the course to its
+            item data, with (at least) its 'definition.children'
+        """
+        self.version = version
+        self._children = {}
+        self._parents = defaultdict(list)
+        for location, item in structure.iteritems():
+            self.set_children(location, item.get('definition', {}).get('children', []))
+
+    def parents(self, url):
+        """
+        Return the locations of the parents of the item with url
+        """
+        return list(self._parents.get(url, ()))
+
+    def set_children(self, location, children):
+        """
+        Record that the item at location now has the child urls children
+        """
+        self.remove_item(location)
+        self._children[location] = children = list(set(children))
+        for child in children:
+            self._parents[child].append(location)
+
+    def remove_item(self, location):
+        """
+        Record that the item at location has been deleted
+        """
+        for child in self._children.pop(location, ()):
+            parents = self._parents[child]
+            parents.remove(location)
+            if not parents:
+                del self._parents[child]
+
+    def __len__(self):
+        return len(self._children)
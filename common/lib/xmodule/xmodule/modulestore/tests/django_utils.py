@@ -73,6 +73,7 @@ class ModuleStoreTestCase(TestCase):
         # Clean up by dropping the collection
         modulestore = xmodule.modulestore.django.modulestore()
         modulestore.collection.drop()
+        modulestore.inheritance_collection.drop()
 
         xmodule.modulestore.django._MODULESTORES.clear()
 
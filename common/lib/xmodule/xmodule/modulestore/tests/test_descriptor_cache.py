@@ -0,0 +1,52 @@
+from nose.tools import assert_equals, assert_is_none
+
+from xmodule.modulestore.descriptor_cache import DescriptorCache
+
+
+def test_get_checks_version():
+    cache = DescriptorCache(10)
+    cache.set('edX/toy', 'a', 1, 'descriptor')
+    assert_equals('descriptor', cache.get('edX/toy', 'a', 1))
+    assert_is_none(cache.get('edX/toy', 'a', 2))
+    assert_is_none(cache.get('edX/toy', 'b', 1))
+    assert_equals(1, cache.stats()['hits'])
+    assert_equals(2, cache.stats()['misses'])
+
+
+def test_evicts_least_recently_used():
+    cache = DescriptorCache(2)
+    cache.set('edX/toy', 'a', 1, 'a')
+    cache.set('edX/toy', 'b', 1, 'b')
+    cache.get('edX/toy', 'a', 1)
+    cache.set('edX/toy', 'c', 1, 'c')
+
+    assert_equals('a', cache.get('edX/toy', 'a', 1))
+    assert_is_none(cache.get('edX/toy', 'b', 1))
+    assert_equals('c', cache.get('edX/toy', 'c', 1))
+    assert_equals(1, cache.stats()['evictions'])
+
+
+def test_invalidate_course():
+    cache = DescriptorCache(10)
+    cache.set('edX/toy', 'a', 1, 'a')
+    cache.set('edX/simple', 'a', 1, 'b')
+    cache.invalidate_course('edX/toy')
+
+    assert_is_none(cache.get('edX/toy', 'a', 1))
+    assert_equals('b', cache.get('edX/simple', 'a', 1))
+    assert_equals(1, cache.stats()['invalidations'])
+
+
+def test_counts_descriptors():
+    cache = DescriptorCache(10)
+    cache.set('edX/toy', 'course', 1, 'course', 6)
+    cache.set('edX/toy', 'chapter', 1, 'chapter', 3)
+    assert_equals(9, cache.stats()['size'])
+
+    cache.set('edX/toy', 'other chapter', 1, 'other chapter', 3)
+    assert_is_none(cache.get('edX/toy', 'course', 1))
+    assert_equals(6, cache.stats()['size'])
+
+    # a tree with more descriptors than the cache can hold isn't cached
+    cache.set('edX/simple', 'course', 1, 'course', 11)
+    assert_is_none(cache.get('edX/simple', 'course', 1))
@@ -1,11 +1,13 @@
 import pymongo
 
 from mock import Mock
-from nose.tools import assert_equals, assert_raises, assert_not_equals, with_setup, assert_false
+from nose.tools import assert_equals, assert_raises, assert_not_equals, with_setup, assert_false, assert_true
 from pprint import pprint
 
 from xmodule.modulestore import Location
-from xmodule.modulestore.mongo import MongoModuleStore
+from xmodule.modulestore.exceptions import ReadOnlyItemError
+from xmodule.modulestore.inheritance import own_metadata
+from xmodule.modulestore.mongo import MongoModuleStore, compute_inheritance_tree, update_inheritance_subtree
 from xmodule.modulestore.xml_importer import import_from_xml
 from xmodule.templates import update_templates
 
@@ -113,3 +115,131 @@ class TestMongoModuleStore(object):
                 course.location.org == 'edx' and course.location.course == 'templates',
                 '{0} is a template course'.format(course)
             )
+
+    def test_inheritance_tree_is_persisted(self):
+        location = Location("i4x://edX/toy/course/2012_Fall")
+        document = self.store._find_inheritance_document(location)
+        assert_not_equals(document, None)
+        assert_equals(dict(document['tree']), self.store.compute_metadata_inheritance_tree(location))
+
+    def test_cache_children(self):
+        course = self.store.get_item(Location("i4x://edX/toy/course/2012_Fall"), depth=None)
+        assert_true(Location("i4x://edX/toy/video/Welcome") in course.system.module_data)
+
+        course = self.store.get_item(Location("i4x://edX/toy/course/2012_Fall"), depth=1)
+        assert_true(Location("i4x://edX/toy/chapter/Overview") in course.system.module_data)
+        assert_false(Location("i4x://edX/toy/video/Welcome") in course.system.module_data)
+
+        # below the course, only the subtree is loaded
+        chapter = self.store.get_item(Location("i4x://edX/toy/chapter/Overview"), depth=None)
+        assert_true(Location("i4x://edX/toy/video/Video_Resources") in chapter.system.module_data)
+        assert_false(Location("i4x://edX/toy/chapter/secret:magic") in chapter.system.module_data)
+        assert_false(Location("i4x://edX/toy/course/2012_Fall") in chapter.system.module_data)
+
+    def test_children_loaded_from_course_structure(self):
+        store = MongoModuleStore(HOST, DB, COLLECTION, FS_ROOT, RENDER_TEMPLATE, default_class=DEFAULT_CLASS)
+        sequence = store.get_item(Location("i4x://edX/simple/sequential/test_sequence"))
+
+        # rendering the sequence loads all of its descendents, which takes a
+        # single query for the course structure rather than one per descendent
+        store.collection = Mock(wraps=store.collection)
+        to_render = [sequence]
+        rendered = []
+        while to_render:
+            descriptor = to_render.pop()
+            rendered.append(descriptor.location.url())
+            to_render.extend(descriptor.get_children())
+
+        assert_equals(sorted(rendered), [
+            "i4x://edX/simple/html/test_html",
+            "i4x://edX/simple/sequential/test_sequence",
+            "i4x://edX/simple/vertical/test_vertical",
+        ])
+        assert_equals(1, store.collection.find.call_count)
+        assert_equals(0, store.collection.find_one.call_count)
+
+    def test_descriptor_cache(self):
+        store = MongoModuleStore(HOST, DB, COLLECTION, FS_ROOT, RENDER_TEMPLATE,
+                                 default_class=DEFAULT_CLASS, descriptor_cache_size=1000)
+        location = Location("i4x://edX/toy/course/2012_Fall")
+        course = store.get_item(location, depth=None)
+        assert_true(course is store.get_item(location, depth=None))
+        assert_equals(1, store.descriptor_cache.stats()['hits'])
+
+        store.invalidate_cached_descriptors(location)
+        assert_false(course is store.get_item(location, depth=None))
+
+        # the course is counted as all of its descriptors
+        assert_equals(len(course.system.module_data), store.descriptor_cache.stats()['size'])
+
+    def test_cached_descriptors_are_read_only(self):
+        store = MongoModuleStore(HOST, DB, COLLECTION, FS_ROOT, RENDER_TEMPLATE,
+                                 default_class=DEFAULT_CLASS, descriptor_cache_size=1000)
+        course = store.get_item(Location("i4x://edX/toy/course/2012_Fall"), depth=None)
+        with assert_raises(ReadOnlyItemError):
+            course.display_name = 'Changed'
+        with assert_raises(ReadOnlyItemError):
+            course.get_children()[0].display_name = 'Changed'
+
+        # descriptors that aren't shared can still be changed
+        chapter = self.store.get_item(Location("i4x://edX/toy/chapter/Overview"))
+        chapter.display_name = 'Changed'
+
+    def test_write_bumps_version_once(self):
+        location = Location("i4x://edX/toy/course/2012_Fall")
+        version = self.store.get_course_version(location)
+        self.store.update_metadata(location, own_metadata(self.store.get_item(location)))
+        assert_equals(version + 1, self.store.get_course_version(location))
+
+    def test_parent_index(self):
+        store = MongoModuleStore(HOST, DB, COLLECTION, FS_ROOT, RENDER_TEMPLATE, default_class=DEFAULT_CLASS)
+        chapter = Location("i4x://edX/toy/chapter/Overview")
+        video = "i4x://edX/toy/video/Welcome"
+        assert_equals([Location(loc) for loc in store.get_parent_locations(Location(video), None)], [chapter])
+
+        # The index is kept up to date with this process's writes, rather than rebuilt
+        index = store._get_parent_index(chapter)
+        children = store.get_item(chapter).children
+        try:
+            store.update_children(chapter, [child for child in children if child != video])
+            assert_equals(store.get_parent_locations(Location(video), None), [])
+            assert_true(store._get_parent_index(chapter) is index)
+        finally:
+            store.update_children(chapter, children)
+        assert_equals(store.get_parent_locations(Location(video), None), [chapter])
+
+        # Writes by other processes are picked up
+        other_store = MongoModuleStore(HOST, DB, COLLECTION, FS_ROOT, RENDER_TEMPLATE, default_class=DEFAULT_CLASS)
+        try:
+            other_store.update_children(chapter, [])
+            assert_equals(store.get_parent_locations(Location(video), None), [])
+        finally:
+            other_store.update_children(chapter, children)
+
+
+def inheritance_record(url, children=(), **metadata):
+    return {
+        '_id': Location(url).dict(),
+        'definition': {'children': list(children)},
+        'metadata': metadata,
+    }
+
+
+def test_update_inheritance_subtree():
+    course = 'i4x://edX/test/course/2013'
+    chapters = ['i4x://edX/test/chapter/c1', 'i4x://edX/test/chapter/c2']
+    sequential = 'i4x://edX/test/sequential/s1'
+    problem = 'i4x://edX/test/problem/p1'
+    records = [
+        inheritance_record(course, chapters, graceperiod='1 day'),
+        inheritance_record(chapters[0], [sequential]),
+        inheritance_record(chapters[1]),
+        inheritance_record(sequential, [problem], due='2013-01-01'),
+    ]
+    tree = compute_inheritance_tree(records)
+    assert_equals(tree[problem], {'graceperiod': '1 day', 'due': '2013-01-01'})
+
+    records[1] = inheritance_record(chapters[0], [sequential], graceperiod='2 days')
+    tree = update_inheritance_subtree(records, tree, chapters[0])
+    assert_equals(tree, compute_inheritance_tree(records))
+    assert_equals(tree[problem], {'graceperiod': '2 days', 'due': '2013-01-01'})
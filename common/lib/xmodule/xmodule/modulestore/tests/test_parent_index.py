@@ -0,0 +1,105 @@
+from nose.tools import assert_equals
+
+from xmodule.course_module import CourseDescriptor
+from xmodule.modulestore import Location
+from xmodule.modulestore.parent_index import ParentIndex
+from xmodule.modulestore.search import path_to_location
+
+
+def course_structure(shape):
+    """
+    Return the structure of a course (a dict mapping Location to item data,
+    as returned by MongoModuleStore._query_course_structure) whose items
+    have, at each level, the numbers of children in shape
+    """
+    categories = ['course', 'chapter', 'sequential', 'vertical', 'problem']
+    course = Location('i4x://edX/bench/course/2013')
+    structure = {}
+
+    def add(location, depth):
+        children = []
+        if depth < len(shape):
+            for i in xrange(shape[depth]):
+                child = Location('i4x', 'edX', 'bench', categories[depth + 1],
+                                 '{0}_{1}'.format(location.name, i))
+                add(child, depth + 1)
+                children.append(child.url())
+        structure[location] = {'_id': location.dict(), 'definition': {'children': children}}
+
+    add(course, 0)
+    return structure
+
+
+def test_parents():
+    course = Location('i4x://edX/test/course/2013')
+    chapter = Location('i4x://edX/test/chapter/c1')
+    draft_chapter = chapter._replace(revision='draft')
+    problem = 'i4x://edX/test/problem/p1'
+    index = ParentIndex(1, {
+        course: {'definition': {'children': [chapter.url()]}},
+        chapter: {'definition': {'children': [problem, problem]}},
+        draft_chapter: {'definition': {'children': [problem]}},
+        Location(problem): {},
+    })
+    assert_equals(index.parents(chapter.url()), [course])
+    assert_equals(sorted(index.parents(problem)), sorted([chapter, draft_chapter]))
+    assert_equals(index.parents(course.url()), [])
+
+    index.set_children(chapter, [])
+    assert_equals(index.parents(problem), [draft_chapter])
+
+    index.remove_item(draft_chapter)
+    assert_equals(index.parents(problem), [])
+
+
+class FakeDescriptor(object):
+    def __init__(self, structure, location):
+        self.structure = structure
+        self.location = location
+
+    def get_children(self):
+        return [FakeDescriptor(self.structure, Location(child))
+                for child in self.structure[self.location]['definition']['children']]
+
+
+class FakeModuleStore(object):
+    """
+    The parts of a modulestore used by path_to_location, finding parents
+    either by scanning the children of every item (as a query on
+    'definition.children' does) or from a ParentIndex
+    """
+    def __init__(self, structure, indexed):
+        self.structure = structure
+        self.index = ParentIndex(1, structure) if indexed else None
+
+    def has_item(self, location):
+        return Location(location) in self.structure
+
+    def get_instance(self, course_id, location):
+        return FakeDescriptor(self.structure, Location(location))
+
+    def get_parent_locations(self, location, course_id):
+        url = Location(location).url()
+        if self.index is not None:
+            return self.index.parents(url)
+        return [parent for parent, item in self.structure.iteritems()
+                if url in item['definition']['children']]
+
+
+class TestPathToLocation(object):
+    """
+    Check that finding paths to the problems of a course by looking up
+    parents in a ParentIndex gives the same paths as scanning the children
+    of every item.  (scripts/benchmark_parent_index.py compares the time
+    they take.)
+    """
+    def test_path_to_location(self):
+        # 1 course, 3 chapters, 6 sequentials, 12 verticals, 24 problems
+        structure = course_structure([3, 2, 2, 2])
+        course_id = CourseDescriptor.location_to_id(Location('i4x://edX/bench/course/2013'))
+        problems = [location for location in sorted(structure) if location.category == 'problem']
+
+        scanning = FakeModuleStore(structure, indexed=False)
+        indexed = FakeModuleStore(structure, indexed=True)
+        assert_equals([path_to_location(scanning, course_id, problem) for problem in problems],
+                      [path_to_location(indexed, course_id, problem) for problem in problems])
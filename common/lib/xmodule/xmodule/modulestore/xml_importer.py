@@ -284,6 +284,9 @@ def import_from_xml(store, data_dir, course_dirs=None,
                 store.ignore_write_events_on_courses.remove(pseudo_course_id)
                 store.refresh_cached_metadata_inheritance_tree(target_location_namespace if
                                                                target_location_namespace is not None else course_location)
+                # the writes made during the import didn't invalidate any cached descriptors
+                store.invalidate_cached_descriptors(target_location_namespace if
+                                                    target_location_namespace is not None else course_location)
 
     return xml_module_store, course_items
 
@@ -12,7 +12,7 @@ import random
 import xmodule
 from capa.responsetypes import StudentInputError, \
     LoncapaProblemError, ResponseError
-from xmodule.capa_module import CapaModule
+from xmodule.capa_module import CapaModule, CapaDescriptor
 from xmodule.modulestore import Location
 
 from django.http import QueryDict
@@ -1045,3 +1045,40 @@ class CapaModuleTest(unittest.TestCase):
             for i in range(200):
                 module = CapaFactory.create(rerandomize=rerandomize)
                 assert 0 <= module.seed < 1000
+
+
+class CapaDescriptorTest(unittest.TestCase):
+
+    def create_descriptor(self, xml):
+        location = Location(["i4x", "edX", "capa_test", "problem", "SampleProblem"])
+        return CapaDescriptor(Mock(), location, {'data': xml})
+
+    def test_max_score(self):
+        module = CapaFactory.create()
+        descriptor = self.create_descriptor(CapaFactory.sample_problem_xml)
+        self.assertEqual(module.max_score(), descriptor.update_max_score_cache())
+        self.assertEqual(module.max_score(), descriptor.max_score())
+
+    def test_max_score_with_points(self):
+        descriptor = self.create_descriptor("""
+<problem>
+<stringresponse answer="a"><textline points="3"/></stringresponse>
+<annotationresponse><annotationinput><options><option choice="correct">A</option></options></annotationinput></annotationresponse>
+</problem>
+""")
+        self.assertEqual(5, descriptor.update_max_score_cache())
+
+    def test_max_score_with_include(self):
+        descriptor = self.create_descriptor('<problem><include file="other.xml"/></problem>')
+        self.assertEqual(None, descriptor.update_max_score_cache())
+        self.assertEqual(None, descriptor.max_score())
+
+    def test_max_score_cache(self):
+        descriptor = self.create_descriptor(CapaFactory.sample_problem_xml)
+        # not computed until the problem is imported or published
+        self.assertEqual(None, descriptor.max_score())
+        self.assertEqual(None, descriptor.max_score_cache)
+
+        descriptor.update_max_score_cache()
+        self.assertEqual(1, descriptor.max_score_cache['max_score'])
+        self.assertEqual(1, descriptor.max_score())
@@ -1,5 +1,8 @@
 import unittest
-from xmodule.contentstore.content import StaticContent
+from StringIO import StringIO
+
+from xmodule.contentstore import content as content_module
+from xmodule.contentstore.content import StaticContent, StaticContentStream
 from xmodule.contentstore.content import ContentStore
 from xmodule.modulestore import Location
 
@@ -30,3 +33,45 @@ class ContentTest(unittest.TestCase):
         # still happen.
         asset_location = StaticContent.compute_location('mitX', '400', 'subs__1eo_jXvZnE .srt.sjson')
         self.assertEqual(Location(u'c4x', u'mitX', u'400', u'asset', u'subs__1eo_jXvZnE_.srt.sjson', None), asset_location)
+
+
+class ClosingStringIO(StringIO):
+    """A stream that remembers it was closed, but can still be read"""
+    closed_by_content = False
+
+    def close(self):
+        self.closed_by_content = True
+
+
+class StaticContentStreamTest(unittest.TestCase):
+    def setUp(self):
+        self.data = ''.join(chr(n % 256) for n in xrange(1000))
+        self.stream = ClosingStringIO(self.data)
+        self.content = StaticContentStream('loc', 'name', 'application/pdf', self.stream, length=len(self.data),
+                                           content_digest='abc')
+        # small chunks, to see them
+        chunk_size, content_module.STREAM_DATA_CHUNK_SIZE = content_module.STREAM_DATA_CHUNK_SIZE, 300
+        self.addCleanup(setattr, content_module, 'STREAM_DATA_CHUNK_SIZE', chunk_size)
+
+    def test_stream_data(self):
+        chunks = list(self.content.stream_data())
+        self.assertEqual([len(chunk) for chunk in chunks], [300, 300, 300, 100])
+        self.assertEqual(''.join(chunks), self.data)
+        self.assertTrue(self.stream.closed_by_content)
+
+    def test_stream_range(self):
+        self.assertEqual(''.join(self.content.stream_data(250, 849)), self.data[250:850])
+        self.assertEqual(''.join(self.content.stream_data(999, 999)), self.data[999])
+
+    def test_abandoned_stream_closed(self):
+        chunks = self.content.stream_data()
+        chunks.next()
+        chunks.close()
+        self.assertTrue(self.stream.closed_by_content)
+
+    def test_copy_to_in_mem(self):
+        content = self.content.copy_to_in_mem()
+        self.assertEqual(content.data, self.data)
+        self.assertEqual((content.length, content.content_digest), (1000, 'abc'))
+        self.assertEqual(''.join(content.stream_data(10, 19)), self.data[10:20])
+        self.assertTrue(self.stream.closed_by_content)
@@ -3,17 +3,21 @@ Ideally, it will be the only place that needs to know about any special settings
 like DISABLE_START_DATES"""
 import logging
 import time
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from functools import partial
 
 from django.conf import settings
-from django.contrib.auth.models import Group
+from django.contrib.auth.models import Group, User
+from django.db.models.signals import m2m_changed, post_save, post_delete
+from statsd import statsd
 
 from xmodule.course_module import CourseDescriptor
 from xmodule.error_module import ErrorDescriptor
 from xmodule.modulestore import Location
 from xmodule.x_module import XModule, XModuleDescriptor
 
+from request_cache.middleware import RequestCache
 from student.models import CourseEnrollmentAllowed
 from courseware.masquerade import is_masquerading_as_student
 
@@ -61,6 +65,28 @@ def has_access(user, obj, action, course_context=None):
 
     Returns a bool.  It is up to the caller to actually deny access in a way
     that makes sense in context.
+
+    Within a request (or a cached_access() block), decisions are memoized on
+    (user, obj, action, course_context): see AccessCache.
+    """
+    cache = _get_access_cache()
+    if cache is None:
+        return _has_access(user, obj, action, course_context)
+
+    key = _access_key(user, obj, action, course_context)
+    if key is None:
+        return _has_access(user, obj, action, course_context)
+    if key in cache.decisions:
+        cache.hits += 1
+        return cache.decisions[key]
+    cache.misses += 1
+    result = cache.decisions[key] = _has_access(user, obj, action, course_context)
+    return result
+
+
+def _has_access(user, obj, action, course_context):
+    """
+    Uncached has_access
     """
     # delegate the work to type-specific functions.
     # (start with more specific types, then get more general)
@@ -105,6 +131,121 @@ def get_access_group_name(obj, action):
                     .format(type(obj)))
 
 
+# ================ Memoization of access decisions =======================
+class AccessCache(object):
+    """
+    Memoizes has_access decisions, the names of users' groups and which
+    course group names exist, for the span of one request (installed by
+    AccessCacheMiddleware) or one cached_access() block.
+
+    Rendering a sequence checks 'staff' and 'load' access to every module in
+    it, and each check looks at the user's groups; with the cache the groups
+    are loaded once, and repeated checks are answered from memory.  Changes
+    to group membership, and new or deleted groups, clear the cache of the
+    thread making them.
+    """
+    def __init__(self):
+        self.decisions = {}
+        self.group_names = {}
+        self.existing_groups = {}
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self.decisions.clear()
+        self.group_names.clear()
+        self.existing_groups.clear()
+
+
+def _get_access_cache():
+    """
+    Return the AccessCache for the current request, or None if there is none
+    """
+    # The request cache only has data in the thread that imported
+    # request_cache.middleware, and in threads where the middleware has run
+    return getattr(RequestCache.get_request_cache(), 'data', {}).get('access_cache')
+
+
+@contextmanager
+def cached_access():
+    """
+    Memoize access decisions within the block, outside of a request (e.g. in a
+    management command grading many modules for each user).  Yields the
+    AccessCache, whose hits and misses count the checks saved and made.
+    """
+    request_cache = RequestCache.get_request_cache()
+    if not hasattr(request_cache, 'data'):
+        # a thread where the middleware hasn't run (see _get_access_cache)
+        request_cache.data = {}
+    data = request_cache.data
+    previous = data.get('access_cache')
+    cache = data['access_cache'] = AccessCache()
+    try:
+        yield cache
+    finally:
+        data['access_cache'] = previous
+
+
+class AccessCacheMiddleware(object):
+    """
+    Memoize access decisions for the span of each request, and report how
+    many checks were made and saved.  Must come after
+    request_cache.middleware.RequestCache.
+    """
+    def process_request(self, request):
+        RequestCache.get_request_cache().data['access_cache'] = AccessCache()
+
+    def process_response(self, request, response):
+        cache = RequestCache.get_request_cache().data.pop('access_cache', None)
+        if cache is not None and (cache.hits or cache.misses):
+            statsd.increment('courseware.access.cache.hit', cache.hits)
+            statsd.increment('courseware.access.cache.miss', cache.misses)
+        return response
+
+
+def _access_key(user, obj, action, course_context):
+    """
+    Return the key of a has_access decision in the AccessCache, or None if it
+    shouldn't be memoized
+    """
+    if isinstance(obj, (XModuleDescriptor, XModule)):
+        location = obj.location.url()
+    elif isinstance(obj, Location):
+        location = obj.url()
+    elif isinstance(obj, basestring):
+        location = obj
+    else:
+        return None
+    user_key = None if user is None else (user.id, user.is_authenticated(), is_masquerading_as_student(user))
+    return (user_key, type(obj).__name__, location, action, course_context)
+
+
+def _user_group_names(user):
+    """
+    Return the names of the groups user is in, loaded once per AccessCache
+    """
+    cache = _get_access_cache()
+    if cache is None or user.id is None:
+        return [g.name for g in user.groups.all()]
+    if user.id not in cache.group_names:
+        cache.group_names[user.id] = [g.name for g in user.groups.all()]
+    return cache.group_names[user.id]
+
+
+def _clear_access_caches(sender, **kwargs):
+    """
+    Group membership changed or a group was added or removed: forget the
+    decisions memoized in the current thread's AccessCache
+    """
+    cache = _get_access_cache()
+    if cache is not None:
+        cache.clear()
+
+m2m_changed.connect(_clear_access_caches, sender=User.groups.through, dispatch_uid='courseware.access.groups')
+post_save.connect(_clear_access_caches, sender=Group, dispatch_uid='courseware.access.group_saved')
+post_delete.connect(_clear_access_caches, sender=Group, dispatch_uid='courseware.access.group_deleted')
+
+
 # ================ Implementation helpers ================================
 def _has_access_course_desc(user, course, action):
     """
@@ -340,7 +481,12 @@ def _dispatch(table, action, user, obj):
 
 
 def _does_course_group_name_exist(name):
-    return len(Group.objects.filter(name=name)) > 0
+    cache = _get_access_cache()
+    if cache is None:
+        return len(Group.objects.filter(name=name)) > 0
+    if name not in cache.existing_groups:
+        cache.existing_groups[name] = Group.objects.filter(name=name).exists()
+    return cache.existing_groups[name]
 
 
 def _course_org_staff_group_name(location, course_context=None):
@@ -500,7 +646,7 @@ def _adjust_start_date_for_beta_testers(user, descriptor):
         # bail early if no beta testing is set up
         return descriptor.lms.start
 
-    user_groups = [g.name for g in user.groups.all()]
+    user_groups = _user_group_names(user)
 
     beta_group = course_beta_test_group_name(descriptor.location)
     if beta_group in user_groups:
@@ -553,7 +699,7 @@ def _has_access_to_location(user, location, access_level, course_context):
         return True
 
     # If not global staff, is the user in the Auth group for this class?
-    user_groups = [g.name for g in user.groups.all()]
+    user_groups = _user_group_names(user)
 
     if access_level == 'staff':
         staff_groups = group_names_for_staff(location, course_context) + \
@@ -1,20 +1,24 @@
 # Compute grades using real division, with no integer truncation
 from __future__ import division
 
+import hashlib
+import json
 import random
 import logging
 
 from collections import defaultdict
+from datetime import datetime
 from django.conf import settings
 from django.contrib.auth.models import User
 
-from .model_data import ModelDataCache, LmsKeyValueStore
+from .model_data import ModelDataCache, MultiUserModelDataCache, LmsKeyValueStore, chunks
 from xblock.core import Scope
+from .access import has_access
 from .module_render import get_module, get_module_for_descriptor
 from xmodule import graders
 from xmodule.capa_module import CapaModule
 from xmodule.graders import Score
-from .models import StudentModule
+from .models import StudentModule, StudentGradeSummary
 
 log = logging.getLogger("mitx.courseware")
 
@@ -29,6 +33,19 @@ def yield_module_descendents(module):
         yield next_module
 
 
+def yield_descriptor_descendents(descriptor):
+    """
+    This returns descriptor and all of its descendants, including every
+    possible child of descriptors with dynamic children.
+    """
+    stack = [descriptor]
+
+    while len(stack) > 0:
+        next_descriptor = stack.pop()
+        stack.extend(next_descriptor.get_children())
+        yield next_descriptor
+
+
 def yield_dynamic_descriptor_descendents(descriptor, module_creator):
     """
     This returns all of the descendants of a descriptor. If the descriptor
@@ -50,49 +67,66 @@ def yield_dynamic_descriptor_descendents(descriptor, module_creator):
         yield next_descriptor
 
 
-def yield_problems(request, course, student):
+def _iter_student_module_states(course_id, module_state_key, chunk_size=1000):
     """
-    Return an iterator over capa_modules that this student has
-    potentially answered.  (all that student has answered will definitely be in
-    the list, but there may be others as well).
+    Yields the state of every enrolled student's StudentModule for
+    module_state_key in the course.
+
+    Rows are fetched chunk_size at a time, ordered by id, so that memory use
+    doesn't grow with the number of students (the MySQLdb driver otherwise
+    buffers the whole result set client side).
     """
-    grading_context = course.grading_context
+    last_id = 0
+    while True:
+        rows = list(StudentModule.objects.filter(
+            course_id=course_id,
+            module_state_key=module_state_key,
+            student__courseenrollment__course_id=course_id,
+            id__gt=last_id,
+        ).order_by('id').values_list('id', 'state')[:chunk_size])
+
+        for row_id, state in rows:
+            yield state
+
+        if len(rows) < chunk_size:
+            break
+        last_id = rows[-1][0]
 
-    descriptor_locations = (descriptor.location.url() for descriptor in grading_context['all_descriptors'])
-    existing_student_modules = set(StudentModule.objects.filter(
-        module_state_key__in=descriptor_locations
-    ).values_list('module_state_key', flat=True))
 
-    sections_to_list = []
-    for _, sections in grading_context['graded_sections'].iteritems():
-        for section in sections:
+def iter_answer_distributions(course, chunk_size=1000):
+    """
+    Yields ((problem url_name, problem display_name, problem_id), {answer: count})
+    for every answer field of every problem in the graded sections of course.
 
-            section_descriptor = section['section_descriptor']
-
-            # If the student hasn't seen a single problem in the section, skip it.
-            for moduledescriptor in section['xmoduledescriptors']:
-                if moduledescriptor.location.url() in existing_student_modules:
-                    sections_to_list.append(section_descriptor)
-                    break
-
-    model_data_cache = ModelDataCache(sections_to_list, course.id, student)
-    for section_descriptor in sections_to_list:
-        section_module = get_module(student, request,
-                                    section_descriptor.location, model_data_cache,
-                                    course.id)
-        if section_module is None:
-            # student doesn't have access to this module, or something else
-            # went wrong.
-            # log.debug("couldn't get module for student {0} for section location {1}"
-            #           .format(student.username, section_descriptor.location))
-            continue
+    The answers are read straight from the stored StudentModule state, one
+    problem at a time, without instantiating the problems.
+    """
+    problems = [
+        descriptor for descriptor in course.grading_context['all_descriptors']
+        if issubclass(descriptor.module_class, CapaModule)
+    ]
+
+    for descriptor in problems:
+        counts = defaultdict(lambda: defaultdict(int))
 
-        for problem in yield_module_descendents(section_module):
-            if isinstance(problem, CapaModule):
-                yield problem
+        for state in _iter_student_module_states(course.id, descriptor.location.url(), chunk_size):
+            if state is None:
+                continue
+            try:
+                student_answers = json.loads(state).get('student_answers') or {}
+            except ValueError:
+                log.warning("Unable to parse state of %s", descriptor.location.url())
+                continue
+
+            for problem_id, answer in student_answers.iteritems():
+                # Answer can be a list or some other unhashable element.  Convert to string.
+                counts[problem_id][unicode(answer)] += 1
 
+        for problem_id, answers in counts.iteritems():
+            yield (descriptor.url_name, descriptor.display_name_with_default, problem_id), answers
 
-def answer_distributions(request, course):
+
+def answer_distributions(course):
     """
     Given a course_descriptor, compute frequencies of answers for each problem:
 
@@ -100,23 +134,9 @@ def answer_distributions(request, course):
 
     dict: (problem url_name, problem display_name, problem_id) -> (dict : answer ->  count)
 
-    TODO (vshnayder): this is currently doing a full linear pass through all
-    students and all problems.  This will be just a little slow.
+    See iter_answer_distributions to process one problem at a time.
     """
-
-    counts = defaultdict(lambda: defaultdict(int))
-
-    enrolled_students = User.objects.filter(courseenrollment__course_id=course.id)
-
-    for student in enrolled_students:
-        for capa_module in yield_problems(request, course, student):
-            for problem_id in capa_module.lcp.student_answers:
-                # Answer can be a list or some other unhashable element.  Convert to string.
-                answer = str(capa_module.lcp.student_answers[problem_id])
-                key = (capa_module.url_name, capa_module.display_name_with_default, problem_id)
-                counts[key][answer] += 1
-
-    return counts
+    return dict(iter_answer_distributions(course))
 
 
 def grade(student, request, course, model_data_cache=None, keep_raw_scores=False):
@@ -137,83 +157,129 @@ def grade(student, request, course, model_data_cache=None, keep_raw_scores=False
 
     More information on the format is in the docstring for CourseGrader.
     """
+    if model_data_cache is None:
+        model_data_cache = ModelDataCache(course.grading_context['all_descriptors'], course.id, student)
 
-    grading_context = course.grading_context
-    raw_scores = []
+    section_scores = dict(
+        (section_key(section), grade_section(student, request, course, section, model_data_cache))
+        for section in graded_sections(course)
+    )
+    return summarize_section_scores(course, section_scores, keep_raw_scores)
 
-    if model_data_cache is None:
-        model_data_cache = ModelDataCache(grading_context['all_descriptors'], course.id, student)
 
+def graded_sections(course):
+    """
+    Yields the graded sections of course (the entries of
+    course.grading_context['graded_sections']), in grading order
+    """
+    for sections in course.grading_context['graded_sections'].itervalues():
+        for section in sections:
+            yield section
+
+
+def section_key(section):
+    """
+    Return the key that identifies a graded section in a section_scores dict
+    """
+    return section['section_descriptor'].location.url()
+
+
+def grade_section(student, request, course, section, model_data_cache):
+    """
+    Grade a single graded section of the course for student.
+
+    section: an entry of course.grading_context['graded_sections']
+    model_data_cache: a ModelDataCache that contains the student's state for
+        all of the descendents of the section
+
+    Returns a tuple (graded_total, raw_scores), where graded_total is the
+    aggregated Score for the section and raw_scores the Scores of the problems
+    in it.
+    """
+    section_descriptor = section['section_descriptor']
+    section_name = section_descriptor.display_name_with_default
+
+    should_grade_section = False
+    # If we haven't seen a single problem in the section, we don't have to grade it at all! We can assume 0%
+    for moduledescriptor in section['xmoduledescriptors']:
+        # some problems have state that is updated independently of interaction
+        # with the LMS, so they need to always be scored. (E.g. foldit.)
+        if moduledescriptor.always_recalculate_grades:
+            should_grade_section = True
+            break
+
+        # Create a fake key to pull out a StudentModule object from the ModelDataCache
+
+        key = LmsKeyValueStore.Key(
+            Scope.user_state,
+            student.id,
+            moduledescriptor.location,
+            None
+        )
+        if model_data_cache.find(key):
+            should_grade_section = True
+            break
+
+    if not should_grade_section:
+        return Score(0.0, 1.0, True, section_name), []
+
+    scores = []
+
+    def create_module(descriptor):
+        '''creates an XModule instance given a descriptor'''
+        # TODO: We need the request to pass into here. If we could forego that, our arguments
+        # would be simpler
+        return get_module_for_descriptor(student, request, descriptor, model_data_cache, course.id)
+
+    for module_descriptor in yield_dynamic_descriptor_descendents(section_descriptor, create_module):
+
+        (correct, total) = get_score(course.id, student, module_descriptor, create_module, model_data_cache)
+        if correct is None and total is None:
+            continue
+
+        if settings.GENERATE_PROFILE_SCORES:  	# for debugging!
+            if total > 1:
+                correct = random.randrange(max(total - 2, 1), total + 1)
+            else:
+                correct = total
+
+        graded = module_descriptor.lms.graded
+        if not total > 0:
+            #We simply cannot grade a problem that is 12/0, because we might need it as a percentage
+            graded = False
+
+        scores.append(Score(correct, total, graded, module_descriptor.display_name_with_default))
+
+    _, graded_total = graders.aggregate_scores(scores, section_name)
+    return graded_total, scores
+
+
+def summarize_section_scores(course, section_scores, keep_raw_scores=False):
+    """
+    Run the course grader over already graded sections, and return the same
+    result as grade().
+
+    section_scores: a dictionary mapping section_key(section) to the
+        (graded_total, raw_scores) returned by grade_section, for every
+        graded section of the course
+    """
+    raw_scores = []
     totaled_scores = {}
     # This next complicated loop is just to collect the totaled_scores, which is
     # passed to the grader
-    for section_format, sections in grading_context['graded_sections'].iteritems():
+    for section_format, sections in course.grading_context['graded_sections'].iteritems():
         format_scores = []
         for section in sections:
-            section_descriptor = section['section_descriptor']
-            section_name = section_descriptor.display_name_with_default
-
-            should_grade_section = False
-            # If we haven't seen a single problem in the section, we don't have to grade it at all! We can assume 0%
-            for moduledescriptor in section['xmoduledescriptors']:
-                # some problems have state that is updated independently of interaction
-                # with the LMS, so they need to always be scored. (E.g. foldit.)
-                if moduledescriptor.always_recalculate_grades:
-                    should_grade_section = True
-                    break
-
-                # Create a fake key to pull out a StudentModule object from the ModelDataCache
-
-                key = LmsKeyValueStore.Key(
-                    Scope.user_state,
-                    student.id,
-                    moduledescriptor.location,
-                    None
-                )
-                if model_data_cache.find(key):
-                    should_grade_section = True
-                    break
-
-            if should_grade_section:
-                scores = []
-
-                def create_module(descriptor):
-                    '''creates an XModule instance given a descriptor'''
-                    # TODO: We need the request to pass into here. If we could forego that, our arguments
-                    # would be simpler
-                    return get_module_for_descriptor(student, request, descriptor, model_data_cache, course.id)
-
-                for module_descriptor in yield_dynamic_descriptor_descendents(section_descriptor, create_module):
-
-                    (correct, total) = get_score(course.id, student, module_descriptor, create_module, model_data_cache)
-                    if correct is None and total is None:
-                        continue
-
-                    if settings.GENERATE_PROFILE_SCORES:  	# for debugging!
-                        if total > 1:
-                            correct = random.randrange(max(total - 2, 1), total + 1)
-                        else:
-                            correct = total
-
-                    graded = module_descriptor.lms.graded
-                    if not total > 0:
-                        #We simply cannot grade a problem that is 12/0, because we might need it as a percentage
-                        graded = False
-
-                    scores.append(Score(correct, total, graded, module_descriptor.display_name_with_default))
-
-                _, graded_total = graders.aggregate_scores(scores, section_name)
-                if keep_raw_scores:
-                    raw_scores += scores
-            else:
-                graded_total = Score(0.0, 1.0, True, section_name)
+            graded_total, scores = section_scores[section_key(section)]
+            if keep_raw_scores:
+                raw_scores += scores
 
             #Add the graded total to totaled_scores
             if graded_total.possible > 0:
                 format_scores.append(graded_total)
             else:
                 log.exception("Unable to grade a section with a total possible score of zero. " +
-                              str(section_descriptor.location))
+                              str(section['section_descriptor'].location))
 
         totaled_scores[section_format] = format_scores
 
@@ -232,6 +298,241 @@ def grade(student, request, course, model_data_cache=None, keep_raw_scores=False
     return grade_summary
 
 
+def grading_version(course):
+    """
+    Return a string that identifies the grading policy and the graded structure
+    of course (which sections are graded, and the weighted problems in them).
+
+    A grade summary stored for a student is only valid for the grading_version
+    it was computed with.
+    """
+    graded_sections = []
+    for section_format, sections in sorted(course.grading_context['graded_sections'].iteritems()):
+        for section in sections:
+            graded_sections.append([
+                section_format,
+                section['section_descriptor'].location.url(),
+                [(descriptor.location.url(), getattr(descriptor, 'weight', None))
+                 for descriptor in section['xmoduledescriptors']],
+            ])
+
+    version_data = json.dumps({
+        'grader': course.raw_grader,
+        'grade_cutoffs': course.grade_cutoffs,
+        'graded_sections': graded_sections,
+    }, sort_keys=True)
+    return hashlib.sha1(version_data).hexdigest()
+
+
+def _dump_grade_summary(grade_summary):
+    """
+    Serialize the output of grade() to JSON, keeping the fields of the Score
+    namedtuples in totaled_scores and raw_scores
+    """
+    grade_summary = dict(grade_summary)
+    grade_summary['totaled_scores'] = dict(
+        (section_format, [score._asdict() for score in scores])
+        for section_format, scores in grade_summary['totaled_scores'].iteritems()
+    )
+    if 'raw_scores' in grade_summary:
+        grade_summary['raw_scores'] = [score._asdict() for score in grade_summary['raw_scores']]
+    return json.dumps(grade_summary)
+
+
+def _load_grade_summary(summary):
+    """
+    Inverse of _dump_grade_summary
+    """
+    grade_summary = json.loads(summary)
+    grade_summary['totaled_scores'] = dict(
+        (section_format, [Score(**score) for score in scores])
+        for section_format, scores in grade_summary['totaled_scores'].iteritems()
+    )
+    if 'raw_scores' in grade_summary:
+        grade_summary['raw_scores'] = [Score(**score) for score in grade_summary['raw_scores']]
+    return grade_summary
+
+
+def _dump_section_scores(section_scores):
+    """
+    Serialize a section_scores dictionary (see summarize_section_scores) to JSON
+    """
+    return json.dumps(dict(
+        (key, {'graded_total': graded_total._asdict(), 'raw_scores': [score._asdict() for score in scores]})
+        for key, (graded_total, scores) in section_scores.iteritems()
+    ))
+
+
+def _load_section_scores(section_scores):
+    """
+    Inverse of _dump_section_scores
+    """
+    return dict(
+        (key, (Score(**value['graded_total']), [Score(**score) for score in value['raw_scores']]))
+        for key, value in json.loads(section_scores).iteritems()
+    )
+
+
+def _sections_to_regrade(student, course, stored_summary):
+    """
+    Return the keys of the sections of course whose stored scores in
+    stored_summary may no longer be correct: the sections containing a
+    StudentModule that has changed since the summary was graded, if it has
+    been marked stale, and the sections whose problems always need to be
+    rescored.
+    """
+    changed_locations = set()
+    if stored_summary.stale:
+        changed_locations = set(StudentModule.objects.filter(
+            student=student,
+            course_id=course.id,
+            modified__gte=stored_summary.graded_at,
+        ).values_list('module_state_key', flat=True))
+
+    sections = set()
+    for section in graded_sections(course):
+        for descriptor in section['xmoduledescriptors']:
+            if descriptor.always_recalculate_grades or descriptor.location.url() in changed_locations:
+                sections.add(section_key(section))
+                break
+    return sections
+
+
+def _can_update(stored_summary, version):
+    """
+    Return whether stored_summary (which may be None) holds section scores for
+    grading version `version` that can be brought up to date by regrading
+    individual sections, rather than the whole course
+    """
+    return (
+        stored_summary is not None and
+        stored_summary.grading_version == version and
+        stored_summary.section_scores is not None and
+        stored_summary.graded_at is not None
+    )
+
+
+def _regrade_and_store(student, request, course, version, stored_summary,
+                       model_data_cache=None, sections=None):
+    """
+    Grade student, and store the result in their StudentGradeSummary for course.
+
+    sections: if not None, the keys of the only sections that need regrading;
+        the scores of the other sections are taken from stored_summary.
+    model_data_cache: a ModelDataCache for all of the descendents of the
+        sections being regraded. If None, one is loaded.
+    """
+    if stored_summary is None:
+        stored_summary, _ = StudentGradeSummary.objects.get_or_create(user=student, course_id=course.id)
+
+    # Clear the stale flag before grading, so that a score change that happens
+    # while we are grading marks the summary we are about to store as stale again.
+    summaries = StudentGradeSummary.objects.filter(pk=stored_summary.pk)
+    graded_at = datetime.now()
+    summaries.update(stale=False)
+    try:
+        if sections is None:
+            if model_data_cache is None:
+                model_data_cache = ModelDataCache(course.grading_context['all_descriptors'], course.id, student)
+            section_scores = {}
+            sections_to_grade = list(graded_sections(course))
+        else:
+            section_scores = _load_section_scores(stored_summary.section_scores)
+            sections_to_grade = [section for section in graded_sections(course) if section_key(section) in sections]
+            if model_data_cache is None and sections_to_grade:
+                descriptors = []
+                for section in sections_to_grade:
+                    descriptors.extend(yield_descriptor_descendents(section['section_descriptor']))
+                model_data_cache = ModelDataCache(descriptors, course.id, student)
+
+        for section in sections_to_grade:
+            section_scores[section_key(section)] = grade_section(student, request, course, section, model_data_cache)
+        grade_summary = summarize_section_scores(course, section_scores, keep_raw_scores=True)
+    except:
+        summaries.update(stale=True)
+        raise
+
+    summaries.update(
+        summary=_dump_grade_summary(grade_summary),
+        section_scores=_dump_section_scores(section_scores),
+        grading_version=version,
+        graded_at=graded_at,
+    )
+    return grade_summary
+
+
+def _stored_grade(student, request, course, version, stored_summary, model_data_cache=None):
+    """
+    Return the grade summary for student from stored_summary (which may be None),
+    regrading only the sections that have changed since it was stored, or the
+    whole course if it can't be updated section by section.
+    """
+    if not _can_update(stored_summary, version):
+        return _regrade_and_store(student, request, course, version, stored_summary, model_data_cache)
+
+    sections = _sections_to_regrade(student, course, stored_summary)
+    if not sections and not stored_summary.stale:
+        return _load_grade_summary(stored_summary.summary)
+    return _regrade_and_store(student, request, course, version, stored_summary, model_data_cache, sections)
+
+
+def cached_grade(student, request, course, model_data_cache=None, keep_raw_scores=False):
+    """
+    Return the same result as grade(), from the student's stored grade summary
+    if it is still current. If the student's scores have changed since it was
+    stored, only the affected sections are regraded; if the grading policy or
+    course structure have changed, the whole course is regraded.
+    """
+    if not student.is_authenticated():
+        return grade(student, request, course, model_data_cache, keep_raw_scores)
+
+    version = grading_version(course)
+    try:
+        stored_summary = StudentGradeSummary.objects.get(user=student, course_id=course.id)
+    except StudentGradeSummary.DoesNotExist:
+        stored_summary = None
+
+    grade_summary = _stored_grade(student, request, course, version, stored_summary, model_data_cache)
+    if not keep_raw_scores:
+        grade_summary.pop('raw_scores', None)
+    return grade_summary
+
+
+def iter_cached_grades(students, request, course, keep_raw_scores=False, block_size=100):
+    """
+    Yields (student, grade_summary) for each of students, where grade_summary is
+    the result of cached_grade(). Stored summaries are read for block_size
+    students at a time, and the students who need to be graded from scratch
+    are graded using a shared MultiUserModelDataCache.
+    """
+    version = grading_version(course)
+    all_descriptors = course.grading_context['all_descriptors']
+
+    for block in chunks(students, block_size):
+        stored_summaries = dict(
+            (stored_summary.user_id, stored_summary)
+            for stored_summary in StudentGradeSummary.objects.filter(
+                course_id=course.id,
+                user__in=[student.id for student in block],
+            )
+        )
+
+        to_grade = [student for student in block if not _can_update(stored_summaries.get(student.id), version)]
+        multi_user_cache = MultiUserModelDataCache(all_descriptors, course.id, to_grade)
+
+        for student in block:
+            stored_summary = stored_summaries.get(student.id)
+            if student in to_grade:
+                model_data_cache = multi_user_cache.cache_for_user(student)
+            else:
+                model_data_cache = None
+            grade_summary = _stored_grade(student, request, course, version, stored_summary, model_data_cache)
+
+            if not keep_raw_scores:
+                grade_summary.pop('raw_scores', None)
+            yield student, grade_summary
+
+
 def grade_for_percentage(grade_cutoffs, percentage):
     """
     Returns a letter grade as defined in grading_policy (e.g. 'A' 'B' 'C' for 6.002x) or None.
@@ -382,15 +683,23 @@ def get_score(course_id, user, problem_descriptor, module_creator, model_data_ca
         correct = student_module.grade if student_module.grade is not None else 0
         total = student_module.max_grade
     else:
-        # If the problem was not in the cache, or hasn't been graded yet,
-        # we need to instantiate the problem.
-        # Otherwise, the max score (cached in student_module) won't be available
-        problem = module_creator(problem_descriptor)
-        if problem is None:
-            return (None, None)
-
+        # If the problem was not in the cache, or hasn't been graded yet, the
+        # max score (cached in student_module) isn't available. Use the max
+        # score stored with the problem, if it has one, rather than
+        # instantiating the problem.
         correct = 0.0
-        total = problem.max_score()
+        total = None
+        if hasattr(problem_descriptor, 'max_score'):
+            if not has_access(user, problem_descriptor, 'load', course_id):
+                return (None, None)
+            total = problem_descriptor.max_score()
+
+        if total is None:
+            problem = module_creator(problem_descriptor)
+            if problem is None:
+                return (None, None)
+
+            total = problem.max_score()
 
         # Problem may be an error module (if something in the problem builder failed)
         # In which case total might be None
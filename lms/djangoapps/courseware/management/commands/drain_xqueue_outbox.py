@@ -0,0 +1,51 @@
+#!/usr/bin/python
+#
+# django management command: deliver the submissions to xqueue that were
+# stored in the outbox because they couldn't be delivered at the time
+
+import time
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from courseware.module_render import xqueue_interface
+
+
+class Command(BaseCommand):
+    help = "Deliver submissions waiting in the xqueue outbox.\n"
+    help += "Usage: drain_xqueue_outbox [--loop [--interval SECONDS]]"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size',
+                    type='int',
+                    dest='batch_size',
+                    default=100,
+                    help='Maximum number of submissions delivered per pass.'),
+        make_option('--loop',
+                    action='store_true',
+                    dest='loop',
+                    default=False,
+                    help='Keep draining the outbox instead of stopping after one pass.'),
+        make_option('--interval',
+                    type='float',
+                    dest='interval',
+                    default=5,
+                    help='Seconds to wait between passes when there is nothing to deliver.'),
+    )
+
+    def handle(self, *args, **options):
+        outbox = xqueue_interface.outbox
+        if outbox is None:
+            print "The xqueue outbox is disabled (XQUEUE_CLIENT['use_outbox'])"
+            return
+
+        while True:
+            (delivered, failed) = outbox.drain(xqueue_interface, options['batch_size'])
+            if delivered or failed:
+                print "%d delivered, %d failed, %d waiting, %d given up" % (
+                    delivered, failed, outbox.depth(), outbox.failed_count())
+            if not options['loop']:
+                return
+            if delivered + failed < options['batch_size']:
+                time.sleep(options['interval'])
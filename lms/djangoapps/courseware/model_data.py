@@ -32,12 +32,108 @@ def chunks(items, chunk_size):
     return (items[i:i + chunk_size] for i in xrange(0, len(items), chunk_size))
 
 
+def _fields_to_cache(descriptors):
+    """
+    Returns a map of scopes to the fields in that scope of descriptors
+    """
+    scope_map = defaultdict(set)
+    for descriptor in descriptors:
+        for field in (descriptor.module_class.fields + descriptor.module_class.lms.fields):
+            scope_map[field.scope].add(field)
+    return scope_map
+
+
+def _query(model_class, select_for_update=False, **kwargs):
+    """
+    Queries model_class with **kwargs, optionally adding select_for_update
+    """
+    query = model_class.objects
+    if select_for_update:
+        query = query.select_for_update()
+    query = query.filter(**kwargs)
+    return query
+
+
+def _chunked_query(model_class, chunk_field, items, chunk_size=500, select_for_update=False, **kwargs):
+    """
+    Queries model_class with `chunk_field` set to chunks of size `chunk_size`,
+    and all other parameters from `**kwargs`
+
+    This works around a limitation in sqlite3 on the number of parameters
+    that can be put into a single query
+    """
+    res = chain.from_iterable(
+        _query(model_class, select_for_update, **dict([(chunk_field, chunk)] + kwargs.items()))
+        for chunk in chunks(items, chunk_size)
+    )
+    return res
+
+
+def _retrieve_fields(descriptors, course_id, scope, fields, student_filter, select_for_update=False):
+    """
+    Queries the database for all of the fields in the specified scope of
+    descriptors in course_id.
+
+    student_filter: The query arguments selecting the students whose
+        per-student rows are loaded, e.g. {'student': user.pk}
+    select_for_update: True if rows should be locked until end of transaction
+    """
+    if scope in (Scope.children, Scope.parent):
+        return []
+    elif scope == Scope.user_state:
+        return _chunked_query(
+            StudentModule,
+            'module_state_key__in',
+            (descriptor.location.url() for descriptor in descriptors),
+            select_for_update=select_for_update,
+            course_id=course_id,
+            **student_filter
+        )
+    elif scope == Scope.content:
+        return _chunked_query(
+            XModuleContentField,
+            'definition_id__in',
+            (descriptor.location.url() for descriptor in descriptors),
+            select_for_update=select_for_update,
+            field_name__in=set(field.name for field in fields),
+        )
+    elif scope == Scope.settings:
+        return _chunked_query(
+            XModuleSettingsField,
+            'usage_id__in',
+            (
+                '%s-%s' % (course_id, descriptor.location.url())
+                for descriptor in descriptors
+            ),
+            select_for_update=select_for_update,
+            field_name__in=set(field.name for field in fields),
+        )
+    elif scope == Scope.preferences:
+        return _chunked_query(
+            XModuleStudentPrefsField,
+            'module_type__in',
+            set(descriptor.location.category for descriptor in descriptors),
+            select_for_update=select_for_update,
+            field_name__in=set(field.name for field in fields),
+            **student_filter
+        )
+    elif scope == Scope.user_info:
+        return _query(
+            XModuleStudentInfoField,
+            select_for_update,
+            field_name__in=set(field.name for field in fields),
+            **student_filter
+        )
+    else:
+        raise InvalidScopeError(scope)
+
+
 class ModelDataCache(object):
     """
     A cache of django model objects needed to supply the data
     for a module and its decendants
     """
-    def __init__(self, descriptors, course_id, user, select_for_update=False):
+    def __init__(self, descriptors, course_id, user, select_for_update=False, prefetched=None):
         '''
         Find any courseware.models objects that are needed by any descriptor
         in descriptors. Attempts to minimize the number of queries to the database.
@@ -49,6 +145,9 @@ class ModelDataCache(object):
         course_id: The id of the current course
         user: The user for which to cache data
         select_for_update: True if rows should be locked until end of transaction
+        prefetched: A dictionary of already loaded model objects, keyed the way
+            this cache keys them. If supplied, no queries are made (see
+            MultiUserModelDataCache)
         '''
         self.cache = {}
         self.descriptors = descriptors
@@ -56,7 +155,9 @@ class ModelDataCache(object):
         self.course_id = course_id
         self.user = user
 
-        if user.is_authenticated():
+        if prefetched is not None:
+            self.cache = prefetched
+        elif user.is_authenticated():
             for scope, fields in self._fields_to_cache().items():
                 for field_object in self._retrieve_fields(scope, fields):
                     self.cache[self._cache_key_from_field_object(scope, field_object)] = field_object
@@ -103,88 +204,20 @@ class ModelDataCache(object):
 
         return ModelDataCache(descriptors, course_id, user, select_for_update)
 
-    def _query(self, model_class, **kwargs):
-        """
-        Queries model_class with **kwargs, optionally adding select_for_update if
-        self.select_for_update is set
-        """
-        query = model_class.objects
-        if self.select_for_update:
-            query = query.select_for_update()
-        query = query.filter(**kwargs)
-        return query
-
-    def _chunked_query(self, model_class, chunk_field, items, chunk_size=500, **kwargs):
-        """
-        Queries model_class with `chunk_field` set to chunks of size `chunk_size`,
-        and all other parameters from `**kwargs`
-
-        This works around a limitation in sqlite3 on the number of parameters
-        that can be put into a single query
-        """
-        res = chain.from_iterable(
-            self._query(model_class, **dict([(chunk_field, chunk)] + kwargs.items()))
-            for chunk in chunks(items, chunk_size)
-        )
-        return res
-
     def _retrieve_fields(self, scope, fields):
         """
         Queries the database for all of the fields in the specified scope
         """
-        if scope in (Scope.children, Scope.parent):
-            return []
-        elif scope == Scope.user_state:
-            return self._chunked_query(
-                StudentModule,
-                'module_state_key__in',
-                (descriptor.location.url() for descriptor in self.descriptors),
-                course_id=self.course_id,
-                student=self.user.pk,
-            )
-        elif scope == Scope.content:
-            return self._chunked_query(
-                XModuleContentField,
-                'definition_id__in',
-                (descriptor.location.url() for descriptor in self.descriptors),
-                field_name__in=set(field.name for field in fields),
-            )
-        elif scope == Scope.settings:
-            return self._chunked_query(
-                XModuleSettingsField,
-                'usage_id__in',
-                (
-                    '%s-%s' % (self.course_id, descriptor.location.url())
-                    for descriptor in self.descriptors
-                ),
-                field_name__in=set(field.name for field in fields),
-            )
-        elif scope == Scope.preferences:
-            return self._chunked_query(
-                XModuleStudentPrefsField,
-                'module_type__in',
-                set(descriptor.location.category for descriptor in self.descriptors),
-                student=self.user.pk,
-                field_name__in=set(field.name for field in fields),
-            )
-        elif scope == Scope.user_info:
-            return self._query(
-                XModuleStudentInfoField,
-                student=self.user.pk,
-                field_name__in=set(field.name for field in fields),
-            )
-        else:
-            raise InvalidScopeError(scope)
+        return _retrieve_fields(
+            self.descriptors, self.course_id, scope, fields,
+            {'student': self.user.pk}, self.select_for_update,
+        )
 
     def _fields_to_cache(self):
         """
         Returns a map of scopes to fields in that scope that should be cached
         """
-        scope_map = defaultdict(set)
-        for descriptor in self.descriptors:
-            for field in (descriptor.module_class.fields + descriptor.module_class.lms.fields):
-                scope_map[field.scope].add(field)
-        return scope_map
+        return _fields_to_cache(self.descriptors)
 
     def _cache_key_from_kvs_key(self, key):
         """
@@ -201,7 +234,8 @@ class ModelDataCache(object):
         elif key.scope == Scope.user_info:
             return (key.scope, key.field_name)
 
-    def _cache_key_from_field_object(self, scope, field_object):
+    @staticmethod
+    def _cache_key_from_field_object(scope, field_object):
         """
         Return the key used in the ModelDataCache for the specified scope and
         field
@@ -273,6 +307,53 @@ class ModelDataCache(object):
         return field_object
 
 
+class MultiUserModelDataCache(object):
+    """
+    Loads the django model objects needed to supply the data for a list of
+    descriptors to many users at once.
+
+    Per-user rows (StudentModules, preferences and user info) are loaded for
+    all of `users` in the same chunked queries, and the user-independent
+    content and settings rows are loaded only once. Use `cache_for_user` to
+    get a ModelDataCache for a single user that is backed by the loaded rows,
+    without making any further queries.
+    """
+    USER_SCOPES = (Scope.user_state, Scope.preferences, Scope.user_info)
+
+    def __init__(self, descriptors, course_id, users):
+        '''
+        Arguments
+        descriptors: A list of XModuleDescriptors.
+        course_id: The id of the current course
+        users: The users for which to cache data
+        '''
+        self.descriptors = descriptors
+        self.course_id = course_id
+        self.users = [user for user in users if user.is_authenticated()]
+
+        self.shared_cache = {}
+        self.user_caches = defaultdict(dict)
+
+        if self.users:
+            student_filter = {'student__in': [user.pk for user in self.users]}
+            for scope, fields in _fields_to_cache(self.descriptors).items():
+                for field_object in _retrieve_fields(self.descriptors, course_id, scope, fields, student_filter):
+                    cache_key = ModelDataCache._cache_key_from_field_object(scope, field_object)
+                    if scope in self.USER_SCOPES:
+                        self.user_caches[field_object.student_id][cache_key] = field_object
+                    else:
+                        self.shared_cache[cache_key] = field_object
+
+    def cache_for_user(self, user):
+        """
+        Return a ModelDataCache for `user` that is populated from the data
+        loaded by this object
+        """
+        prefetched = dict(self.shared_cache)
+        prefetched.update(self.user_caches.get(user.pk, {}))
+        return ModelDataCache(self.descriptors, self.course_id, user, prefetched=prefetched)
+
+
 class LmsKeyValueStore(KeyValueStore):
     """
     This KeyValueStore will read data from descriptor_model_data if it exists,
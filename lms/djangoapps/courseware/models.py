@@ -14,7 +14,7 @@ ASSUMPTIONS: modules have unique IDs, even across different module_types
 """
 from django.contrib.auth.models import User
 from django.db import models
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
 class StudentModule(models.Model):
@@ -262,3 +262,159 @@ class OfflineComputedGradeLog(models.Model):
 
     def __unicode__(self):
         return "[OCGLog] %s: %s" % (self.course_id, self.created)
+
+
+class StudentGradeSummary(models.Model):
+    """
+    The most recently computed grade summary (the output of grades.grade) for
+    a student in a course, so that it can be shown without regrading the course.
+
+    grading_version identifies the grading policy and graded course structure
+    that the summary was computed against; a summary computed against any other
+    version is out of date. stale is set whenever one of the student's scores
+    in the course changes.
+    """
+    user = models.ForeignKey(User, db_index=True)
+    course_id = models.CharField(max_length=255, db_index=True)
+
+    grading_version = models.CharField(max_length=40, blank=True)
+    stale = models.BooleanField(default=True)
+    summary = models.TextField(null=True, blank=True)   # grade summary, stored as JSON
+
+    # The aggregated and raw scores of each graded section, stored as JSON, so
+    # that a score change only requires the affected section to be regraded
+    section_scores = models.TextField(null=True, blank=True)
+    # When the section scores were computed. StudentModules modified after
+    # this mark the sections containing them as needing to be regraded.
+    graded_at = models.DateTimeField(null=True, blank=True)
+
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+    modified = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        unique_together = (('user', 'course_id'), )
+
+    @receiver(post_save, sender=StudentModule)
+    def invalidate(sender, instance, **kwargs):
+        """
+        Mark the grade summary for the student out of date when a graded
+        StudentModule changes
+        """
+        if instance.grade is None and instance.max_grade is None:
+            return
+        StudentGradeSummary.objects.filter(
+            user=instance.student_id,
+            course_id=instance.course_id
+        ).update(stale=True)
+
+    @receiver(post_delete, sender=StudentModule)
+    def invalidate_all(sender, instance, **kwargs):
+        """
+        Force a full regrade of the student when a graded StudentModule is
+        deleted, since there is no longer a row to show which section changed
+        """
+        if instance.grade is None and instance.max_grade is None:
+            return
+        StudentGradeSummary.objects.filter(
+            user=instance.student_id,
+            course_id=instance.course_id
+        ).update(stale=True, grading_version='')
+
+    def __unicode__(self):
+        return "[StudentGradeSummary] %s: %s (%s, stale=%s)" % (self.user, self.course_id,
+                                                                self.grading_version, self.stale)
+
+
+class ProblemRescore(models.Model):
+    """
+    A run of instructor.rescore.rescore_problem over every student's answers
+    to a problem, recording its progress so that it can be shown on the
+    instructor dashboard and an interrupted run can be resumed.
+
+    checkpoint is the id of the last StudentModule whose new score has been
+    saved: StudentModules are rescored in order of id, and the checkpoint is
+    moved in the same transaction as the scores it covers are saved.
+    """
+    class Meta:
+        ordering = ["-created"]
+        get_latest_by = "created"
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = ((QUEUED, 'Queued'),
+                (RUNNING, 'Running'),
+                (DONE, 'Done'),
+                (FAILED, 'Failed'),
+                )
+
+    course_id = models.CharField(max_length=255, db_index=True)
+    module_state_key = models.CharField(max_length=255, db_column='module_id')
+    requested_by = models.ForeignKey(User, null=True, blank=True)
+    status = models.CharField(max_length=16, choices=STATUSES, default=QUEUED)
+
+    # Numbers of StudentModules: to rescore in total; rescored so far; whose
+    # scores changed; that had nothing to rescore; that couldn't be rescored
+    total = models.IntegerField(default=0)
+    attempted = models.IntegerField(default=0)
+    updated = models.IntegerField(default=0)
+    skipped = models.IntegerField(default=0)
+    failed = models.IntegerField(default=0)
+    checkpoint = models.IntegerField(default=0)
+    error = models.TextField(null=True, blank=True)
+
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    def progress(self):
+        """
+        Return the state of the run as a dict that can be serialized to JSON
+        """
+        return {
+            'id': self.id,
+            'location': self.module_state_key,
+            'status': self.status,
+            'total': self.total,
+            'attempted': self.attempted,
+            'updated': self.updated,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'error': self.error,
+            'created': self.created.isoformat() if self.created else None,
+            'modified': self.modified.isoformat() if self.modified else None,
+        }
+
+    def __unicode__(self):
+        return "[ProblemRescore] %s: %s (%s, %d/%d)" % (self.course_id, self.module_state_key,
+                                                        self.status, self.attempted, self.total)
+
+
+class PendingXQueueSubmission(models.Model):
+    """
+    A submission to the external grader that couldn't be delivered from the
+    student's request, stored to be delivered by the drain_xqueue_outbox
+    command.  See courseware.xqueue_outbox.
+
+    While a worker delivers it, a submission is claimed_by that worker and
+    its next_attempt is pushed back, so no other worker takes it.  Once it
+    has been turned down by xqueue, or has failed too many times, it is
+    kept as failed and no longer tried.
+    """
+    class Meta:
+        ordering = ["id"]
+
+    header = models.TextField()
+    body = models.TextField()
+    # JSON list of [file name, base64 file contents]
+    files = models.TextField(default='[]')
+
+    attempts = models.IntegerField(default=0)
+    last_error = models.CharField(max_length=255, null=True, blank=True)
+    next_attempt = models.DateTimeField(db_index=True)
+    claimed_by = models.CharField(max_length=64, null=True, blank=True)
+    failed = models.BooleanField(default=False, db_index=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __unicode__(self):
+        return "[PendingXQueueSubmission] %s (%d attempts)" % (self.header, self.attempts)
@@ -34,6 +34,7 @@ from xmodule.error_module import ErrorDescriptor, NonStaffErrorDescriptor
 from xblock.runtime import DbModel
 from xmodule_modifiers import replace_course_urls, replace_static_urls, add_histogram, wrap_xmodule
 from .model_data import LmsKeyValueStore, LmsUsage, ModelDataCache
+from .xqueue_outbox import SQLOutbox
 
 from xmodule.modulestore.exceptions import ItemNotFoundError
 from statsd import statsd
@@ -46,10 +47,15 @@ if settings.XQUEUE_INTERFACE.get('basic_auth') is not None:
 else:
     requests_auth = None
 
+xqueue_client = dict(settings.XQUEUE_CLIENT)
+xqueue_outbox = SQLOutbox() if xqueue_client.pop('use_outbox', False) else None
+
 xqueue_interface = XQueueInterface(
     settings.XQUEUE_INTERFACE['url'],
     settings.XQUEUE_INTERFACE['django_auth'],
     requests_auth,
+    outbox=xqueue_outbox,
+    **xqueue_client
 )
 
 
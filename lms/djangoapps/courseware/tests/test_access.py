@@ -1,9 +1,11 @@
 import unittest
 import logging
+import threading
 import time
 from mock import Mock, MagicMock, patch
 
 from django.conf import settings
+from django.contrib.auth.models import Group, User
 from django.test import TestCase
 
 from xmodule.course_module import CourseDescriptor
@@ -112,3 +114,53 @@ class AccessTestCase(TestCase):
 
         # TODO:
         # Non-staff cannot enroll outside the open enrollment period if not specifically allowed
+
+
+class AccessCacheTestCase(TestCase):
+    def setUp(self):
+        self.location = Location('i4x://edX/toy/course/2012_Fall')
+        self.user = User.objects.create_user('staffer', 'staffer@edx.org', 'test')
+        self.group = Group.objects.create(name='staff_edX/toy/2012_Fall')
+
+    def test_memoized(self):
+        self.user.groups.add(self.group)
+        with access.cached_access() as cache:
+            self.assertTrue(access.has_access(self.user, self.location, 'staff', None))
+            with self.assertNumQueries(0):
+                self.assertTrue(access.has_access(self.user, self.location, 'staff', None))
+                self.assertTrue(access.has_access(self.user, Location(self.location), 'staff', None))
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+    def test_groups_loaded_once(self):
+        with access.cached_access() as cache:
+            self.assertFalse(access.has_access(self.user, self.location, 'staff', None))
+            other = Location('i4x://edX/toy/course/2013_Spring')
+            with self.assertNumQueries(0):
+                self.assertFalse(access.has_access(self.user, other, 'staff', None))
+        self.assertEqual(cache.misses, 2)
+
+    def test_group_changes_clear_cache(self):
+        with access.cached_access():
+            self.assertFalse(access.has_access(self.user, self.location, 'staff', None))
+            self.user.groups.add(self.group)
+            self.assertTrue(access.has_access(self.user, self.location, 'staff', None))
+
+    def test_not_memoized_outside_block(self):
+        self.assertFalse(access.has_access(self.user, self.location, 'staff', None))
+        with self.assertNumQueries(1):
+            self.assertFalse(access.has_access(self.user, self.location, 'staff', None))
+
+    def test_other_thread(self):
+        # threads other than the one that imported request_cache.middleware
+        # have no request cache data until the middleware runs in them
+        results = []
+
+        def get_access_cache():
+            results.append(access._get_access_cache())
+            with access.cached_access() as cache:
+                results.append(access._get_access_cache() is cache)
+
+        thread = threading.Thread(target=get_access_cache)
+        thread.start()
+        thread.join()
+        self.assertEqual(results, [None, True])
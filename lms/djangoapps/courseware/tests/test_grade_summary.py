@@ -0,0 +1,120 @@
+"""
+Tests of the stored per-student grade summaries
+"""
+from django.test import TestCase
+from mock import Mock, patch
+
+from courseware import grades
+from courseware.models import StudentGradeSummary
+from courseware.tests.factories import StudentModuleFactory
+from student.tests.factories import UserFactory
+from xmodule.graders import Score
+
+COURSE_ID = 'edX/test/2013_Spring'
+
+
+def mock_descriptor(category, name, children=()):
+    descriptor = Mock(always_recalculate_grades=False, weight=None, display_name_with_default=name)
+    descriptor.location.url.return_value = 'i4x://edX/test/%s/%s' % (category, name)
+    descriptor.get_children.return_value = list(children)
+    descriptor.module_class.fields = []
+    descriptor.module_class.lms.fields = []
+    return descriptor
+
+
+def mock_course(grade_cutoffs=None):
+    """
+    A course with two graded homework sections, each containing one problem
+    """
+    sections = []
+    for i in range(2):
+        problem = mock_descriptor('problem', 'p%d' % i)
+        sections.append({
+            'section_descriptor': mock_descriptor('sequential', 's%d' % i, [problem]),
+            'xmoduledescriptors': [problem],
+        })
+
+    course = Mock(id=COURSE_ID, raw_grader=[], grade_cutoffs=grade_cutoffs or {'Pass': 0.5})
+    course.grading_context = {'graded_sections': {'Homework': sections}, 'all_descriptors': []}
+    course.grader.grade.return_value = {'percent': 0.5, 'section_breakdown': [], 'grade_breakdown': []}
+    return course
+
+
+def fake_grade_section(student, request, course, section, model_data_cache):
+    name = section['section_descriptor'].display_name_with_default
+    return Score(1, 2, True, name), [Score(1, 2, True, name + ' problem')]
+
+
+@patch('courseware.grades.grade_section')
+class TestCachedGrade(TestCase):
+
+    def setUp(self):
+        self.student = UserFactory.create()
+        self.course = mock_course()
+
+    def add_score(self, problem_name):
+        return StudentModuleFactory.create(
+            student=self.student,
+            course_id=COURSE_ID,
+            module_state_key='i4x://edX/test/problem/%s' % problem_name,
+            grade=1,
+            max_grade=2,
+        )
+
+    def test_grade_is_stored(self, mock_grade_section):
+        mock_grade_section.side_effect = fake_grade_section
+        summary = grades.cached_grade(self.student, None, self.course)
+        self.assertEquals(0.5, summary['percent'])
+        self.assertNotIn('raw_scores', summary)
+
+        summary = grades.cached_grade(self.student, None, self.course, keep_raw_scores=True)
+        self.assertEquals(2, mock_grade_section.call_count)
+        self.assertEquals([Score(1, 2, True, 's0'), Score(1, 2, True, 's1')], summary['totaled_scores']['Homework'])
+        self.assertEquals([Score(1, 2, True, 's0 problem'), Score(1, 2, True, 's1 problem')], summary['raw_scores'])
+
+    def test_score_change_regrades_section(self, mock_grade_section):
+        mock_grade_section.side_effect = fake_grade_section
+        grades.cached_grade(self.student, None, self.course)
+
+        self.add_score('p1')
+        self.assertTrue(StudentGradeSummary.objects.get(user=self.student, course_id=COURSE_ID).stale)
+
+        grades.cached_grade(self.student, None, self.course)
+        self.assertEquals(3, mock_grade_section.call_count)
+        regraded_section = mock_grade_section.call_args[0][3]
+        self.assertEquals('s1', regraded_section['section_descriptor'].display_name_with_default)
+
+        grades.cached_grade(self.student, None, self.course)
+        self.assertEquals(3, mock_grade_section.call_count)
+
+    def test_ungraded_module_does_not_invalidate(self, mock_grade_section):
+        mock_grade_section.side_effect = fake_grade_section
+        grades.cached_grade(self.student, None, self.course)
+
+        StudentModuleFactory.create(student=self.student, course_id=COURSE_ID,
+                                    module_state_key='i4x://edX/test/problem/p0')
+        self.assertFalse(StudentGradeSummary.objects.get(user=self.student, course_id=COURSE_ID).stale)
+
+    def test_deleted_score_regrades_course(self, mock_grade_section):
+        mock_grade_section.side_effect = fake_grade_section
+        student_module = self.add_score('p0')
+        grades.cached_grade(self.student, None, self.course)
+
+        student_module.delete()
+        grades.cached_grade(self.student, None, self.course)
+        self.assertEquals(4, mock_grade_section.call_count)
+
+    def test_policy_change_regrades_course(self, mock_grade_section):
+        mock_grade_section.side_effect = fake_grade_section
+        grades.cached_grade(self.student, None, self.course)
+        grades.cached_grade(self.student, None, mock_course({'Pass': 0.6}))
+        self.assertEquals(4, mock_grade_section.call_count)
+
+    def test_iter_cached_grades(self, mock_grade_section):
+        mock_grade_section.side_effect = fake_grade_section
+        students = [self.student] + [UserFactory.create() for _ in range(2)]
+        grades.cached_grade(self.student, None, self.course)
+
+        results = list(grades.iter_cached_grades(students, None, self.course, block_size=2))
+        self.assertEquals(students, [student for student, _ in results])
+        self.assertEquals(6, mock_grade_section.call_count)
@@ -3,7 +3,7 @@ from mock import Mock
 from functools import partial
 
 from courseware.model_data import LmsKeyValueStore, InvalidWriteError
-from courseware.model_data import InvalidScopeError, ModelDataCache
+from courseware.model_data import InvalidScopeError, ModelDataCache, MultiUserModelDataCache
 from courseware.models import StudentModule, XModuleContentField, XModuleSettingsField
 from courseware.models import XModuleStudentInfoField, XModuleStudentPrefsField
 
@@ -139,6 +139,40 @@ class TestStudentModuleStorage(TestCase):
         self.assertFalse(self.kvs.has(user_state_key('not_a_field')))
 
 
+class TestMultiUserModelDataCache(TestCase):
+
+    def setUp(self):
+        self.desc_md = {}
+        self.student_modules = [
+            StudentModuleFactory(state=json.dumps({'a_field': 'value%d' % i}))
+            for i in range(3)
+        ]
+        self.users = [student_module.student for student_module in self.student_modules]
+        self.descriptors = [mock_descriptor([mock_field(Scope.user_state, 'a_field')])]
+
+    def test_single_query_for_all_users(self):
+        "Test that StudentModules for every user are loaded in one query"
+        with self.assertNumQueries(1):
+            MultiUserModelDataCache(self.descriptors, course_id, self.users)
+
+    def test_cache_for_user(self):
+        "Test that the per-user caches see only that user's StudentModule"
+        multi_user_cache = MultiUserModelDataCache(self.descriptors, course_id, self.users)
+        for i, user in enumerate(self.users):
+            with self.assertNumQueries(0):
+                kvs = LmsKeyValueStore(self.desc_md, multi_user_cache.cache_for_user(user))
+                self.assertEquals('value%d' % i, kvs.get(user_state_key('a_field')))
+
+    def test_cache_for_user_without_data(self):
+        "Test that a user with no StudentModule gets a cache that can create one"
+        user = UserFactory.create(username='nodata')
+        multi_user_cache = MultiUserModelDataCache(self.descriptors, course_id, self.users + [user])
+        kvs = LmsKeyValueStore(self.desc_md, multi_user_cache.cache_for_user(user))
+        self.assertRaises(KeyError, kvs.get, user_state_key('a_field'))
+        kvs.set(user_state_key('a_field'), 'new value')
+        self.assertEquals('new value', kvs.get(user_state_key('a_field')))
+
+
 class TestMissingStudentModule(TestCase):
     def setUp(self):
         self.user = UserFactory.create(username='user')
@@ -0,0 +1,108 @@
+"""
+Tests of the outbox of submissions to xqueue
+"""
+from datetime import datetime, timedelta
+
+from django.test import TestCase
+from mock import Mock
+
+from courseware.models import PendingXQueueSubmission
+from courseware.xqueue_outbox import SQLOutbox
+
+
+class TestSQLOutbox(TestCase):
+
+    def setUp(self):
+        self.outbox = SQLOutbox(backoff=10)
+        self.xqueue = Mock()
+
+    def test_deliver(self):
+        self.outbox.put('header', 'body', [('answer.py', 'print 42\n')])
+        self.assertEqual(self.outbox.depth(), 1)
+
+        self.xqueue.deliver.return_value = (0, 'Success!')
+        self.assertEqual(self.outbox.drain(self.xqueue), (1, 0))
+        self.xqueue.deliver.assert_called_once_with('header', 'body', [('answer.py', 'print 42\n')])
+        self.assertEqual(self.outbox.depth(), 0)
+
+    def test_backoff(self):
+        self.outbox.put('header', 'body', [])
+
+        self.xqueue.deliver.return_value = (1, 'cannot connect to server')
+        self.assertEqual(self.outbox.drain(self.xqueue), (0, 1))
+        submission = PendingXQueueSubmission.objects.get()
+        self.assertEqual(submission.attempts, 1)
+        self.assertEqual(submission.last_error, 'cannot connect to server')
+        self.assertTrue(submission.next_attempt > datetime.now() + timedelta(seconds=5))
+
+        # Not due yet
+        self.assertEqual(self.outbox.drain(self.xqueue), (0, 0))
+        self.assertEqual(self.xqueue.deliver.call_count, 1)
+
+        PendingXQueueSubmission.objects.update(next_attempt=datetime.now())
+        self.outbox.drain(self.xqueue)
+        submission = PendingXQueueSubmission.objects.get()
+        self.assertEqual(submission.attempts, 2)
+        self.assertTrue(submission.next_attempt > datetime.now() + timedelta(seconds=15))
+
+    def test_batch_size(self):
+        for i in xrange(3):
+            self.outbox.put('header %d' % i, 'body', [])
+
+        self.xqueue.deliver.return_value = (0, 'Success!')
+        self.assertEqual(self.outbox.drain(self.xqueue, batch_size=2), (2, 0))
+        self.assertEqual([call[0][0] for call in self.xqueue.deliver.call_args_list], ['header 0', 'header 1'])
+        self.assertEqual(self.outbox.depth(), 1)
+
+    def test_rejected_not_retried(self):
+        self.outbox.put('header', 'body', [])
+
+        self.xqueue.deliver.return_value = (1, 'Queue bad_queue does not exist')
+        self.assertEqual(self.outbox.drain(self.xqueue), (0, 1))
+        submission = PendingXQueueSubmission.objects.get()
+        self.assertTrue(submission.failed)
+        self.assertEqual(self.outbox.depth(), 0)
+        self.assertEqual(self.outbox.failed_count(), 1)
+
+        PendingXQueueSubmission.objects.update(next_attempt=datetime.now())
+        self.assertEqual(self.outbox.drain(self.xqueue), (0, 0))
+        self.assertEqual(self.xqueue.deliver.call_count, 1)
+
+    def test_max_attempts(self):
+        outbox = SQLOutbox(backoff=10, max_attempts=2)
+        outbox.put('header', 'body', [])
+
+        self.xqueue.deliver.return_value = (1, 'cannot connect to server')
+        outbox.drain(self.xqueue)
+        self.assertFalse(PendingXQueueSubmission.objects.get().failed)
+
+        PendingXQueueSubmission.objects.update(next_attempt=datetime.now())
+        outbox.drain(self.xqueue)
+        submission = PendingXQueueSubmission.objects.get()
+        self.assertTrue(submission.failed)
+        self.assertEqual(submission.attempts, 2)
+
+    def test_concurrent_drains(self):
+        self.outbox.put('header', 'body', [])
+        other_xqueue = Mock()
+        other_xqueue.deliver.return_value = (0, 'Success!')
+
+        def deliver(*args):
+            # Another worker drains the outbox while this one is delivering
+            self.assertEqual(self.outbox.drain(other_xqueue), (0, 0))
+            return (0, 'Success!')
+        self.xqueue.deliver.side_effect = deliver
+
+        self.assertEqual(self.outbox.drain(self.xqueue), (1, 0))
+        self.assertFalse(other_xqueue.deliver.called)
+        self.assertEqual(self.outbox.depth(), 0)
+
+    def test_claim_race(self):
+        self.outbox.put('header', 'body', [])
+        submission = PendingXQueueSubmission.objects.get()
+        now = datetime.now()
+
+        # Both workers read the submission, the first to claim it gets it
+        self.assertTrue(self.outbox._claim(submission, 'worker 1', now))
+        self.assertFalse(self.outbox._claim(submission, 'worker 2', now))
+        self.assertEqual(PendingXQueueSubmission.objects.get().claimed_by, 'worker 1')
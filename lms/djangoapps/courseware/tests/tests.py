@@ -389,6 +389,7 @@ class TestCoursesLoadTestCase_MongoModulestore(PageLoaderTestCase):
         self.setup_viewtest_user()
         xmodule.modulestore.django._MODULESTORES = {}
         modulestore().collection.drop()
+        modulestore().inheritance_collection.drop()
 
     def test_toy_course_loads(self):
         module_store = modulestore()
@@ -671,7 +671,7 @@ def progress(request, course_id, student_id=None):
 
     courseware_summary = grades.progress_summary(student, request, course,
                                                  model_data_cache)
-    grade_summary = grades.grade(student, request, course, model_data_cache)
+    grade_summary = grades.cached_grade(student, request, course, model_data_cache)
 
     if courseware_summary is None:
         #This means the student didn't have access to the course (which the instructor requested)
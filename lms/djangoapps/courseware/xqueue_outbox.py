@@ -0,0 +1,140 @@
+"""
+Durable outbox for submissions to the external grader (xqueue).
+
+When xqueue can't be reached, or too many submissions are already being
+sent, capa.xqueue_interface.XQueueInterface hands the submission to the
+outbox instead of failing the student's request.  The drain_xqueue_outbox
+management command delivers stored submissions, backing off exponentially
+from submissions that xqueue can't be reached for.  Submissions xqueue
+turns down, or that still can't be delivered after max_attempts tries, are
+kept as failed rather than tried again.
+
+Several drain workers can run at once: each claims a submission before
+delivering it, so no submission is delivered by two of them.
+"""
+import base64
+import json
+import logging
+import os
+import socket
+import uuid
+
+from datetime import datetime, timedelta
+
+from django.db import transaction
+from statsd import statsd
+
+from capa.xqueue_interface import is_unreachable
+
+from .models import PendingXQueueSubmission
+
+log = logging.getLogger(__name__)
+
+
+class SQLOutbox(object):
+    """
+    Outbox storing submissions as PendingXQueueSubmission rows
+    """
+    def __init__(self, backoff=30, max_backoff=3600, max_attempts=10, lease=300):
+        """
+        backoff: seconds to wait before trying a failed submission again,
+            doubled after every further failure up to max_backoff
+        max_attempts: number of tries after which a submission is failed
+        lease: seconds a worker has to deliver a submission it claimed,
+            after which another worker may take it
+        """
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        self.lease = lease
+
+    def put(self, header, body, files):
+        """
+        Store a submission.  files is a list of (name, contents) pairs.
+        """
+        PendingXQueueSubmission.objects.create(
+            header=header,
+            body=body,
+            files=json.dumps([[name, base64.b64encode(contents)] for name, contents in files]),
+            next_attempt=datetime.now(),
+        )
+
+    def depth(self):
+        """
+        Return the number of submissions waiting to be delivered
+        """
+        return PendingXQueueSubmission.objects.filter(failed=False).count()
+
+    def failed_count(self):
+        """
+        Return the number of submissions that won't be tried again
+        """
+        return PendingXQueueSubmission.objects.filter(failed=True).count()
+
+    def _claim(self, submission, worker, now):
+        """
+        Take submission for worker, unless another worker took it first.
+        Returns whether it was taken.
+        """
+        # Only one worker's update can match the next_attempt it read
+        claimed = PendingXQueueSubmission.objects.filter(
+            pk=submission.pk,
+            next_attempt=submission.next_attempt,
+            failed=False,
+        ).update(
+            claimed_by=worker,
+            next_attempt=now + timedelta(seconds=self.lease),
+        )
+        return claimed == 1
+
+    def drain(self, xqueue_interface, batch_size=100):
+        """
+        Try to deliver the submissions that are due, at most batch_size of
+        them.  Delivered submissions are deleted; the others are scheduled
+        to be tried again, or failed.
+
+        Returns a tuple (delivered, failed).
+        """
+        worker = '{0}:{1}:{2}'.format(socket.gethostname()[:30], os.getpid(), uuid.uuid4().hex[:8])
+        now = datetime.now()
+        due = list(PendingXQueueSubmission.objects.filter(failed=False, next_attempt__lte=now)[:batch_size])
+
+        delivered = failed = 0
+        for submission in due:
+            if not self._claim(submission, worker, now):
+                continue
+
+            files = [(name, base64.b64decode(contents)) for name, contents in json.loads(submission.files)]
+            (error, msg) = xqueue_interface.deliver(submission.header, submission.body, files)
+            # Only change the submission if it's still ours
+            ours = PendingXQueueSubmission.objects.filter(pk=submission.pk, claimed_by=worker)
+            with transaction.commit_on_success():
+                if not error:
+                    ours.delete()
+                    delivered += 1
+                    continue
+
+                attempts = submission.attempts + 1
+                if is_unreachable(error, msg) and attempts < self.max_attempts:
+                    delay = min(self.backoff * 2 ** (attempts - 1), self.max_backoff)
+                    ours.update(
+                        attempts=attempts,
+                        last_error=msg[:255],
+                        next_attempt=datetime.now() + timedelta(seconds=delay),
+                        claimed_by=None,
+                    )
+                    log.warning("Couldn't deliver %s to xqueue (attempt %d): %s",
+                                submission.header, attempts, msg)
+                else:
+                    ours.update(attempts=attempts, last_error=msg[:255], failed=True, claimed_by=None)
+                    log.error("Gave up delivering %s to xqueue (attempt %d): %s",
+                              submission.header, attempts, msg)
+                failed += 1
+
+        statsd.increment('xqueue.outbox.delivered', delivered)
+        statsd.increment('xqueue.outbox.failed', failed)
+        statsd.gauge('xqueue.outbox.depth', self.depth())
+        statsd.gauge('xqueue.outbox.dead', self.failed_count())
+        if due:
+            statsd.histogram('xqueue.outbox.age', (now - due[0].created).total_seconds())
+        return (delivered, failed)
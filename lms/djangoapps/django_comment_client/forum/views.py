@@ -10,7 +10,7 @@ from django.contrib.auth.models import User
 from mitxmako.shortcuts import render_to_response
 from courseware.courses import get_course_with_access
 from course_groups.cohorts import (is_course_cohorted, get_cohort_id, is_commentable_cohorted,
-                                   get_cohorted_commentables, get_course_cohorts, get_cohort_by_id)
+                                   get_cohorted_commentables, get_course_cohorts, get_cohort_directory)
 from courseware.access import has_access
 
 from django_comment_client.permissions import cached_has_permission
@@ -84,10 +84,13 @@ def get_threads(request, course_id, discussion_id=None, per_page=THREADS_PER_PAG
     threads, page, num_pages = cc.Thread.search(query_params)
 
     #now add the group name if the thread has a group id
+    group_names = get_cohort_directory(course_id).cohort_names(
+        set(thread['group_id'] for thread in threads if thread.get('group_id'))
+    )
     for thread in threads:
 
         if thread.get('group_id'):
-            thread['group_name'] = get_cohort_by_id(course_id, thread.get('group_id')).name
+            thread['group_name'] = group_names[thread['group_id']]
             thread['group_string'] = "This post visible only to Group %s." % (thread['group_name'])
         else:
             thread['group_name'] = ""
@@ -240,10 +243,12 @@ def forum_form_discussion(request, course_id):
 def single_thread(request, course_id, discussion_id, thread_id):
     course = get_course_with_access(request.user, course_id, 'load')
     cc_user = cc.User.from_django_user(request.user)
-    user_info = cc_user.to_dict()
 
     try:
-        thread = cc.Thread.find(thread_id).retrieve(recursive=True, user_id=request.user.id)
+        user_info, thread = cc.utils.perform_concurrently(
+            cc_user.to_dict,
+            lambda: cc.Thread.find(thread_id).retrieve(recursive=True, user_id=request.user.id),
+        )
     except (cc.utils.CommentClientError, cc.utils.CommentClientUnknownError) as err:
         log.error("Error loading single thread.")
         raise Http404
@@ -274,13 +279,14 @@ def single_thread(request, course_id, discussion_id, thread_id):
             raise Http404
 
         course = get_course_with_access(request.user, course_id, 'load')
+        cohort_directory = get_cohort_directory(course_id)
 
         for thread in threads:
             courseware_context = get_courseware_context(thread, course)
             if courseware_context:
                 thread.update(courseware_context)
             if thread.get('group_id') and not thread.get('group_name'):
-                thread['group_name'] = get_cohort_by_id(course_id, thread.get('group_id')).name
+                thread['group_name'] = cohort_directory.cohort_name(thread.get('group_id'))
 
             #patch for backward compatibility with comments service
             if not "pinned" in thread:
@@ -342,10 +348,16 @@ def user_profile(request, course_id, user_id):
             'per_page': THREADS_PER_PAGE,   # more than threads_per_page to show more activities
         }
 
-        threads, page, num_pages = profiled_user.active_threads(query_params)
+        calls = [
+            lambda: profiled_user.active_threads(query_params),
+            cc.User.from_django_user(request.user).to_dict,
+        ]
+        if not request.is_ajax():
+            # the page shows the profiled user too
+            calls.append(profiled_user.retrieve)
+        (threads, page, num_pages), user_info = cc.utils.perform_concurrently(*calls)[:2]
         query_params['page'] = page
         query_params['num_pages'] = num_pages
-        user_info = cc.User.from_django_user(request.user).to_dict()
 
         annotated_content_info = utils.get_metadata_for_threads(course_id, threads, request.user, user_info)
 
@@ -385,10 +397,16 @@ def followed_threads(request, course_id, user_id):
             'sort_order': request.GET.get('sort_order', 'desc'),
         }
 
-        threads, page, num_pages = profiled_user.subscribed_threads(query_params)
+        calls = [
+            lambda: profiled_user.subscribed_threads(query_params),
+            cc.User.from_django_user(request.user).to_dict,
+        ]
+        if not request.is_ajax():
+            # the page shows the profiled user too
+            calls.append(profiled_user.retrieve)
+        (threads, page, num_pages), user_info = cc.utils.perform_concurrently(*calls)[:2]
         query_params['page'] = page
         query_params['num_pages'] = num_pages
-        user_info = cc.User.from_django_user(request.user).to_dict()
 
         annotated_content_info = utils.get_metadata_for_threads(course_id, threads, request.user, user_info)
         if request.is_ajax():
@@ -0,0 +1,99 @@
+import threading
+
+from django.core.cache import cache
+from django.test import TestCase
+from mock import Mock, patch
+
+import comment_client as cc
+from comment_client import utils as cc_utils
+from comment_client import settings as cc_settings
+
+
+def mock_response(text='{}', status_code=200):
+    return Mock(text=text, status_code=status_code)
+
+
+class EndpointTestCase(TestCase):
+    def test_endpoint(self):
+        prefix = cc_settings.PREFIX
+        self.assertEqual(cc_utils._endpoint(prefix + '/threads/51a7e1f3/votes'), 'threads/:id/votes')
+        self.assertEqual(cc_utils._endpoint(prefix + '/users/5'), 'users/:id')
+        self.assertEqual(cc_utils._endpoint(prefix + '/threads/tags/autocomplete'), 'threads/tags/autocomplete')
+        self.assertEqual(cc_utils._endpoint(prefix + '/search/threads'), 'search/threads')
+        self.assertEqual(cc_utils._endpoint(prefix + '/week_1/threads'), ':commentable_id/threads')
+
+    def test_resource(self):
+        prefix = cc_settings.PREFIX
+        self.assertEqual(cc_utils._resource(prefix + '/users/5/subscriptions'), 'users/5')
+        self.assertEqual(cc_utils._resource(prefix + '/threads/tags'), None)
+        self.assertEqual(cc_utils._resource(prefix + '/threads'), None)
+
+
+@patch.object(cc_settings, 'CACHE_TIMEOUT', 60)
+@patch('comment_client.utils._session')
+class CacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_cached_get(self, session):
+        session.request.return_value = mock_response('{"username": "cat"}')
+        for _ in xrange(2):
+            user = cc.User(id='5')
+            self.assertEqual(user.to_dict()['username'], 'cat')
+        self.assertEqual(session.request.call_count, 1)
+
+    def test_uncached_get(self, session):
+        session.request.return_value = mock_response('{"title": "cat"}')
+        for _ in xrange(2):
+            cc.Thread(id='1').retrieve(recursive=True, user_id='5')
+        self.assertEqual(session.request.call_count, 2)
+
+    def test_write_invalidates(self, session):
+        session.request.return_value = mock_response('{}')
+        cc.User(id='5').retrieve()
+        cc.User(id='5').follow(cc.Thread(id='1'))
+        cc.User(id='5').retrieve()
+        self.assertEqual(session.request.call_count, 3)
+
+    def test_write_on_behalf_of_user_invalidates(self, session):
+        session.request.return_value = mock_response('{}')
+        cc.User(id='5').retrieve()
+        cc.Thread(id='1').pin(cc.User(id='5'), '1')
+        cc.User(id='5').retrieve()
+        self.assertEqual(session.request.call_count, 3)
+
+    def test_errors_not_cached(self, session):
+        session.request.return_value = mock_response('down', 503)
+        for _ in xrange(2):
+            with self.assertRaises(cc_utils.CommentClientMaintenanceError):
+                cc.User(id='5').retrieve()
+        self.assertEqual(session.request.call_count, 2)
+
+
+class ConcurrencyTestCase(TestCase):
+    def test_results_in_order(self):
+        self.assertEqual(cc_utils.perform_concurrently(lambda: 1, lambda: 2, lambda: 3), [1, 2, 3])
+
+    def test_calls_overlap(self):
+        # each call waits for the other, so this only finishes if they run at the same time
+        barrier = [threading.Event(), threading.Event()]
+
+        def call(i):
+            barrier[i].set()
+            return barrier[1 - i].wait(5)
+
+        self.assertEqual(cc_utils.perform_concurrently(lambda: call(0), lambda: call(1)), [True, True])
+
+    def test_first_error_raised(self):
+        def fail(msg):
+            raise cc_utils.CommentClientError(msg)
+
+        with self.assertRaises(cc_utils.CommentClientError) as cm:
+            cc_utils.perform_concurrently(lambda: 1, lambda: fail('first'), lambda: fail('second'))
+        self.assertEqual(cm.exception.message, 'first')
+
+    @patch.object(cc_settings, 'CONCURRENCY', 1)
+    def test_sequential(self):
+        current = threading.current_thread()
+        self.assertEqual(cc_utils.perform_concurrently(threading.current_thread, threading.current_thread),
+                         [current, current])
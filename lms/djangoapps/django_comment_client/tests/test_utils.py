@@ -1,4 +1,7 @@
+import time
+
 from django.test import TestCase
+from mock import Mock, patch
 from student.tests.factories import UserFactory, CourseEnrollmentFactory
 from django_comment_common.models import Role, Permission
 from factories import RoleFactory
@@ -57,3 +60,56 @@ class AccessUtilsTestCase(TestCase):
 
         ret = utils.has_forum_access('student', self.course_id, 'NotARole')
         self.assertFalse(ret)
+
+
+def discussion_module(discussion_id, category, start):
+    """
+    A stand-in for a discussion module
+    """
+    return Mock(discussion_id=discussion_id, discussion_category=category, discussion_target=discussion_id,
+                sort_key=None, location='i4x://edX/toy/discussion/' + discussion_id, lms=Mock(start=start))
+
+
+class CategoryMapTestCase(TestCase):
+    def setUp(self):
+        self.course = Mock(id='edX/toy/2012_Fall', discussion_topics={})
+        self.course.location.org = 'edX'
+        self.course.location.course = 'toy'
+        self.past = time.gmtime(time.time() - 86400)
+        self.future = time.gmtime(time.time() + 86400)
+        self.store = Mock()
+        self.store.get_items.return_value = [
+            discussion_module('started', 'Week 1', self.past),
+            discussion_module('unstarted', 'Week 2', self.future),
+        ]
+        self.store.get_course_version.return_value = 1
+
+        patcher = patch('django_comment_client.utils.modulestore', return_value=self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(utils._DISCUSSIONINFO.clear)
+
+    def test_built_once_per_version(self):
+        category_map = utils.get_discussion_category_map(self.course)
+        self.assertEqual(category_map['children'], ['Week 1'])
+        self.assertEqual(utils.get_discussion_title(self.course, 'started'), 'Week 1 / started')
+        self.assertTrue(utils.get_discussion_category_map(self.course) is category_map)
+        self.assertEqual(self.store.get_items.call_count, 1)
+
+        # e.g. after changes to the course are published
+        self.store.get_course_version.return_value = 2
+        utils.get_discussion_category_map(self.course)
+        self.assertEqual(self.store.get_items.call_count, 2)
+
+    def test_filtered_again_once_started(self):
+        self.assertEqual(utils.get_discussion_category_map(self.course)['children'], ['Week 1'])
+
+        later = time.gmtime(time.time() + 2 * 86400)
+        with patch('django_comment_client.utils.time.gmtime', return_value=later):
+            category_map = utils.get_discussion_category_map(self.course)
+        self.assertEqual(category_map['children'], ['Week 1', 'Week 2'])
+        self.assertEqual(self.store.get_items.call_count, 1)
+
+    def test_start_boundaries(self):
+        utils.initialize_discussion_info(self.course)
+        self.assertEqual(utils._DISCUSSIONINFO[self.course.id]['start_boundaries'], [self.future])
@@ -1,4 +1,5 @@
 import time
+from bisect import bisect_left, bisect_right
 from collections import defaultdict
 import logging
 import time
@@ -28,6 +29,8 @@ log = logging.getLogger(__name__)
 
 # TODO these should be cached via django's caching rather than in-memory globals
 _FULLMODULES = None
+# The discussion info of each course, built once per edit version of the course
+# by initialize_discussion_info
 _DISCUSSIONINFO = defaultdict(dict)
 
 
@@ -92,15 +95,31 @@ def get_discussion_title(course, discussion_id):
 
 
 def get_discussion_category_map(course):
+    """
+    Return the category map of the course's discussions, without the
+    categories and entries that haven't started yet.
 
+    The result is shared between callers, and must not be modified.
+    """
     global _DISCUSSIONINFO
     initialize_discussion_info(course)
-    return filter_unstarted_categories(_DISCUSSIONINFO[course.id]['category_map'])
+    info = _DISCUSSIONINFO[course.id]
 
+    # The filtered map only changes when now passes one of the start dates
+    # in the map, so it's computed once for each interval between them
+    now = time.gmtime()
+    boundaries = info['start_boundaries']
+    key = (bisect_left(boundaries, now), bisect_right(boundaries, now))
+    filtered_maps = info['filtered_category_maps']
+    if key not in filtered_maps:
+        filtered_maps[key] = filter_unstarted_categories(info['category_map'], now)
+    return filtered_maps[key]
 
-def filter_unstarted_categories(category_map):
 
-    now = time.gmtime()
+def filter_unstarted_categories(category_map, now=None):
+
+    if now is None:
+        now = time.gmtime()
 
     result_map = {}
 
@@ -125,7 +144,7 @@ def filter_unstarted_categories(category_map):
                         if key != "start_date":
                             filtered_map["entries"][child][key] = unfiltered_map["entries"][child][key]
                 else:
-                    print "filtering %s" % child, unfiltered_map["entries"][child]["start_date"]
+                    log.debug("filtering %s: starts %s", child, unfiltered_map["entries"][child]["start_date"])
             else:
                 if unfiltered_map["subcategories"][child]["start_date"] < now:
                     filtered_map["children"].append(child)
@@ -136,6 +155,35 @@ def filter_unstarted_categories(category_map):
     return result_map
 
 
+def _start_boundaries(category_map, now):
+    """
+    Return the sorted start dates, later than now, of the categories and
+    entries in category_map: the times at which filter_unstarted_categories
+    can give a different result
+    """
+    boundaries = set()
+    queue = [category_map]
+    while queue:
+        node = queue.pop()
+        for entry in node["entries"].itervalues():
+            boundaries.add(entry["start_date"])
+        for subcategory in node["subcategories"].itervalues():
+            boundaries.add(subcategory["start_date"])
+            queue.append(subcategory)
+    return sorted(boundary for boundary in boundaries if boundary is not None and boundary >= now)
+
+
+def _course_version(course):
+    """
+    Return the edit version of the course, or None if the modulestore doesn't
+    keep versions (e.g. XML courses, which don't change while running)
+    """
+    get_course_version = getattr(modulestore(), 'get_course_version', None)
+    if get_course_version is None:
+        return None
+    return get_course_version(course.location)
+
+
 def sort_map_entries(category_map):
     things = []
     for title, entry in category_map["entries"].items():
@@ -147,9 +195,17 @@ def sort_map_entries(category_map):
 
 
 def initialize_discussion_info(course):
+    """
+    Build the discussion id map and category map of the course, unless they
+    have already been built for the course's current edit version.  Publishing
+    changes to the course bumps its version, so the maps are rebuilt after it.
+    """
     global _DISCUSSIONINFO
 
     course_id = course.id
+    version = _course_version(course)
+    if course_id in _DISCUSSIONINFO and _DISCUSSIONINFO[course_id]['version'] == version:
+        return
 
     discussion_id_map = {}
     unexpanded_category_map = defaultdict(list)
@@ -223,9 +279,14 @@ def initialize_discussion_info(course):
                                           "start_date": time.gmtime()}
     sort_map_entries(category_map)
 
-    _DISCUSSIONINFO[course.id]['id_map'] = discussion_id_map
-    _DISCUSSIONINFO[course.id]['category_map'] = category_map
-    _DISCUSSIONINFO[course.id]['timestamp'] = datetime.now()
+    _DISCUSSIONINFO[course.id] = {
+        'id_map': discussion_id_map,
+        'category_map': category_map,
+        'start_boundaries': _start_boundaries(category_map, time.gmtime()),
+        'filtered_category_maps': {},
+        'version': version,
+        'timestamp': datetime.now(),
+    }
 
 
 class JsonResponse(HttpResponse):
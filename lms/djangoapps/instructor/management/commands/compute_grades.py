@@ -8,6 +8,7 @@ import sys
 import string
 import datetime
 import json
+from optparse import make_option
 
 #import student.models
 from instructor.offline_gradecalc import *
@@ -24,6 +25,23 @@ class Command(BaseCommand):
     help += "   course_id_or_dir: either course_id or course_dir\n"
     help += 'Example course_id: MITx/8.01rq_MW/Classical_Mechanics_Reading_Questions_Fall_2012_MW_Section'
 
+    option_list = BaseCommand.option_list + (
+        make_option('--processes',
+                    type='int',
+                    dest='processes',
+                    default=1,
+                    help='Number of worker processes to grade students with.'),
+        make_option('--chunk-size',
+                    type='int',
+                    dest='chunk_size',
+                    default=100,
+                    help='Number of students graded and saved per batch.'),
+        make_option('--checkpoint',
+                    dest='checkpoint_file',
+                    default=None,
+                    help='File used to record progress, so that an interrupted run can be resumed.'),
+    )
+
     def handle(self, *args, **options):
 
         print "args = ", args
@@ -48,4 +66,9 @@ class Command(BaseCommand):
         print "-----------------------------------------------------------------------------"
         print "Computing grades for %s" % (course.id)
 
-        offline_grade_calculation(course.id)
+        offline_grade_calculation(
+            course.id,
+            processes=options['processes'],
+            chunk_size=options['chunk_size'],
+            checkpoint_file=options['checkpoint_file'],
+        )
@@ -0,0 +1,63 @@
+#!/usr/bin/python
+#
+# django management command: regrade every student's answers to a problem
+# after the problem has been fixed
+
+from optparse import make_option
+
+from courseware.models import ProblemRescore
+from instructor.rescore import rescore_problem
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Regrade the answers every student has checked for a problem, and store the new scores.\n"
+    help += "Usage: rescore_problem course_id location\n"
+    help += "   location: the problem's location, eg i4x://MITx/6.002x/problem/Sample_Problem\n"
+    help += "       or: rescore_problem --resume RESCORE_ID"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size',
+                    type='int',
+                    dest='chunk_size',
+                    default=100,
+                    help='Number of students rescored and saved per batch.'),
+        make_option('--dry-run',
+                    action='store_true',
+                    dest='dry_run',
+                    default=False,
+                    help='Report what would change, without saving anything.'),
+        make_option('--processes',
+                    type='int',
+                    dest='processes',
+                    default=1,
+                    help='Number of worker processes to rescore students in.'),
+        make_option('--resume',
+                    type='int',
+                    dest='resume',
+                    default=None,
+                    help='Id of an interrupted ProblemRescore to pick up where it left off.'),
+    )
+
+    def handle(self, *args, **options):
+
+        if options['resume'] is not None:
+            rescore = ProblemRescore.objects.get(pk=options['resume'])
+            course_id, location = rescore.course_id, rescore.module_state_key
+        elif len(args) == 2:
+            course_id, location = args
+            rescore = None if options['dry_run'] else ProblemRescore.objects.create(
+                course_id=course_id, module_state_key=location)
+        else:
+            print self.help
+            return
+
+        result = rescore_problem(course_id, location, chunk_size=options['chunk_size'],
+                                 dry_run=options['dry_run'], processes=options['processes'],
+                                 rescore=rescore)
+        print "%d attempted, %d %s, %d skipped, %d failed" % (
+            result.attempted, result.updated, 'would change' if options['dry_run'] else 'updated',
+            result.skipped, result.failed)
+        if rescore is not None:
+            print "Progress recorded in ProblemRescore %d" % rescore.id
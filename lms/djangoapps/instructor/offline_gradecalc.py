@@ -7,6 +7,8 @@
 
 import json
 import logging
+import multiprocessing
+import os
 import time
 
 import courseware.models
@@ -14,8 +16,13 @@ import courseware.models
 from collections import namedtuple
 from json import JSONEncoder
 from courseware import grades, models
+from courseware.access import cached_access
 from courseware.courses import get_course_by_id
+from courseware.model_data import MultiUserModelDataCache, chunks
 from django.contrib.auth.models import User, Group
+from django.db import connection, transaction
+
+log = logging.getLogger(__name__)
 
 
 class MyEncoder(JSONEncoder):
@@ -29,45 +36,185 @@ class MyEncoder(JSONEncoder):
             yield chunk
 
 
-def offline_grade_calculation(course_id):
+class DummyRequest(object):
+    """
+    Stand-in for the request object that grades.grade needs when it is run
+    from a batch process instead of a web request.
+    """
+    META = {}
+
+    def __init__(self):
+        return
+
+    def get_host(self):
+        return 'edx.mit.edu'
+
+    def is_secure(self):
+        return False
+
+
+# The course descriptor tree loaded once per worker process by _init_worker,
+# so that every student graded by that worker shares it.
+_worker_course = None
+
+
+def _init_worker(course_id):
     '''
-    Compute grades for all students for a specified course, and save results to the DB.
+    Pool initializer: drop the database connection inherited from the parent
+    process (it can't be shared across a fork) and load the course once.
     '''
+    global _worker_course
+    connection.close()
+    _worker_course = get_course_by_id(course_id)
 
-    tstart = time.time()
-    enrolled_students = User.objects.filter(courseenrollment__course_id=course_id).prefetch_related("groups").order_by('username')
 
+def _grade_students(student_ids):
+    '''
+    Grade the students with the given ids against the worker's course.
+
+    Returns a tuple (student_ids, [(user_id, gradeset_json), ...]).
+    '''
     enc = MyEncoder()
+    request = DummyRequest()
+    results = []
+    students = list(User.objects.filter(id__in=student_ids).prefetch_related("groups"))
+    multi_user_cache = MultiUserModelDataCache(
+        _worker_course.grading_context['all_descriptors'], _worker_course.id, students
+    )
+    for student in students:
+        # every module of the course checks the student's access
+        with cached_access():
+            gradeset = grades.grade(student, request, _worker_course, keep_raw_scores=True,
+                                    model_data_cache=multi_user_cache.cache_for_user(student))
+        results.append((student.id, enc.encode(gradeset)))
+    return student_ids, results
+
+
+def save_gradesets(course_id, gradesets):
+    '''
+    Write a batch of computed gradesets to OfflineComputedGrade.
 
-    class DummyRequest(object):
-        META = {}
-        def __init__(self):
-            return
-        def get_host(self):
-            return 'edx.mit.edu'
-        def is_secure(self):
-            return False
+    gradesets is a list of (user_id, gradeset_json).  The batch's existing
+    rows (the usual case when grades are computed again) are deleted, and all
+    of its rows inserted with a single bulk_create, in one transaction.
+    '''
+    if not gradesets:
+        return
 
-    request = DummyRequest()
+    with transaction.commit_on_success():
+        models.OfflineComputedGrade.objects.filter(
+            course_id=course_id,
+            user__in=[user_id for user_id, _ in gradesets],
+        ).delete()
+        models.OfflineComputedGrade.objects.bulk_create([
+            models.OfflineComputedGrade(user_id=user_id, course_id=course_id, gradeset=gradeset)
+            for user_id, gradeset in gradesets
+        ])
+
+
+def _load_checkpoint(checkpoint_file, course_id):
+    '''
+    Return the set of student ids already graded according to checkpoint_file,
+    or an empty set if there is no usable checkpoint for course_id.
+    '''
+    if checkpoint_file is None or not os.path.exists(checkpoint_file):
+        return set()
+    with open(checkpoint_file) as checkpoint:
+        state = json.load(checkpoint)
+    if state.get('course_id') != course_id:
+        log.warning("Ignoring checkpoint %s: it was written for course %s",
+                    checkpoint_file, state.get('course_id'))
+        return set()
+    return set(state['done'])
+
+
+def _save_checkpoint(checkpoint_file, course_id, done):
+    '''
+    Atomically record the set of graded student ids in checkpoint_file
+    '''
+    tmp_file = checkpoint_file + '.tmp'
+    with open(tmp_file, 'w') as checkpoint:
+        json.dump({'course_id': course_id, 'done': sorted(done)}, checkpoint)
+    os.rename(tmp_file, checkpoint_file)
 
-    print "%d enrolled students" % len(enrolled_students)
-    course = get_course_by_id(course_id)
 
-    for student in enrolled_students:
-        gradeset = grades.grade(student, request, course, keep_raw_scores=True)
-        gs = enc.encode(gradeset)
-        ocg, created = models.OfflineComputedGrade.objects.get_or_create(user=student, course_id=course_id)
-        ocg.gradeset = gs
-        ocg.save()
-        print "%s done" % student  	# print statement used because this is run by a management command
+def offline_grade_calculation(course_id, processes=1, chunk_size=100, checkpoint_file=None):
+    '''
+    Compute grades for all students for a specified course, and save results to the DB.
+
+    processes: number of worker processes to shard students across.  Each
+        worker loads the course once and grades chunks of students against it.
+        With processes=1 all grading is done in the current process.
+    chunk_size: number of students graded, and written to the DB, per batch.
+    checkpoint_file: if given, the ids of students whose grades have been saved
+        are recorded here after every chunk, and students already recorded are
+        skipped, so an interrupted run picks up where it left off.  The file is
+        removed once the whole course has been graded.
+
+    Returns the OfflineComputedGradeLog entry for this run.
+    '''
+
+    tstart = time.time()
+    student_ids = list(User.objects.filter(
+        courseenrollment__course_id=course_id
+    ).order_by('id').values_list('id', flat=True))
+    nstudents = len(student_ids)
+
+    done = _load_checkpoint(checkpoint_file, course_id)
+    remaining = [student_id for student_id in student_ids if student_id not in done]
+
+    print "%d enrolled students, %d left to grade" % (nstudents, len(remaining))
+
+    student_chunks = chunks(remaining, chunk_size)
+    if processes > 1:
+        # Don't hand the parent's DB connection to the forked workers
+        connection.close()
+        pool = multiprocessing.Pool(processes, initializer=_init_worker, initargs=(course_id,))
+        results = pool.imap_unordered(_grade_students, student_chunks)
+    else:
+        pool = None
+        _init_worker(course_id)
+        results = (_grade_students(chunk) for chunk in student_chunks)
+
+    ngraded = 0
+    try:
+        for chunk, gradesets in results:
+            save_gradesets(course_id, gradesets)
+            done.update(chunk)
+            if checkpoint_file is not None:
+                _save_checkpoint(checkpoint_file, course_id, done)
+
+            ngraded += len(chunk)
+            elapsed = time.time() - tstart
+            # print statement used because this is run by a management command
+            print "%d/%d students graded (%.1f students/sec)" % (
+                ngraded, len(remaining), ngraded / elapsed if elapsed else 0)
+    except:
+        # don't wait for the workers to grade the chunks still queued
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+            pool = None
+        raise
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    if checkpoint_file is not None and os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
 
     tend = time.time()
     dt = tend - tstart
 
-    ocgl = models.OfflineComputedGradeLog(course_id=course_id, seconds=dt, nstudents=len(enrolled_students))
+    ocgl = models.OfflineComputedGradeLog(course_id=course_id, seconds=dt, nstudents=nstudents)
     ocgl.save()
     print ocgl
+    if dt:
+        # students skipped on resuming aren't counted
+        print "Throughput: %.1f students/sec" % (ngraded / dt)
     print "All Done!"
+    return ocgl
 
 
 def offline_grades_available(course_id):
@@ -81,14 +228,15 @@ def offline_grades_available(course_id):
     return ocgl.latest('created')
 
 
-def student_grades(student, request, course, keep_raw_scores=False, use_offline=False):
+def student_grades(student, request, course, keep_raw_scores=False, use_offline=False, model_data_cache=None):
     '''
     This is the main interface to get grades.  It has the same parameters as grades.grade, as well
     as use_offline.  If use_offline is True then this will look for an offline computed gradeset in the DB.
     '''
 
     if not use_offline:
-        return grades.grade(student, request, course, keep_raw_scores=keep_raw_scores)
+        return grades.cached_grade(student, request, course, keep_raw_scores=keep_raw_scores,
+                                   model_data_cache=model_data_cache)
 
     try:
         ocg = models.OfflineComputedGrade.objects.get(user=student, course_id=course.id)
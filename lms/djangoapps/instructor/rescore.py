@@ -0,0 +1,362 @@
+# ======== Rescoring of capa problems ================================================================================
+#
+# When course staff fix a problem (e.g. a bug in a customresponse check function), the answers students have
+# already submitted need to be graded again.  These routines regrade the stored answers of every student who has
+# checked a problem, and write the new scores back to StudentModule.
+
+import json
+import logging
+import multiprocessing
+import traceback
+
+from collections import namedtuple
+from datetime import datetime
+from itertools import islice
+
+from capa.capa_problem import batch_check_functions
+from courseware.model_data import MultiUserModelDataCache
+from courseware.models import StudentModule, StudentModuleHistory, StudentGradeSummary, ProblemRescore
+from courseware.module_render import get_module_for_descriptor
+from django.db import connection, transaction
+from django.db.models import F
+from instructor.offline_gradecalc import DummyRequest
+from xmodule.modulestore import Location
+from xmodule.modulestore.django import modulestore
+
+log = logging.getLogger(__name__)
+
+RescoreResult = namedtuple('RescoreResult', 'attempted updated skipped failed')
+
+# The most StudentModules written by one UPDATE (4 query parameters each)
+UPDATE_BATCH_SIZE = 200
+
+
+class RescoreRequest(DummyRequest):
+    """
+    Stand-in for the request object needed to load modules outside of a web
+    request, for no one in particular, so there is nothing to masquerade as.
+    """
+    user = None
+    session = {}
+
+
+def _rescore_problems(problems):
+    """
+    Regrade the stored answers of each of the LoncapaProblems `problems`,
+    calling each customresponse check function once for all of them.
+
+    Returns a list with the exception regrading each problem raised, or None.
+    """
+    answers_list = [problem.student_answers for problem in problems]
+    try:
+        batch_check_functions(problems, answers_list)
+    except Exception:
+        # each problem will call its check functions on its own
+        log.exception("Couldn't call check functions in a batch")
+
+    errors = []
+    for problem, answers in zip(problems, answers_list):
+        try:
+            problem.grade_answers(answers)
+        except Exception as err:
+            errors.append(err)
+        else:
+            errors.append(None)
+    return errors
+
+
+def _update_student_modules(rescored, modified):
+    """
+    Set the state, grade and max_grade of the StudentModules in rescored (as
+    for save_rescored), in one UPDATE per UPDATE_BATCH_SIZE rows: the new
+    values are picked by id with CASE expressions, which the ORM can't write.
+    """
+    qn = connection.ops.quote_name
+    table = qn(StudentModule._meta.db_table)
+    cursor = connection.cursor()
+    for start in xrange(0, len(rescored), UPDATE_BATCH_SIZE):
+        batch = rescored[start:start + UPDATE_BATCH_SIZE]
+        cases = ' '.join(['WHEN %s THEN %s'] * len(batch))
+        sql = (
+            'UPDATE {table} SET {state} = CASE {id} {cases} END, {grade} = CASE {id} {cases} END, '
+            '{max_grade} = CASE {id} {cases} END, {modified} = %s WHERE {id} IN ({ids})'
+        ).format(
+            table=table, state=qn('state'), grade=qn('grade'), max_grade=qn('max_grade'),
+            modified=qn('modified'), id=qn('id'), cases=cases, ids=', '.join(['%s'] * len(batch)),
+        )
+        params = []
+        for column in (1, 2, 3):
+            for row in batch:
+                params.extend([row[0].pk, row[column]])
+        params.append(connection.ops.value_to_db_datetime(modified))
+        params.extend(row[0].pk for row in batch)
+        cursor.execute(sql, params)
+    transaction.set_dirty()
+
+
+def _lock_unchanged(rescored):
+    """
+    Lock the rows of the StudentModules in rescored (as for save_rescored)
+    until the end of the transaction, and return the entries of rescored
+    whose rows haven't changed since the StudentModules were read: the
+    others (e.g. the student checked the problem again in the meantime) were
+    rescored from stale state, so mustn't be written.
+    """
+    current = dict(
+        (row[0], row[1:])
+        for row in StudentModule.objects.select_for_update().filter(
+            id__in=[student_module.pk for student_module, _, _, _ in rescored]
+        ).values_list('id', 'state', 'grade', 'max_grade')
+    )
+    return [
+        entry for entry in rescored
+        if current.get(entry[0].pk) == (entry[0].state, entry[0].grade, entry[0].max_grade)
+    ]
+
+
+def save_rescored(course_id, rescored, rescore=None, result=None, checkpoint=None):
+    """
+    Write a batch of new scores to StudentModule.
+
+    rescored is a list of (student_module, state, grade, max_grade), where
+    state is the new JSON state of the module.  The rows are updated in bulk
+    (see _update_student_modules) without loading or saving model instances,
+    so the post_save handlers are replaced by a bulk_create of the history
+    entries and a single update marking the students' grade summaries stale.
+    The whole batch is written in one transaction.  Rows that changed after
+    they were read for rescoring are left alone, and counted as skipped (a
+    later rescore picks them up).
+
+    If rescore (a ProblemRescore) is given, the batch's RescoreResult and the
+    id of the last StudentModule it covers are added to its progress in the
+    same transaction, so the checkpoint never runs ahead of the saved scores.
+
+    Returns the batch's RescoreResult, with the rows that had changed moved
+    from updated to skipped.
+    """
+    modified = datetime.now()
+    with transaction.commit_on_success():
+        if rescored:
+            unchanged = _lock_unchanged(rescored)
+            if len(unchanged) < len(rescored):
+                log.info("Skipping %d StudentModules changed while they were rescored",
+                         len(rescored) - len(unchanged))
+            if result is not None:
+                result = result._replace(
+                    updated=result.updated - (len(rescored) - len(unchanged)),
+                    skipped=result.skipped + (len(rescored) - len(unchanged)),
+                )
+            rescored = unchanged
+
+        if rescore is not None:
+            ProblemRescore.objects.filter(pk=rescore.pk).update(
+                attempted=F('attempted') + result.attempted,
+                updated=F('updated') + result.updated,
+                skipped=F('skipped') + result.skipped,
+                failed=F('failed') + result.failed,
+                checkpoint=checkpoint,
+                modified=modified,
+            )
+
+        if not rescored:
+            return result
+
+        _update_student_modules(rescored, modified)
+
+        history = []
+        for student_module, state, grade, max_grade in rescored:
+            if student_module.module_type in StudentModuleHistory.HISTORY_SAVING_TYPES:
+                history.append(StudentModuleHistory(
+                    student_module=student_module,
+                    version=None,
+                    created=modified,
+                    state=state,
+                    grade=grade,
+                    max_grade=max_grade,
+                ))
+        StudentModuleHistory.objects.bulk_create(history)
+
+        StudentGradeSummary.objects.filter(
+            user__in=[student_module.student_id for student_module, _, _, _ in rescored],
+            course_id=course_id,
+        ).update(stale=True)
+    return result
+
+
+def _rescore_chunk(course_id, descriptor, student_module_ids):
+    """
+    Rescore the StudentModules with the given ids, all of which are for
+    `descriptor`.
+
+    Returns a tuple (RescoreResult, rescored) for the chunk, where rescored
+    is the list of changed rows to pass to save_rescored.
+    """
+    student_modules = list(StudentModule.objects.filter(id__in=student_module_ids).select_related('student'))
+    students = [student_module.student for student_module in student_modules]
+    model_data_cache = MultiUserModelDataCache([descriptor], course_id, students)
+    request = RescoreRequest()
+
+    skipped = failed = 0
+    to_rescore = []
+    for student_module in student_modules:
+        try:
+            module = get_module_for_descriptor(
+                student_module.student, request, descriptor,
+                model_data_cache.cache_for_user(student_module.student), course_id,
+                grade_bucket_type='rescore',
+            )
+        except Exception:
+            log.exception("Couldn't load %s for %s", descriptor.location.url(), student_module.student.username)
+            module = None
+        if module is None or not hasattr(module, 'lcp'):
+            failed += 1
+        elif not module.done or not module.lcp.student_answers:
+            # nothing was ever checked, so there is no score to change
+            skipped += 1
+        elif any(hasattr(responder, 'update_score') for responder in module.lcp.responders.values()):
+            # graded by an external grader, which can't be asked again
+            skipped += 1
+        else:
+            to_rescore.append((student_module, module.lcp))
+
+    rescored = []
+    errors = _rescore_problems([problem for _, problem in to_rescore])
+    for (student_module, problem), error in zip(to_rescore, errors):
+        if error is not None:
+            log.warning("Couldn't rescore %s for %s: %s", descriptor.location.url(),
+                        student_module.student.username, error)
+            failed += 1
+            continue
+
+        score = problem.get_score()
+        state = json.loads(student_module.state or '{}')
+        correct_map = problem.correct_map.get_dict()
+        if (state.get('correct_map') == correct_map and
+                student_module.grade == score['score'] and student_module.max_grade == score['total']):
+            continue
+        state['correct_map'] = correct_map
+        rescored.append((student_module, json.dumps(state), score['score'], score['total']))
+
+    return RescoreResult(len(student_modules), len(rescored), skipped, failed), rescored
+
+
+# The problem descriptor loaded once per worker process by _init_worker
+_worker_course_id = None
+_worker_descriptor = None
+
+
+def _init_worker(course_id, location):
+    """
+    Pool initializer: drop the database connection inherited from the parent
+    process (it can't be shared across a fork) and load the problem once.
+    """
+    global _worker_course_id, _worker_descriptor
+    connection.close()
+    _worker_course_id = course_id
+    _worker_descriptor = modulestore().get_instance(course_id, Location(location))
+
+
+def _rescore_worker_chunk(student_module_ids):
+    """
+    Rescore a chunk of StudentModules for the worker's problem.
+
+    Returns a tuple (student_module_ids, result, rescored).
+    """
+    result, rescored = _rescore_chunk(_worker_course_id, _worker_descriptor, student_module_ids)
+    return student_module_ids, result, rescored
+
+
+def _stream_chunks(items, chunk_size):
+    """
+    Yields the values from the iterable items in lists of size chunk_size,
+    without reading all of items first
+    """
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def rescore_problem(course_id, location, chunk_size=100, dry_run=False, processes=1, rescore=None):
+    """
+    Regrade the answers every student has checked for the capa problem at
+    `location` in course `course_id`, and store the new scores.
+
+    The StudentModules are streamed from the database in order of id and
+    rescored in chunks of chunk_size: the check functions of each chunk's
+    customresponses are run in one sandboxed execution per check function,
+    and the changed rows are written in one transaction.  With dry_run,
+    nothing is written.
+
+    processes: number of worker processes to rescore chunks in.  Each worker
+        loads the problem once; the chunks are saved by this process, in
+        order.  With processes=1 everything is done in the current process.
+    rescore: a ProblemRescore to record progress in.  StudentModules up to
+        its checkpoint are skipped, so passing the ProblemRescore of an
+        interrupted run picks up where it left off.  Progress isn't recorded
+        on a dry_run.
+
+    Problems graded by an external grader (e.g. coderesponse) can't be
+    rescored, so those StudentModules are skipped.
+
+    Returns a RescoreResult with the number of StudentModules attempted,
+    updated (whose score or correctness changed), skipped and failed.
+    """
+    descriptor = modulestore().get_instance(course_id, Location(location))
+    if descriptor.location.category != 'problem':
+        raise ValueError("Only capa problems can be rescored, not {0}".format(descriptor.location.url()))
+    location = descriptor.location.url()
+
+    student_modules = StudentModule.objects.filter(course_id=course_id, module_state_key=location)
+    if rescore is not None:
+        student_modules = student_modules.filter(id__gt=rescore.checkpoint)
+    if dry_run:
+        rescore = None
+    if rescore is not None:
+        ProblemRescore.objects.filter(pk=rescore.pk).update(
+            status=ProblemRescore.RUNNING,
+            total=rescore.attempted + student_modules.count(),
+            error=None,
+            modified=datetime.now(),
+        )
+    student_module_ids = student_modules.order_by('id').values_list('id', flat=True).iterator()
+    student_module_chunks = _stream_chunks(student_module_ids, chunk_size)
+
+    if processes > 1:
+        # Don't hand the parent's DB connection to the forked workers
+        connection.close()
+        pool = multiprocessing.Pool(processes, initializer=_init_worker, initargs=(course_id, location))
+        # imap, not imap_unordered: chunks must be saved in order of id for the checkpoint to hold
+        results = pool.imap(_rescore_worker_chunk, student_module_chunks)
+    else:
+        pool = None
+        results = ((chunk,) + _rescore_chunk(course_id, descriptor, chunk) for chunk in student_module_chunks)
+
+    total = RescoreResult(0, 0, 0, 0)
+    try:
+        for chunk, result, rescored in results:
+            if not dry_run:
+                result = save_rescored(course_id, rescored, rescore, result, chunk[-1])
+            total = RescoreResult(*[a + b for a, b in zip(total, result)])
+            log.info("Rescoring %s: %d attempted, %d updated, %d skipped, %d failed", location, *total)
+    except:
+        # don't wait for the workers to rescore the chunks still queued
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+            pool = None
+        if rescore is not None:
+            ProblemRescore.objects.filter(pk=rescore.pk).update(
+                status=ProblemRescore.FAILED, error=traceback.format_exc(), modified=datetime.now()
+            )
+        raise
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    if rescore is not None:
+        ProblemRescore.objects.filter(pk=rescore.pk).update(status=ProblemRescore.DONE, modified=datetime.now())
+    return total
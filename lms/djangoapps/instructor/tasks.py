@@ -0,0 +1,38 @@
+"""
+Django Celery tasks for the instructor app
+"""
+import multiprocessing
+
+from django.conf import settings
+from djcelery import celery
+
+from courseware.models import ProblemRescore
+from instructor.rescore import rescore_problem
+
+
+@celery.task
+def rescore_problem_task(rescore_id):
+    """
+    Rescore every student's answers to a problem, as requested from the
+    instructor dashboard by creating the ProblemRescore with id rescore_id.
+
+    Progress is recorded in the ProblemRescore as the run goes.  If the task
+    is run again for the same ProblemRescore (e.g. after the worker died), it
+    resumes from the last saved chunk.
+    """
+    rescore = ProblemRescore.objects.get(pk=rescore_id)
+    if rescore.status == ProblemRescore.DONE:
+        return
+
+    processes = settings.RESCORE_PROCESSES
+    if multiprocessing.current_process().daemon:
+        # celery's prefork workers are daemonic, and can't start processes of their own
+        processes = 1
+
+    rescore_problem(
+        rescore.course_id,
+        rescore.module_state_key,
+        chunk_size=settings.RESCORE_CHUNK_SIZE,
+        processes=processes,
+        rescore=rescore,
+    )
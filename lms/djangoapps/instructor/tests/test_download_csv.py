@@ -76,3 +76,15 @@ class TestInstructorDashboardGradeDownloadCSV(LoginEnrollmentTestCase):
 '''
 
         self.assertEqual(body, expected_body, msg)
+
+    def test_download_answer_distributions_csv(self):
+        course = self.toy
+        url = reverse('instructor_dashboard', kwargs={'course_id': course.id})
+        response = self.client.post(url, {'action': 'Download CSV of answer distributions'})
+
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        cdisp = response['Content-Disposition']
+        self.assertEqual(cdisp, 'attachment; filename=answer_dist_{0}.csv'.format(course.id))
+
+        body = response.content.replace('\r', '')
+        self.assertEqual(body, '"url_name","display name","answer id","answer","count"\n')
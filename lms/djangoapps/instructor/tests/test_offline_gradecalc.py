@@ -0,0 +1,84 @@
+"""
+Tests of the batch offline grade calculation
+"""
+import json
+import os
+import tempfile
+
+from django.test import TestCase
+from mock import Mock, patch
+
+from courseware.models import OfflineComputedGrade, OfflineComputedGradeLog
+from instructor import offline_gradecalc
+from student.tests.factories import UserFactory, CourseEnrollmentFactory
+
+COURSE_ID = 'edX/test/2013_Spring'
+
+
+def fake_grade(student, request, course, keep_raw_scores=False, model_data_cache=None):
+    """Stand-in for grades.grade that encodes the student in the result"""
+    return {'percent': student.id / 100.0, 'grade': None}
+
+
+def fake_course(course_id):
+    """Stand-in for get_course_by_id for a course with nothing to grade"""
+    return Mock(id=course_id, grading_context={'all_descriptors': [], 'graded_sections': {}})
+
+
+@patch('instructor.offline_gradecalc.get_course_by_id', fake_course)
+@patch('instructor.offline_gradecalc.grades.grade', fake_grade)
+class TestOfflineGradeCalculation(TestCase):
+
+    def setUp(self):
+        self.users = [UserFactory.create(username='robot%d' % i) for i in xrange(5)]
+        for user in self.users:
+            CourseEnrollmentFactory.create(user=user, course_id=COURSE_ID)
+
+    def test_grades_every_student(self):
+        offline_gradecalc.offline_grade_calculation(COURSE_ID, chunk_size=2)
+        for user in self.users:
+            gradeset = json.loads(OfflineComputedGrade.objects.get(user=user, course_id=COURSE_ID).gradeset)
+            self.assertEqual(user.id / 100.0, gradeset['percent'])
+        self.assertEqual(5, OfflineComputedGradeLog.objects.get(course_id=COURSE_ID).nstudents)
+
+    def test_save_gradesets_updates_existing(self):
+        user = self.users[0]
+        OfflineComputedGrade.objects.create(user=user, course_id=COURSE_ID, gradeset='{}')
+        offline_gradecalc.save_gradesets(COURSE_ID, [(user.id, '{"percent": 1}'), (self.users[1].id, '{}')])
+
+        self.assertEqual(1, OfflineComputedGrade.objects.filter(user=user, course_id=COURSE_ID).count())
+        self.assertEqual('{"percent": 1}', OfflineComputedGrade.objects.get(user=user, course_id=COURSE_ID).gradeset)
+        self.assertTrue(OfflineComputedGrade.objects.filter(user=self.users[1], course_id=COURSE_ID).exists())
+
+    def test_save_gradesets_in_bulk(self):
+        for user in self.users[:4]:
+            OfflineComputedGrade.objects.create(user=user, course_id=COURSE_ID, gradeset='{}')
+
+        # find and delete the existing rows, insert them all
+        with self.assertNumQueries(3):
+            offline_gradecalc.save_gradesets(COURSE_ID, [(user.id, '{"percent": 1}') for user in self.users])
+        self.assertEqual(5, OfflineComputedGrade.objects.filter(course_id=COURSE_ID, gradeset='{"percent": 1}').count())
+
+    @patch('instructor.offline_gradecalc.save_gradesets', Mock(side_effect=RuntimeError('boom')))
+    @patch('instructor.offline_gradecalc.connection', Mock())
+    def test_pool_terminated_on_error(self):
+        pool = Mock()
+        pool.imap_unordered.return_value = iter([([self.users[0].id], [])])
+        with patch('instructor.offline_gradecalc.multiprocessing.Pool', return_value=pool):
+            with self.assertRaises(RuntimeError):
+                offline_gradecalc.offline_grade_calculation(COURSE_ID, processes=2)
+        self.assertTrue(pool.terminate.called)
+        self.assertFalse(pool.close.called)
+
+    def test_resume_from_checkpoint(self):
+        fd, checkpoint_file = tempfile.mkstemp()
+        os.close(fd)
+        done = [user.id for user in self.users[:3]]
+        with open(checkpoint_file, 'w') as checkpoint:
+            json.dump({'course_id': COURSE_ID, 'done': done}, checkpoint)
+
+        offline_gradecalc.offline_grade_calculation(COURSE_ID, chunk_size=2, checkpoint_file=checkpoint_file)
+
+        graded = set(OfflineComputedGrade.objects.filter(course_id=COURSE_ID).values_list('user_id', flat=True))
+        self.assertEqual(set(user.id for user in self.users[3:]), graded)
+        self.assertFalse(os.path.exists(checkpoint_file))
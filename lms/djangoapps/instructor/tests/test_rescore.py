@@ -0,0 +1,219 @@
+"""
+Tests of rescoring capa problems
+"""
+import json
+import textwrap
+
+from django.core.urlresolvers import reverse
+from django.test.utils import override_settings
+from mock import patch
+
+from capa import safe_exec
+from capa.tests.response_xml_factory import CustomResponseXMLFactory
+from courseware.models import StudentModule, StudentModuleHistory, StudentGradeSummary, ProblemRescore
+from courseware.tests.factories import StudentModuleFactory
+from courseware.tests.tests import TEST_DATA_MONGO_MODULESTORE
+import instructor.rescore
+from instructor.rescore import rescore_problem, RescoreResult
+from instructor.tasks import rescore_problem_task
+from student.tests.factories import UserFactory, CourseEnrollmentFactory, AdminFactory
+from xmodule.modulestore import Location
+from xmodule.modulestore.django import modulestore
+from xmodule.modulestore.tests.django_utils import ModuleStoreTestCase
+from xmodule.modulestore.tests.factories import CourseFactory, ItemFactory
+
+# The fixed check function: answers of 42 used to be marked incorrect
+CHECK_FUNCTION = textwrap.dedent("""
+    def check_func(expect, answer_given):
+        return answer_given == expect
+    """)
+
+
+@override_settings(MODULESTORE=TEST_DATA_MONGO_MODULESTORE)
+class TestRescoreProblem(ModuleStoreTestCase):
+
+    def setUp(self):
+        modulestore().request_cache = modulestore().metadata_inheritance_cache_subsystem = None
+
+        self.course = CourseFactory.create()
+        self.problem = ItemFactory.create(
+            parent_location=self.course.location,
+            template="i4x://edx/templates/problem/Blank_Common_Problem",
+            data=CustomResponseXMLFactory().build_xml(script=CHECK_FUNCTION, cfn="check_func", expect="42"),
+        )
+        self.location = Location(self.problem.location).url()
+        self.answer_id = Location(self.problem.location).html_id() + '_2_1'
+
+    def make_student_module(self, answer, done=True):
+        """
+        Create a StudentModule for a new student who answered `answer`, and
+        was marked incorrect for it
+        """
+        user = UserFactory.create()
+        CourseEnrollmentFactory.create(user=user, course_id=self.course.id)
+        state = {
+            'seed': 1,
+            'done': done,
+            'student_answers': {self.answer_id: answer},
+            'correct_map': {self.answer_id: {'correctness': 'incorrect', 'npoints': None, 'msg': '',
+                                             'hint': '', 'hintmode': None, 'queuestate': None}},
+        }
+        return StudentModuleFactory.create(
+            student=user,
+            course_id=self.course.id,
+            module_state_key=self.location,
+            state=json.dumps(state),
+            grade=0,
+            max_grade=1,
+        )
+
+    def test_rescore(self):
+        right = self.make_student_module('42')
+        wrong = self.make_student_module('0')
+        unchecked = self.make_student_module('42', done=False)
+        StudentGradeSummary.objects.create(user=right.student, course_id=self.course.id, stale=False)
+
+        result = rescore_problem(self.course.id, self.location)
+        self.assertEqual(result, RescoreResult(attempted=3, updated=1, skipped=1, failed=0))
+
+        right = StudentModule.objects.get(pk=right.pk)
+        self.assertEqual(right.grade, 1)
+        self.assertEqual(json.loads(right.state)['correct_map'][self.answer_id]['correctness'], 'correct')
+        self.assertEqual(StudentModuleHistory.objects.filter(student_module=right).count(), 1)
+        self.assertTrue(StudentGradeSummary.objects.get(user=right.student, course_id=self.course.id).stale)
+
+        for student_module in (wrong, unchecked):
+            self.assertEqual(StudentModule.objects.get(pk=student_module.pk).state, student_module.state)
+
+    def test_dry_run(self):
+        right = self.make_student_module('42')
+        result = rescore_problem(self.course.id, self.location, dry_run=True)
+        self.assertEqual(result.updated, 1)
+        self.assertEqual(StudentModule.objects.get(pk=right.pk).grade, 0)
+
+    def test_check_function_runs_once_per_chunk(self):
+        for _ in xrange(5):
+            self.make_student_module('42')
+
+        with patch('capa.responsetypes.safe_exec.safe_exec', wraps=safe_exec.safe_exec) as mock_exec:
+            result = rescore_problem(self.course.id, self.location, chunk_size=3)
+        self.assertEqual(result.updated, 5)
+        self.assertEqual(mock_exec.call_count, 2)
+
+    def test_update_batches(self):
+        student_modules = [self.make_student_module('42') for _ in xrange(5)]
+        with patch('instructor.rescore.UPDATE_BATCH_SIZE', 2):
+            result = rescore_problem(self.course.id, self.location)
+        self.assertEqual(result.updated, 5)
+        for student_module in student_modules:
+            student_module = StudentModule.objects.get(pk=student_module.pk)
+            self.assertEqual((student_module.grade, student_module.max_grade), (1, 1))
+            self.assertEqual(json.loads(student_module.state)['correct_map'][self.answer_id]['correctness'],
+                             'correct')
+
+    def test_changed_while_rescored(self):
+        changed = self.make_student_module('42')
+        unchanged = self.make_student_module('42')
+        new_state = json.dumps(dict(json.loads(changed.state), student_answers={self.answer_id: '0'}))
+
+        def rescore_chunk(*args):
+            """Rescore the chunk, then have the student answer again before it's saved"""
+            chunk_result = real_rescore_chunk(*args)
+            StudentModule.objects.filter(pk=changed.pk).update(state=new_state)
+            return chunk_result
+
+        real_rescore_chunk = instructor.rescore._rescore_chunk
+        with patch('instructor.rescore._rescore_chunk', side_effect=rescore_chunk):
+            result = rescore_problem(self.course.id, self.location)
+        self.assertEqual(result, RescoreResult(attempted=2, updated=1, skipped=1, failed=0))
+
+        # the student's new answer isn't overwritten with the stale state
+        changed = StudentModule.objects.get(pk=changed.pk)
+        self.assertEqual((changed.state, changed.grade), (new_state, 0))
+        self.assertFalse(StudentModuleHistory.objects.filter(student_module=changed).exists())
+        self.assertEqual(StudentModule.objects.get(pk=unchanged.pk).grade, 1)
+
+    def test_task_in_daemon_process(self):
+        self.make_student_module('42')
+        rescore = ProblemRescore.objects.create(course_id=self.course.id, module_state_key=self.location)
+        with override_settings(RESCORE_PROCESSES=4):
+            with patch('instructor.tasks.multiprocessing.current_process') as current_process:
+                current_process.return_value.daemon = True
+                with patch('instructor.tasks.rescore_problem') as mock_rescore:
+                    rescore_problem_task(rescore.id)
+        self.assertEqual(mock_rescore.call_args[1]['processes'], 1)
+
+    def test_not_a_problem(self):
+        with self.assertRaises(ValueError):
+            rescore_problem(self.course.id, Location(self.course.location).url())
+
+    def test_progress(self):
+        for _ in xrange(3):
+            self.make_student_module('42')
+        last = self.make_student_module('0')
+        rescore = ProblemRescore.objects.create(course_id=self.course.id, module_state_key=self.location)
+
+        rescore_problem(self.course.id, self.location, chunk_size=2, rescore=rescore)
+        rescore = ProblemRescore.objects.get(pk=rescore.pk)
+        self.assertEqual(rescore.status, ProblemRescore.DONE)
+        self.assertEqual((rescore.total, rescore.attempted, rescore.updated, rescore.skipped, rescore.failed),
+                         (4, 4, 3, 0, 0))
+        self.assertEqual(rescore.checkpoint, last.pk)
+
+    def test_resume_from_checkpoint(self):
+        done = [self.make_student_module('42') for _ in xrange(2)]
+        left = [self.make_student_module('42') for _ in xrange(2)]
+        rescore = ProblemRescore.objects.create(course_id=self.course.id, module_state_key=self.location,
+                                                attempted=2, updated=2, checkpoint=done[-1].pk)
+
+        result = rescore_problem(self.course.id, self.location, rescore=rescore)
+        self.assertEqual(result.attempted, 2)
+        for student_module in done:
+            self.assertEqual(StudentModule.objects.get(pk=student_module.pk).grade, 0)
+        for student_module in left:
+            self.assertEqual(StudentModule.objects.get(pk=student_module.pk).grade, 1)
+
+        rescore = ProblemRescore.objects.get(pk=rescore.pk)
+        self.assertEqual((rescore.total, rescore.attempted, rescore.updated), (4, 4, 4))
+        self.assertEqual(rescore.checkpoint, left[-1].pk)
+
+    def test_failure_keeps_checkpoint(self):
+        student_modules = [self.make_student_module('42') for _ in xrange(3)]
+        rescore = ProblemRescore.objects.create(course_id=self.course.id, module_state_key=self.location)
+
+        with patch('instructor.rescore._rescore_problems', side_effect=[[None], RuntimeError('boom')]):
+            with self.assertRaises(RuntimeError):
+                rescore_problem(self.course.id, self.location, chunk_size=1, rescore=rescore)
+
+        rescore = ProblemRescore.objects.get(pk=rescore.pk)
+        self.assertEqual(rescore.status, ProblemRescore.FAILED)
+        self.assertIn('boom', rescore.error)
+        self.assertEqual(rescore.checkpoint, student_modules[0].pk)
+
+    def test_dashboard_rescore(self):
+        self.make_student_module('42')
+        instructor = AdminFactory.create()
+        self.client.login(username=instructor.username, password='test')
+
+        response = self.client.post(reverse('instructor_dashboard', kwargs={'course_id': self.course.id}), {
+            'action': 'Rescore problem for all students',
+            'problem_to_rescore': Location(self.problem.location).name,
+        })
+        self.assertEqual(response.status_code, 200)
+
+        # Celery runs the task right away in tests
+        rescore = ProblemRescore.objects.get(course_id=self.course.id)
+        self.assertEqual(rescore.requested_by, instructor)
+        self.assertEqual(rescore.status, ProblemRescore.DONE)
+
+        response = self.client.get(reverse('rescore_progress', kwargs={'course_id': self.course.id}))
+        progress = json.loads(response.content)['rescores']
+        self.assertEqual(len(progress), 1)
+        self.assertEqual(progress[0]['location'], self.location)
+        self.assertEqual((progress[0]['attempted'], progress[0]['updated']), (1, 1))
+
+    def test_progress_requires_staff(self):
+        user = UserFactory.create()
+        self.client.login(username=user.username, password='test')
+        response = self.client.get(reverse('rescore_progress', kwargs={'course_id': self.course.id}))
+        self.assertEqual(response.status_code, 404)
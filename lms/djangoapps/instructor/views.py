@@ -3,6 +3,7 @@ Instructor Views
 """
 from collections import defaultdict
 import csv
+import itertools
 import json
 import logging
 import os
@@ -26,7 +27,7 @@ from courseware import grades
 from courseware.access import (has_access, get_access_group_name,
                                course_beta_test_group_name)
 from courseware.courses import get_course_with_access
-from courseware.models import StudentModule
+from courseware.models import StudentModule, ProblemRescore
 from django_comment_common.models import (Role,
                                           FORUM_ROLE_ADMINISTRATOR,
                                           FORUM_ROLE_MODERATOR,
@@ -34,11 +35,13 @@ from django_comment_common.models import (Role,
 from django_comment_client.utils import has_forum_access
 from psychometrics import psychoanalyze
 from student.models import CourseEnrollment, CourseEnrollmentAllowed
+from xmodule.modulestore import Location
 from xmodule.modulestore.django import modulestore
 import xmodule.graders as xmgraders
 import track.views
 
 from .offline_gradecalc import student_grades, offline_grades_available
+from .tasks import rescore_problem_task
 
 log = logging.getLogger(__name__)
 
@@ -202,7 +205,11 @@ def instructor_dashboard(request, course_id):
 
     elif 'Download CSV of answer distributions' in action:
         track.views.server_track(request, 'dump-answer-dist-csv', {}, page='idashboard')
-        return return_csv('answer_dist_{0}.csv'.format(course_id), get_answers_distribution(request, course_id))
+        datatable = get_answers_distribution(request, course_id)
+        # The distribution is computed one problem at a time as the CSV is written out
+        response = HttpResponse(stream_csv(datatable['header'], datatable['data']), mimetype='text/csv')
+        response['Content-Disposition'] = 'attachment; filename={0}'.format('answer_dist_{0}.csv'.format(course_id))
+        return response
 
     elif 'Dump description of graded assignments configuration' in action:
         track.views.server_track(request, action, {}, page='idashboard')
@@ -273,6 +280,29 @@ def instructor_dashboard(request, course_id):
                 msg += "<font color='red'>Couldn't reset module state.  </font>"
 
 
+    elif "Rescore problem for all students" in action and instructor_access:
+        problem_to_rescore = request.POST.get('problem_to_rescore', '')
+        if problem_to_rescore[-4:] == ".xml":
+            problem_to_rescore = problem_to_rescore[:-4]
+        (org, course_name, _) = course_id.split("/")
+        module_state_key = "i4x://" + org + "/" + course_name + "/problem/" + problem_to_rescore
+        try:
+            modulestore().get_instance(course_id, Location(module_state_key))
+        except Exception:
+            msg += "<font color='red'>Couldn't find problem with that urlname.  </font>"
+        else:
+            rescore = ProblemRescore.objects.create(course_id=course_id, module_state_key=module_state_key,
+                                                    requested_by=request.user)
+            track.views.server_track(request,
+                                    '{instructor} requested rescoring of problem {problem} in {course}'.format(
+                                        instructor=request.user,
+                                        problem=module_state_key,
+                                        course=course_id),
+                                    {},
+                                    page='idashboard')
+            rescore_problem_task.delay(rescore.id)
+            msg += "<font color='green'>Rescoring of %s started; its progress is shown below.</font>" % module_state_key
+
     elif "Get link to student's progress page" in action:
         unique_student_identifier = request.POST.get('unique_student_identifier', '')
         try:
@@ -668,6 +698,7 @@ def instructor_dashboard(request, course_id):
                'mitx_version': getattr(settings, 'MITX_VERSION_STRING', ''),
                'offline_grade_log': offline_grades_available(course_id),
                'cohorts_ajax_url': reverse('cohorts', kwargs={'course_id': course_id}),
+               'rescore_progress_url': reverse('rescore_progress', kwargs={'course_id': course_id}),
 
                'analytics_results': analytics_results,
             }
@@ -914,7 +945,19 @@ def get_student_grade_summary_data(request, course, course_id, get_grades=True,
     datatable = {'header': header, 'assignments': assignments, 'students': enrolled_students}
     data = []
 
-    for student in enrolled_students:
+    if get_grades and not use_offline:
+        # Read stored grades, and grade the students without them a block of students at a time
+        student_gradesets = grades.iter_cached_grades(enrolled_students, request, course,
+                                                      keep_raw_scores=get_raw_scores)
+    elif get_grades:
+        student_gradesets = (
+            (student, student_grades(student, request, course, keep_raw_scores=get_raw_scores, use_offline=True))
+            for student in enrolled_students
+        )
+    else:
+        student_gradesets = ((student, None) for student in enrolled_students)
+
+    for student, gradeset in student_gradesets:
         datarow = [student.id, student.username, student.profile.name, student.email]
         try:
             datarow.append(student.externalauthmap.external_email)
@@ -922,7 +965,6 @@ def get_student_grade_summary_data(request, course, course_id, get_grades=True,
             datarow.append('')
 
         if get_grades:
-            gradeset = student_grades(student, request, course, keep_raw_scores=get_raw_scores, use_offline=use_offline)
             log.debug('student={0}, gradeset={1}'.format(student, gradeset))
             if get_raw_scores:
                 # TODO (ichuang) encode Score as dict instead of as list, so score[0] -> score['earned']
@@ -956,10 +998,10 @@ def gradebook(request, course_id):
     student_info = [{'username': student.username,
                      'id': student.id,
                      'email': student.email,
-                     'grade_summary': student_grades(student, request, course),
+                     'grade_summary': grade_summary,
                      'realname': student.profile.name,
                      }
-                     for student in enrolled_students]
+                     for student, grade_summary in grades.iter_cached_grades(enrolled_students, request, course)]
 
     return render_to_response('courseware/gradebook.html', {
         'students': student_info,
@@ -971,6 +1013,19 @@ def gradebook(request, course_id):
     })
 
 
+@cache_control(no_cache=True, no_store=True, must_revalidate=True)
+def rescore_progress(request, course_id):
+    """
+    Return JSON with the progress of the course's most recent problem
+    rescores, polled by the instructor dashboard.
+    """
+    get_course_with_access(request.user, course_id, 'staff')
+
+    rescores = ProblemRescore.objects.filter(course_id=course_id)[:10]
+    return HttpResponse(json.dumps({'rescores': [rescore.progress() for rescore in rescores]}),
+                        mimetype='application/json')
+
+
 @cache_control(no_cache=True, no_store=True, must_revalidate=True)
 def grade_summary(request, course_id):
     """Display the grade summary for a course."""
@@ -1086,21 +1141,36 @@ def get_answers_distribution(request, course_id):
 
     Return a dict with two keys:
     'header': a header row
-    'data': a list of rows
+    'data': an iterator over the rows
     """
     course = get_course_with_access(request.user, course_id, 'staff')
 
-    dist = grades.answer_distributions(request, course)
+    dist = grades.iter_answer_distributions(course)
 
     d = {}
     d['header'] = ['url_name', 'display name', 'answer id', 'answer', 'count']
 
-    d['data'] = [[url_name, display_name, answer_id, a, answers[a]]
-                 for (url_name, display_name, answer_id), answers in dist.items()
-                 for a in answers]
+    # A generator, so that the rows can be written out as they are computed
+    d['data'] = ([url_name, display_name, answer_id, a, answers[a]]
+                 for (url_name, display_name, answer_id), answers in dist
+                 for a in answers)
     return d
 
 
+def stream_csv(header, rows):
+    """
+    Yields the lines of a CSV file with the given header and rows, encoding
+    each row as it is written, for use as the content of a streamed HttpResponse.
+    """
+    buf = StringIO()
+    writer = csv.writer(buf, dialect='excel', quotechar='"', quoting=csv.QUOTE_ALL)
+    for row in itertools.chain([header], rows):
+        writer.writerow([unicode(s).encode('utf-8') for s in row])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+
 #-----------------------------------------------------------------------------
 
 
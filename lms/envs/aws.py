@@ -157,6 +157,10 @@ VIRTUAL_UNIVERSITIES = ENV_TOKENS.get('VIRTUAL_UNIVERSITIES', [])
 META_UNIVERSITIES = ENV_TOKENS.get('META_UNIVERSITIES', {})
 COMMENTS_SERVICE_URL = ENV_TOKENS.get("COMMENTS_SERVICE_URL", '')
 COMMENTS_SERVICE_KEY = ENV_TOKENS.get("COMMENTS_SERVICE_KEY", '')
+COMMENTS_SERVICE_POOL_SIZE = ENV_TOKENS.get("COMMENTS_SERVICE_POOL_SIZE", 10)
+COMMENTS_SERVICE_CONCURRENCY = ENV_TOKENS.get("COMMENTS_SERVICE_CONCURRENCY", 4)
+COMMENTS_SERVICE_CACHE_TIMEOUT = ENV_TOKENS.get("COMMENTS_SERVICE_CACHE_TIMEOUT", 0)
+TRACKING_SEGMENT_DIR = ENV_TOKENS.get("TRACKING_SEGMENT_DIR", TRACKING_SEGMENT_DIR)
 CERT_QUEUE = ENV_TOKENS.get("CERT_QUEUE", 'test-pull')
 ZENDESK_URL = ENV_TOKENS.get("ZENDESK_URL")
 FEEDBACK_SUBMISSION_EMAIL = ENV_TOKENS.get("FEEDBACK_SUBMISSION_EMAIL")
@@ -172,6 +176,8 @@ for name, value in ENV_TOKENS.get("CODE_JAIL", {}).items():
 
 COURSES_WITH_UNSAFE_CODE = ENV_TOKENS.get("COURSES_WITH_UNSAFE_CODE", [])
 
+XQUEUE_CLIENT.update(ENV_TOKENS.get("XQUEUE_CLIENT", {}))
+
 # If segment.io key specified, load it and turn on segment IO if the feature flag is set
 SEGMENT_IO_LMS_KEY = ENV_TOKENS.get('SEGMENT_IO_LMS_KEY')
 if SEGMENT_IO_LMS_KEY:
@@ -196,6 +202,13 @@ XQUEUE_INTERFACE = AUTH_TOKENS['XQUEUE_INTERFACE']
 # Get the MODULESTORE from auth.json, but if it doesn't exist,
 # use the one from common.py
 MODULESTORE = AUTH_TOKENS.get('MODULESTORE', MODULESTORE)
+
+# Number of descriptors each process keeps in the Mongo modulestore's descriptor cache
+# (0 turns it off). The LMS never writes to descriptors, so it can share them between requests
+DESCRIPTOR_CACHE_SIZE = ENV_TOKENS.get('DESCRIPTOR_CACHE_SIZE', 0)
+for store in MODULESTORE.values():
+    if store['ENGINE'] == 'xmodule.modulestore.mongo.MongoModuleStore' and DESCRIPTOR_CACHE_SIZE:
+        store['OPTIONS']['descriptor_cache_size'] = DESCRIPTOR_CACHE_SIZE
 CONTENTSTORE = AUTH_TOKENS.get('CONTENTSTORE', CONTENTSTORE)
 
 OPEN_ENDED_GRADING_INTERFACE = AUTH_TOKENS.get('OPEN_ENDED_GRADING_INTERFACE',
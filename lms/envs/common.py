@@ -134,6 +134,24 @@ GENERATE_PROFILE_SCORES = False
 # Used with XQueue
 XQUEUE_WAITTIME_BETWEEN_REQUESTS = 5   # seconds
 
+# How submissions are sent to XQueue: number of keep-alive connections per
+# process, submissions sent at once per process, seconds to wait for one of
+# those slots, retries (doubling backoff seconds between them), HTTP timeout
+# and the most seconds a submission's attempts may hold the student's request
+# for in all.  With use_outbox, submissions that can't be delivered are stored
+# in an outbox instead of failing, and students told they are queued: only
+# turn it on where `django-admin.py drain_xqueue_outbox --loop` is running.
+XQUEUE_CLIENT = {
+    'pool_size': 10,
+    'max_in_flight': 10,
+    'acquire_timeout': 0.5,
+    'retries': 2,
+    'backoff': 0.25,
+    'timeout': 10,
+    'send_timeout': 10,
+    'use_outbox': False,
+}
+
 
 ############################# SET PATH INFORMATION #############################
 PROJECT_ROOT = path(__file__).abspath().dirname().dirname()  # /mitx/lms
@@ -229,6 +247,20 @@ DEV_CONTENT = True
 TRACK_MAX_EVENT = 10000
 DEBUG_TRACK_LOG = False
 
+# Tracking events are written out in batches by a background thread (see track.writer)
+TRACKING_WRITER = {
+    'BUFFER_SIZE': 10000,       # events held at most; more are dropped
+    'BATCH_SIZE': 500,          # events written at once
+    'FLUSH_INTERVAL': 1.0,      # seconds an event waits at most before it's written
+    'PUT_TIMEOUT': 0,           # seconds a request waits for room in a full buffer
+    'ASYNC': True,
+}
+
+# Directory to write tracking events to as compressed, time-partitioned
+# segment files (see track.segments), or None not to
+TRACKING_SEGMENT_DIR = None
+TRACKING_SEGMENT_PERIOD = '%Y%m%d%H'    # one segment per hour per process
+
 MITX_ROOT_URL = ''
 
 LOGIN_REDIRECT_URL = MITX_ROOT_URL + '/accounts/login'
@@ -275,6 +307,11 @@ MODULESTORE = {
 }
 CONTENTSTORE = None
 
+# Static content (c4x assets) bigger than this many bytes isn't put in the
+# cache (memcached's items are limited to 1MB), but streamed from the
+# contentstore every time it's requested
+STATIC_CONTENT_MAX_CACHED_SIZE = 1000 * 1000
+
 #################### Python sandbox ############################################
 
 CODE_JAIL = {
@@ -288,6 +325,19 @@ CODE_JAIL = {
         # How many CPU seconds can jailed code use?
         'CPU': 1,
     },
+
+    # Pool of pre-started sandbox processes, see capa.safe_exec.sandbox_pool.
+    'pool': {
+        # How many processes to keep running?  0 disables the pool.
+        'size': 0,
+        # How many executions before a process is replaced?  Code can leave
+        # state behind in a process for the next code run in it: keep this at
+        # 1 unless every course's code is trusted.
+        'max_executions': 1,
+        # How many seconds to wait for an idle process before starting a
+        # sandbox just for one execution?
+        'queue_timeout': 1,
+    },
 }
 
 # Some courses are allowed to run unsafe code. This is a list of regexes, one
@@ -438,6 +488,7 @@ TEMPLATE_LOADERS = (
 MIDDLEWARE_CLASSES = (
     'contentserver.middleware.StaticContentServer',
     'request_cache.middleware.RequestCache',
+    'courseware.access.AccessCacheMiddleware',
     'django_comment_client.middleware.AjaxExceptionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -657,6 +708,13 @@ CELERY_QUEUES = {
     DEFAULT_PRIORITY_QUEUE: {}
 }
 
+# Rescoring of problems requested from the instructor dashboard: number of
+# worker processes each rescore task shards students across (only used where
+# the task doesn't run in a celery prefork worker, which can't start
+# processes), and number of students rescored and saved per batch
+RESCORE_PROCESSES = 1
+RESCORE_CHUNK_SIZE = 100
+
 ################################### APPS ######################################
 INSTALLED_APPS = (
     # Standard ones that are always installed...
@@ -20,6 +20,7 @@ MODULESTORE = {
             'collection': 'modulestore',
             'fs_root': GITHUB_REPO_ROOT,
             'render_template': 'mitxmako.shortcuts.render_to_string',
+            'descriptor_cache_size': 1000,
         }
     }
 }
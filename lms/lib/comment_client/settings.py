@@ -11,3 +11,14 @@ if hasattr(settings, "COMMENTS_SERVICE_KEY"):
     API_KEY = settings.COMMENTS_SERVICE_KEY
 else:
     API_KEY = "PUT_YOUR_API_KEY_HERE"
+
+# Number of keep-alive connections to hold open to the comments service
+POOL_SIZE = getattr(settings, "COMMENTS_SERVICE_POOL_SIZE", 10)
+
+# Number of threads to issue independent requests for a page on.  With 1,
+# they are issued one after another.
+CONCURRENCY = getattr(settings, "COMMENTS_SERVICE_CONCURRENCY", 4)
+
+# Seconds to cache the responses of idempotent GETs (users and thread
+# metadata) for.  0 turns the cache off.
+CACHE_TIMEOUT = getattr(settings, "COMMENTS_SERVICE_CACHE_TIMEOUT", 0)
@@ -78,7 +78,10 @@ class Thread(models.Model):
         # request.
         request_params = strip_none(request_params)
 
-        response = perform_request('get', url, request_params)
+        # Only the thread's own fields can be cached, and only if nobody's
+        # read state is changed by fetching them
+        cached = not request_params.get('recursive') and not (request_params['mark_as_read'] and 'user_id' in request_params)
+        response = perform_request('get', url, request_params, cached=cached)
         self.update_attributes(**response)
 
     def flagAbuse(self, user, voteable):
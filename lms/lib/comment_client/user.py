@@ -77,10 +77,10 @@ class User(models.Model):
 
     def _retrieve(self, *args, **kwargs):
         url = self.url(action='get', params=self.attributes)
-        retrieve_params = self.default_retrieve_params
+        retrieve_params = dict(self.default_retrieve_params)
         if self.attributes.get('course_id'):
             retrieve_params['course_id'] = self.course_id
-        response = perform_request('get', url, retrieve_params)
+        response = perform_request('get', url, retrieve_params, cached=True)
         self.update_attributes(**response)
 
 
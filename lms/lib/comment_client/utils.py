@@ -1,11 +1,39 @@
+from django.core.cache import cache
 from dogapi import dog_stats_api
+from multiprocessing.pool import ThreadPool
+import hashlib
 import json
 import logging
 import requests
 import settings
+import threading
+import urlparse
 
 log = logging.getLogger(__name__)
 
+# Kept-alive connections to the comments service, shared by all requests
+_session = requests.session(config={
+    'keep_alive': True,
+    'pool_connections': 1,
+    'pool_maxsize': settings.POOL_SIZE,
+})
+
+# Threads to issue independent requests on, see perform_concurrently
+_pool = None
+_pool_lock = threading.Lock()
+
+# Top-level collections of the comments service API; any other first path
+# segment is a commentable id
+_COLLECTIONS = ('threads', 'comments', 'users', 'commentables', 'search')
+# Collections whose second path segment is the id of a resource...
+_ID_COLLECTIONS = ('threads', 'comments', 'users')
+# ...unless it is one of these
+_NOT_IDS = ('tags',)
+
+# How long the generation counters behind cache invalidation are kept; must
+# be longer than any CACHE_TIMEOUT
+GENERATION_TIMEOUT = 24 * 60 * 60
+
 
 def strip_none(dic):
     return dict([(k, v) for k, v in dic.iteritems() if v is not None])
@@ -28,16 +56,101 @@ def merge_dict(dic1, dic2):
     return dict(dic1.items() + dic2.items())
 
 
+def _path_segments(url):
+    """
+    The segments of the path of `url` below the API prefix
+    """
+    path = urlparse.urlparse(url).path
+    prefix = urlparse.urlparse(settings.PREFIX).path
+    if path.startswith(prefix):
+        path = path[len(prefix):]
+    return path.strip('/').split('/')
+
+
+def _endpoint(url):
+    """
+    The endpoint `url` is for, with ids replaced by placeholders, e.g.
+    'threads/:id/votes', to tag metrics with
+    """
+    segments = _path_segments(url)
+    if segments[0] not in _COLLECTIONS:
+        segments[0] = ':commentable_id'
+    elif segments[0] in _ID_COLLECTIONS and len(segments) > 1 and segments[1] not in _NOT_IDS:
+        segments[1] = ':id'
+    return '/'.join(segments)
+
+
+def _resource(url):
+    """
+    The thread, comment or user `url` is for or below, e.g. 'threads/<id>',
+    or None
+    """
+    segments = _path_segments(url)
+    if len(segments) > 1 and segments[0] in _ID_COLLECTIONS and segments[1] not in _NOT_IDS:
+        return '/'.join(segments[:2])
+    return None
+
+
+def _generation_key(resource):
+    return 'comment_client.generation.{0}'.format(resource)
+
+
+def _invalidate(resources):
+    """
+    Make the cached GETs of each of `resources` stale, by moving on the
+    generation that is part of their cache keys
+    """
+    for resource in resources:
+        key = _generation_key(resource)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # nothing was cached since the generation expired
+            cache.set(key, 1, GENERATION_TIMEOUT)
+
+
+def _cache_key(url, params):
+    resource = _resource(url)
+    generation = cache.get(_generation_key(resource), 0) if resource else 0
+    key = json.dumps([url, sorted(params.items()), generation])
+    return 'comment_client.get.{0}'.format(hashlib.md5(key).hexdigest())
+
+
 def perform_request(method, url, data_or_params=None, *args, **kwargs):
+    """
+    Call the comments service.
+
+    With cached=True, the response of a GET is read through the cache for
+    settings.CACHE_TIMEOUT seconds.  Only pass it for GETs without side
+    effects.  A post, put or delete to a thread, comment or user, or on
+    behalf of a user, makes the cached GETs of that resource (and user)
+    stale.
+    """
     if data_or_params is None:
         data_or_params = {}
+
+    tags = [u'endpoint:{0}'.format(_endpoint(url)), u'method:{0}'.format(method)]
+    cache_key = None
+    if method == 'get' and kwargs.get('cached') and settings.CACHE_TIMEOUT:
+        cache_key = _cache_key(url, data_or_params)
+        response = cache.get(cache_key)
+        if response is not None:
+            dog_stats_api.increment('comment_client.cache.hit', tags=tags)
+            return response
+        dog_stats_api.increment('comment_client.cache.miss', tags=tags)
+    elif method != 'get' and settings.CACHE_TIMEOUT:
+        resources = set([_resource(url)])
+        if data_or_params.get('user_id'):
+            resources.add('users/{0}'.format(data_or_params['user_id']))
+        _invalidate(resources - set([None]))
+
     data_or_params['api_key'] = settings.API_KEY
     try:
-        with dog_stats_api.timer('comment_client.request.time'):
+        with dog_stats_api.timer('comment_client.request.time', tags=tags):
             if method in ['post', 'put', 'patch']:
-                response = requests.request(method, url, data=data_or_params, timeout=5)
+                response = _session.request(method, url, data=data_or_params, timeout=5)
             else:
-                response = requests.request(method, url, params=data_or_params, timeout=5)
+                response = _session.request(method, url, params=data_or_params, timeout=5)
     except Exception as err:
         # remove API key if it is in the params
         if 'api_key' in data_or_params:
@@ -57,9 +170,39 @@ def perform_request(method, url, data_or_params=None, *args, **kwargs):
         raise CommentClientUnknownError(response.text)
     else:
         if kwargs.get("raw", False):
-            return response.text
+            result = response.text
         else:
-            return json.loads(response.text)
+            result = json.loads(response.text)
+        if cache_key is not None:
+            cache.set(cache_key, result, settings.CACHE_TIMEOUT)
+        return result
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPool(settings.CONCURRENCY)
+        return _pool
+
+
+def perform_concurrently(*calls):
+    """
+    Call each of the callables `calls` at the same time, on a pool of
+    settings.CONCURRENCY threads, and return a list of their results in
+    order.  If any of them raised, the exception of the first to do so (in
+    order) is raised once they have all finished.
+
+    Meant for the independent requests to the comments service needed for a
+    page: the calls must not use the database, or anything else local to
+    the request's thread, and must not call perform_concurrently themselves.
+    """
+    if settings.CONCURRENCY <= 1 or len(calls) <= 1:
+        return [call() for call in calls]
+    results = [_get_pool().apply_async(call) for call in calls]
+    for result in results:
+        result.wait()
+    return [result.get() for result in results]
 
 
 class CommentClientError(Exception):
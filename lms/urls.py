@@ -267,6 +267,8 @@ if settings.COURSEWARE_ENABLED:
             'instructor.views.gradebook', name='gradebook'),
         url(r'^courses/(?P<course_id>[^/]+/[^/]+/[^/]+)/grade_summary$',
             'instructor.views.grade_summary', name='grade_summary'),
+        url(r'^courses/(?P<course_id>[^/]+/[^/]+/[^/]+)/rescore_progress$',
+            'instructor.views.rescore_progress', name='rescore_progress'),
         url(r'^courses/(?P<course_id>[^/]+/[^/]+/[^/]+)/enroll_students$',
             'instructor.views.enroll_students', name='enroll_students'),
         url(r'^courses/(?P<course_id>[^/]+/[^/]+/[^/]+)/staff_grading$',
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+"""
+Compare the time calc.evaluator takes to evaluate an expression with cold
+caches (i.e. parsing the expression every time, as before the grammar and
+expression caches existed) and with warm ones.
+
+Run from the root of the repo, with common/lib/calc installed:
+
+    python scripts/benchmark_calc.py
+"""
+
+import argparse
+import sys
+import timeit
+
+import calc
+
+EXPRESSION = "R1*sin(x)^2 + R2||R3 - 5k/(1+e^(-x))"
+
+
+def evaluate(i):
+    """Evaluate EXPRESSION with different variables, as formularesponse does"""
+    return calc.evaluator({'R1': 1.0 + i, 'R2': 2.0, 'R3': 3.0, 'x': i / 10.0}, {}, EXPRESSION)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the calc caches")
+    parser.add_argument('--iterations', '-n', type=int, default=200, help="Evaluations per timing")
+    parser.add_argument('--repeat', '-r', type=int, default=3, help="Timings to take the best of")
+    args = parser.parse_args(argv)
+
+    def uncached():
+        for i in xrange(args.iterations):
+            calc.grammar_cache.clear()
+            calc.expression_cache.clear()
+            evaluate(i)
+
+    def cached():
+        for i in xrange(args.iterations):
+            evaluate(i)
+
+    uncached_time = min(timeit.repeat(uncached, number=1, repeat=args.repeat))
+    evaluate(0)
+    cached_time = min(timeit.repeat(cached, number=1, repeat=args.repeat))
+
+    print "{0} evaluations: {1:.4f}s uncached, {2:.4f}s cached ({3:.0f}x)".format(
+        args.iterations, uncached_time, cached_time, uncached_time / cached_time)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+"""
+Compare the time path_to_location takes to find paths to the problems of a
+course of 5,111 blocks by scanning the children of every item (as a query on
+'definition.children' does) and by looking up parents in a ParentIndex.
+
+Run from the root of the repo, with common/lib/xmodule installed:
+
+    python scripts/benchmark_parent_index.py
+"""
+
+import argparse
+import sys
+import timeit
+
+from xmodule.course_module import CourseDescriptor
+from xmodule.modulestore import Location
+from xmodule.modulestore.parent_index import ParentIndex
+from xmodule.modulestore.search import path_to_location
+from xmodule.modulestore.tests.test_parent_index import course_structure, FakeModuleStore
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the parent index")
+    parser.add_argument('--paths', '-n', type=int, default=50, help="Number of paths to find per timing")
+    parser.add_argument('--repeat', '-r', type=int, default=3, help="Timings to take the best of")
+    args = parser.parse_args(argv)
+
+    # 1 course, 10 chapters, 100 sequentials, 1000 verticals, 4000 problems
+    structure = course_structure([10, 10, 10, 4])
+    course_id = CourseDescriptor.location_to_id(Location('i4x://edX/bench/course/2013'))
+    problems = [location for location in sorted(structure) if location.category == 'problem'][:args.paths]
+
+    def find_paths(store):
+        return [path_to_location(store, course_id, problem) for problem in problems]
+
+    scanning = FakeModuleStore(structure, indexed=False)
+    indexed = FakeModuleStore(structure, indexed=True)
+
+    scan_time = min(timeit.repeat(lambda: find_paths(scanning), number=1, repeat=args.repeat))
+    build_time = min(timeit.repeat(lambda: ParentIndex(1, structure), number=1, repeat=args.repeat))
+    index_time = min(timeit.repeat(lambda: find_paths(indexed), number=1, repeat=args.repeat))
+
+    print "{0} paths in a course of {1} blocks: {2:.4f}s scanning, {3:.4f}s indexed (+{4:.4f}s to build) ({5:.1f}x)".format(
+        len(problems), len(structure), scan_time, index_time, build_time, scan_time / index_time)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
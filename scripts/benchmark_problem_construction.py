@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+Time constructing LoncapaProblems for a large problem set, and the part of
+that spent parsing the problems and the files they include (the most that
+caching the parsed problems across constructions could save).
+
+Run from the root of the repo, with common/lib/capa installed:
+
+    python scripts/benchmark_problem_construction.py
+"""
+
+import argparse
+import shutil
+import sys
+import tempfile
+import timeit
+
+import fs.osfs
+from lxml import etree
+
+from capa.capa_problem import LoncapaProblem
+from capa.tests import test_system
+
+RESPONSE_XML = """
+<p>startouttext/ Question {0}: what is {0} + {0}? endouttext/</p>
+<numericalresponse answer="{1}">
+    <responseparam type="tolerance" default="0.1%"/>
+    <textline size="10"/>
+</numericalresponse>
+<solution><p>It is {1}.</p></solution>
+"""
+
+
+def problem_xml(responses):
+    """Return the xml of a problem with the given number of responses, and an include"""
+    return "<problem>{0}<include file=\"included.xml\"/></problem>".format(
+        "".join(RESPONSE_XML.format(i, 2 * i) for i in xrange(responses)))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark LoncapaProblem construction")
+    parser.add_argument('--problems', '-p', type=int, default=20, help="Problems in the problem set")
+    parser.add_argument('--responses', type=int, default=50, help="Responses per problem")
+    parser.add_argument('--repeat', '-r', type=int, default=3, help="Timings to take the best of")
+    args = parser.parse_args(argv)
+
+    data_dir = tempfile.mkdtemp()
+    try:
+        with open("{0}/included.xml".format(data_dir), "w") as included:
+            included.write("<div>{0}</div>".format(RESPONSE_XML.format(0, 0)))
+
+        system = test_system()
+        system.filestore = fs.osfs.OSFS(data_dir)
+        problems = [problem_xml(args.responses) for _ in xrange(args.problems)]
+
+        def construct():
+            for i, xml in enumerate(problems):
+                LoncapaProblem(xml, id='problem{0}'.format(i), seed=i, system=system)
+
+        def parse():
+            for xml in problems:
+                etree.XML(xml)
+                etree.XML(system.filestore.open("included.xml").read())
+
+        construct_time = min(timeit.repeat(construct, number=1, repeat=args.repeat))
+        parse_time = min(timeit.repeat(parse, number=1, repeat=args.repeat))
+    finally:
+        shutil.rmtree(data_dir)
+
+    print "{0} problems with {1} responses: {2:.4f}s to construct, of which {3:.4f}s parsing ({4:.0%})".format(
+        args.problems, args.responses, construct_time, parse_time, parse_time / construct_time)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])